@@ -1,15 +1,45 @@
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, g, Response
 from database import db, Patient, Hospital, User, UserRole, Encounter, Observation, Prescription
-from cluster import raft
-from encryption import Encryptor, hash_password
+from cluster import raft, raft_groups
+from raftlog import SqlLog
+from snapshot import SnapshotStore
+from encryption import Encryptor, BlindIndexer, PasswordHasher, HasherBusy
+from auth import SessionTokens, require_session
 import uuid
 import requests
-from replicate import handle_write_request, broadcast_replication
+from replicate import (handle_write_request, handle_read_request, broadcast_replication, forwarder,
+                       current_group, NEW_PARTITION, ReplicationError)
+from partition import partitioned, group_of_id, mint_uuid, ids
+from pagination import keyset_page, page_response, wants_all
+from ingest import iter_records, batched, ndjson_response
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError, StatementError
+from sqlalchemy.orm import selectinload
+from datetime import datetime, timezone
+import vitals
+from cache import cached, response_cache
+from rpc import RpcServer, RpcTransport
+from projection import requested_fields, load_fields, project
+import metrics
+import time
+import os
 
 app = Flask(__name__)
 app.config.from_object('config.Config')
 db.init_app(app)
-encryptor = Encryptor(app.config["ENCRYPTION_KEY"])
+encryptor = Encryptor(
+    app.config["ENCRYPTION_KEY"],
+    workers=app.config["DECRYPT_WORKERS"],
+    batch_min=app.config["DECRYPT_BATCH_MIN"]
+)
+blind_indexer = BlindIndexer(app.config["BLIND_INDEX_KEY"])
+password_hasher = PasswordHasher(
+    workers=app.config["PASSWORD_HASH_WORKERS"],
+    max_pending=app.config["PASSWORD_HASH_MAX_PENDING"],
+    slot_timeout=app.config["PASSWORD_HASH_WAIT"]
+)
+session_tokens = SessionTokens(app.config["SECRET_KEY"], app.config["SESSION_TTL"])
+response_cache.configure(app.config["RESPONSE_CACHE_BYTES"])
 
 # EHR API ENDPOINTS
 # HOSPITAL
@@ -18,16 +48,12 @@ encryptor = Encryptor(app.config["ENCRYPTION_KEY"])
 @handle_write_request
 def create_hospital():
     data = request.json
+    require_fields(data, ("name",))
+    check_columns(Hospital, data)
     new_uuid = str(uuid.uuid4())
-    
-    hospital = Hospital(
-        uuid=new_uuid,
-        name=data["name"],
-        location=data.get("location")
-    )
-    db.session.add(hospital)
-    db.session.commit()
+
     broadcast_replication("HOSPITAL", "CREATE", new_uuid, data)
+    hospital = Hospital.query.filter_by(uuid=new_uuid).one()
 
     return jsonify({
         "hospital_id": hospital.hospital_id,
@@ -41,15 +67,13 @@ def create_hospital():
 def update_hospital(hospital_id):
     hospital = Hospital.query.get_or_404(hospital_id)
     data = request.json
-    
-    hospital.name = data.get("name", hospital.name)
-    hospital.location = data.get("location", hospital.location)
-    db.session.commit()
 
-    broadcast_replication("HOSPITAL", "UPDATE", hospital.uuid, {
-        "name": hospital.name,
-        "location": hospital.location
-    })
+    payload = {
+        "name": data.get("name", hospital.name),
+        "location": data.get("location", hospital.location)
+    }
+    check_columns(Hospital, payload)
+    broadcast_replication("HOSPITAL", "UPDATE", hospital.uuid, payload)
 
     return jsonify({
         "hospital_id": hospital.hospital_id,
@@ -62,34 +86,40 @@ def update_hospital(hospital_id):
 @handle_write_request
 def delete_hospital(hospital_id):
     hospital = Hospital.query.get_or_404(hospital_id)
-    data_uuid = hospital.uuid
-    
-    db.session.delete(hospital)
-    db.session.commit()
-    broadcast_replication("HOSPITAL", "DELETE", data_uuid, None)
+    broadcast_replication("HOSPITAL", "DELETE", hospital.uuid, None)
     return jsonify({"message": "Hospital deleted"}), 200
 
-@app.route("/hospitals", methods=["GET"])
-def get_hospitals():
-    hospitals = Hospital.query.all()
-    return jsonify([{
+HOSPITAL_RESPONSE_FIELDS = ("hospital_id", "uuid", "name", "location", "created_at")
+
+def serialize_hospital(h, fields=None):
+    if fields is not None:
+        return project(h, fields)
+    return {
         "hospital_id": h.hospital_id,
         "uuid": h.uuid,
         "name": h.name,
         "location": h.location,
         "created_at": h.created_at.isoformat()
-    } for h in hospitals])
+    }
+
+@app.route("/hospitals", methods=["GET"])
+@handle_read_request
+@cached("hospital")
+def get_hospitals():
+    fields = requested_fields(HOSPITAL_RESPONSE_FIELDS)
+    query = load_fields(Hospital.query, Hospital, fields)
+    if wants_all():
+        return jsonify([serialize_hospital(h, fields) for h in query.all()])
+    hospitals, next_cursor = keyset_page(query, Hospital.hospital_id)
+    return jsonify(page_response([serialize_hospital(h, fields) for h in hospitals], next_cursor))
 
 @app.route("/hospitals/<int:hospital_id>", methods=["GET"])
+@handle_read_request
+@cached("hospital", item="hospital_id")
 def get_hospital(hospital_id):
-    hospital = Hospital.query.get_or_404(hospital_id)
-    return jsonify({
-        "hospital_id": hospital.hospital_id,
-        "uuid": hospital.uuid,
-        "name": hospital.name,
-        "location": hospital.location,
-        "created_at": hospital.created_at.isoformat()
-    })
+    fields = requested_fields(HOSPITAL_RESPONSE_FIELDS)
+    hospital = load_fields(Hospital.query, Hospital, fields).get_or_404(hospital_id)
+    return jsonify(serialize_hospital(hospital, fields))
 
 # USER ROLE
 
@@ -97,17 +127,13 @@ def get_hospital(hospital_id):
 @handle_write_request
 def create_role():
     data = request.json
+    require_fields(data, ("role_name",))
+    check_columns(UserRole, data)
     if UserRole.query.filter_by(role_name=data["role_name"]).first():
         return jsonify({"error": "Role already exists"}), 400
 
-    role = UserRole(
-        role_name=data["role_name"],
-        description=data.get("description")
-    )
-    db.session.add(role)
-    db.session.commit()
-
     broadcast_replication("ROLE", "CREATE", data["role_name"], data)
+    role = UserRole.query.filter_by(role_name=data["role_name"]).one()
     return jsonify({
         "role_id": role.role_id,
         "role_name": role.role_name,
@@ -118,17 +144,14 @@ def create_role():
 @handle_write_request
 def update_role(role_id):
     role = UserRole.query.get_or_404(role_id)
-    old_name = role.role_name
     data = request.json
-    
-    role.role_name = data.get("role_name", role.role_name)
-    role.description = data.get("description", role.description)
-    db.session.commit()
 
-    broadcast_replication("ROLE", "UPDATE", old_name, {
-        "role_name": role.role_name,
-        "description": role.description
-    })
+    payload = {
+        "role_name": data.get("role_name", role.role_name),
+        "description": data.get("description", role.description)
+    }
+    check_columns(UserRole, payload)
+    broadcast_replication("ROLE", "UPDATE", role.role_name, payload)
 
     return jsonify({
         "role_id": role.role_id,
@@ -136,14 +159,27 @@ def update_role(role_id):
         "description": role.description
     })
 
-@app.route("/roles", methods=["GET"])
-def get_roles():
-    roles = UserRole.query.all()
-    return jsonify([{
+ROLE_RESPONSE_FIELDS = ("role_id", "role_name", "description")
+
+def serialize_role(r, fields=None):
+    if fields is not None:
+        return project(r, fields)
+    return {
         "role_id": r.role_id,
         "role_name": r.role_name,
         "description": r.description
-    } for r in roles])
+    }
+
+@app.route("/roles", methods=["GET"])
+@handle_read_request
+@cached("user_role")
+def get_roles():
+    fields = requested_fields(ROLE_RESPONSE_FIELDS)
+    query = load_fields(UserRole.query, UserRole, fields)
+    if wants_all():
+        return jsonify([serialize_role(r, fields) for r in query.all()])
+    roles, next_cursor = keyset_page(query, UserRole.role_id)
+    return jsonify(page_response([serialize_role(r, fields) for r in roles], next_cursor))
 
 # USER
 
@@ -151,23 +187,15 @@ def get_roles():
 @handle_write_request
 def create_user():
     data = request.json
+    require_fields(data, ("hospital_id", "full_name", "email", "password", "role_id"))
+    check_columns(User, data)
     new_uuid = str(uuid.uuid4())
-    hashed_pw = hash_password(data["password"])
-    
-    user = User(
-        uuid=new_uuid,
-        hospital_id=data["hospital_id"],
-        full_name=data["full_name"],
-        email=data["email"],
-        password=hashed_pw,
-        role_id=data["role_id"]
-    )
-    db.session.add(user)
-    db.session.commit()
+    hashed_pw = password_hasher.hash(data["password"])
 
     repl_payload = data.copy()
     repl_payload['password'] = hashed_pw 
     broadcast_replication("USER", "CREATE", new_uuid, repl_payload)
+    user = User.query.filter_by(uuid=new_uuid).one()
 
     return jsonify({
         "user_id": user.user_id,
@@ -181,43 +209,36 @@ def create_user():
 def update_user(user_id):
     user = User.query.get_or_404(user_id)
     data = request.json
-    
-    user.full_name = data.get("full_name", user.full_name)
-    user.email = data.get("email", user.email)
-    
+
+    check_columns(User, data)
     current_pw = user.password
     if "password" in data:
-        current_pw = hash_password(data["password"])
-        user.password = current_pw
-        
-    user.role_id = data.get("role_id", user.role_id)
-    db.session.commit()
+        current_pw = password_hasher.hash(data["password"])
 
-    broadcast_replication("USER", "UPDATE", user.uuid, {
+    payload = {
         "hospital_id": user.hospital_id,
-        "full_name": user.full_name,
-        "email": user.email,
+        "full_name": data.get("full_name", user.full_name),
+        "email": data.get("email", user.email),
         "password": current_pw,
-        "role_id": user.role_id
-    })
+        "role_id": data.get("role_id", user.role_id)
+    }
+    check_columns(User, payload)
+    broadcast_replication("USER", "UPDATE", user.uuid, payload)
     return jsonify({"status": "User updated", "uuid": user.uuid})
 
 @app.route("/users/<int:user_id>", methods=["DELETE"])
 @handle_write_request
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
-    data_uuid = user.uuid
-    
-    db.session.delete(user)
-    db.session.commit()
-
-    broadcast_replication("USER", "DELETE", data_uuid, None)
+    broadcast_replication("USER", "DELETE", user.uuid, None)
     return jsonify({"message": "User deleted"}), 200
 
-@app.route("/users", methods=["GET"])
-def get_users():
-    users = User.query.all()
-    return jsonify([{
+USER_RESPONSE_FIELDS = ("user_id", "uuid", "full_name", "email", "hospital_id", "role_id", "created_at")
+
+def serialize_user(u, fields=None):
+    if fields is not None:
+        return project(u, fields)
+    return {
         "user_id": u.user_id,
         "uuid": u.uuid,
         "full_name": u.full_name,
@@ -225,43 +246,134 @@ def get_users():
         "hospital_id": u.hospital_id,
         "role_id": u.role_id,
         "created_at": u.created_at.isoformat()
-    } for u in users])
+    }
+
+@app.route("/users", methods=["GET"])
+@handle_read_request
+@cached("user")
+def get_users():
+    fields = requested_fields(USER_RESPONSE_FIELDS)
+    query = load_fields(User.query, User, fields)
+    if wants_all():
+        return jsonify([serialize_user(u, fields) for u in query.all()])
+    users, next_cursor = keyset_page(query, User.user_id)
+    return jsonify(page_response([serialize_user(u, fields) for u in users], next_cursor))
 
 @app.route("/users/<int:user_id>", methods=["GET"])
+@handle_read_request
+@cached("user", item="user_id")
 def get_user(user_id):
-    user = User.query.get_or_404(user_id)
-    return jsonify({
-        "user_id": user.user_id,
-        "uuid": user.uuid,
-        "full_name": user.full_name,
-        "email": user.email,
-        "hospital_id": user.hospital_id,
-        "role_id": user.role_id,
-        "created_at": user.created_at.isoformat()
-    })
+    fields = requested_fields(USER_RESPONSE_FIELDS)
+    user = load_fields(User.query, User, fields).get_or_404(user_id)
+    return jsonify(serialize_user(user, fields))
 
 # PATIENT
 
+# Patients and their clinical records are partitioned across the Raft groups.
+# With more than one group, a record's id is allocated in its partition
+# (id % RAFT_GROUPS == group), so writes are routed by id alone.
+
+def by_id(arg):
+    """handle_write_request partition: the group owning the id in view argument `arg`."""
+    return lambda kwargs: group_of_id(kwargs[arg])
+
+def by_body(field):
+    """handle_write_request partition: the group owning the id in request body `field`."""
+    return lambda kwargs: group_of_id((request.get_json(silent=True) or {}).get(field))
+
+def with_id(payload, column, value):
+    """Carry a leader-allocated id in a create payload so every node stores the same one."""
+    if partitioned():
+        payload[column] = value
+    return payload
+
 # ========== PATIENT CRUD ==========
 
+PATIENT_ENCRYPTED_FIELDS = (
+    ("full_name", "full_name_encrypted"),
+    ("date_of_birth", "date_of_birth_encrypted"),
+    ("phone", "phone_encrypted"),
+    ("address", "address_encrypted"),
+)
+
+PATIENT_RESPONSE_FIELDS = ("patient_id", "uuid", "full_name", "date_of_birth", "gender", "phone", "address", "created_at")
+# Response field -> column, for projected loads
+PATIENT_FIELD_COLUMNS = dict(PATIENT_ENCRYPTED_FIELDS)
+
+# Search parameter -> (plaintext field, blind-index column)
+PATIENT_SEARCH_PARAMS = {
+    "full_name": ("full_name", Patient.full_name_bidx),
+    "dob": ("date_of_birth", Patient.date_of_birth_bidx),
+    "phone": ("phone", Patient.phone_bidx),
+}
+
+def set_patient_fields(patient, data):
+    """Encrypt and blind-index the patient fields present in `data`.
+
+    Shared by create/update and the replication receiver so the ciphertext
+    and its blind index can never drift apart.
+    """
+    for field, column in PATIENT_ENCRYPTED_FIELDS:
+        if field in data:
+            setattr(patient, column, encryptor.encrypt(data[field]) if data[field] else None)
+    for field, column in PATIENT_SEARCH_PARAMS.values():
+        if field in data:
+            setattr(patient, column.key, blind_indexer.index(field, data[field]))
+    if "gender" in data:
+        patient.gender = data["gender"]
+
+# Plaintext request fields of a patient
+PATIENT_INPUT_FIELDS = tuple(field for field, _ in PATIENT_ENCRYPTED_FIELDS) + ("gender",)
+
+# Stored patient columns a replicated write may set
+PATIENT_COLUMNS = ({column for _, column in PATIENT_ENCRYPTED_FIELDS} |
+                   {column.key for _, column in PATIENT_SEARCH_PARAMS.values()} | {"gender"})
+
+def patient_columns(patient, data):
+    """Stored column values for the fields present in `data`.
+
+    This is the replication payload: PII travels as the leader's ciphertext
+    plus blind indexes, and followers store it as-is instead of encrypting
+    it again.
+    """
+    columns = {}
+    for field, column in PATIENT_ENCRYPTED_FIELDS:
+        if field in data:
+            columns[column] = getattr(patient, column)
+    for field, column in PATIENT_SEARCH_PARAMS.values():
+        if field in data:
+            columns[column.key] = getattr(patient, column.key)
+    if "gender" in data:
+        columns["gender"] = patient.gender
+    return columns
+
+def apply_patient_columns(patient, payload):
+    if any(field in payload for field, _ in PATIENT_ENCRYPTED_FIELDS):
+        # Log entries written before ciphertext replication carry plaintext
+        set_patient_fields(patient, payload)
+        return
+    for column, value in payload.items():
+        if column in PATIENT_COLUMNS:
+            setattr(patient, column, value)
+
 @app.route("/patients", methods=["POST"])
-@handle_write_request
+@handle_write_request(partition=NEW_PARTITION)
 def create_patient():
     data = request.json
-    new_uuid = str(uuid.uuid4())
-    
-    patient = Patient(
-        uuid=new_uuid,
-        full_name_encrypted=encryptor.encrypt(data["full_name"]),
-        date_of_birth_encrypted=encryptor.encrypt(data["date_of_birth"]),
-        gender=data.get("gender"),
-        phone_encrypted=encryptor.encrypt(data.get("phone")) if data.get("phone") else None,
-        address_encrypted=encryptor.encrypt(data.get("address")) if data.get("address") else None
-    )
-    db.session.add(patient)
-    db.session.commit()
-
-    broadcast_replication("PATIENT", "CREATE", new_uuid, data)
+    if not data.get("full_name") or not data.get("date_of_birth"):
+        return jsonify({"error": "full_name and date_of_birth are required"}), 400
+    require_strings(data, PATIENT_INPUT_FIELDS)
+    group = current_group()
+    new_uuid = mint_uuid(group)
+
+    # Encrypted here, once; the state machine stores the ciphertext on every node
+    encrypted = Patient()
+    set_patient_fields(encrypted, data)
+    payload = patient_columns(encrypted, data)
+    check_columns(Patient, payload)
+    broadcast_replication("PATIENT", "CREATE", new_uuid,
+                          with_id(payload, "patient_id", ids.allocate(Patient, group)[0]))
+    patient = Patient.query.filter_by(uuid=new_uuid).one()
 
     return jsonify({
         "patient_id": patient.patient_id,
@@ -271,154 +383,953 @@ def create_patient():
     }), 201
 
 @app.route("/patients/<int:patient_id>", methods=["PUT"])
-@handle_write_request
+@handle_write_request(partition=by_id("patient_id"))
 def update_patient(patient_id):
     patient = Patient.query.get_or_404(patient_id)
     data = request.json
-    
-    if "full_name" in data:
-        patient.full_name_encrypted = encryptor.encrypt(data["full_name"])
-    if "date_of_birth" in data:
-        patient.date_of_birth_encrypted = encryptor.encrypt(data["date_of_birth"])
-    patient.gender = data.get("gender", patient.gender)
-    if "phone" in data:
-        patient.phone_encrypted = encryptor.encrypt(data["phone"]) if data["phone"] else None
-    if "address" in data:
-        patient.address_encrypted = encryptor.encrypt(data["address"]) if data["address"] else None
-    
-    db.session.commit()
-    broadcast_replication("PATIENT", "UPDATE", patient.uuid, data)
+
+    require_strings(data, PATIENT_INPUT_FIELDS)
+    encrypted = Patient()
+    set_patient_fields(encrypted, data)
+    payload = patient_columns(encrypted, data)
+    check_columns(Patient, payload)
+    broadcast_replication("PATIENT", "UPDATE", patient.uuid, payload)
     return jsonify({"status": "Updated", "uuid": patient.uuid})
 
 @app.route("/patients/<int:patient_id>", methods=["DELETE"])
-@handle_write_request
+@handle_write_request(partition=by_id("patient_id"))
 def delete_patient(patient_id):
     patient = Patient.query.get_or_404(patient_id)
-    target_uuid = patient.uuid
-    
-    db.session.delete(patient)
-    db.session.commit()
-    broadcast_replication("PATIENT", "DELETE", target_uuid, None)
+    broadcast_replication("PATIENT", "DELETE", patient.uuid, None)
     return jsonify({"message": "Patient deleted across cluster"}), 200
 
+def serialize_patients(patients, fields=None):
+    """Serialize patients, decrypting the PII fields of the page in one batch.
+
+    With `fields`, only those fields are returned and only the encrypted
+    ones among them are decrypted.
+    """
+    encrypted = [(f, c) for f, c in PATIENT_ENCRYPTED_FIELDS if fields is None or f in fields]
+    ciphertexts = [getattr(p, column) for p in patients for _, column in encrypted]
+    plaintexts = iter(encryptor.decrypt_many(ciphertexts))
+    if fields is not None:
+        plain = [f for f in fields if f not in PATIENT_FIELD_COLUMNS]
+
+    result = []
+    for p in patients:
+        if fields is None:
+            item = {
+                "patient_id": p.patient_id,
+                "uuid": p.uuid,
+                "gender": p.gender,
+                "created_at": p.created_at.isoformat()
+            }
+        else:
+            item = project(p, plain)
+        for field, _ in encrypted:
+            item[field] = next(plaintexts)
+        result.append(item)
+    return result
+
 @app.route("/patients", methods=["GET"])
+@handle_read_request
+@cached("patient")
 def get_patients():
-    patients = Patient.query.all()
-    return jsonify([{
-        "patient_id": p.patient_id,
-        "uuid": p.uuid,
-        "full_name": encryptor.decrypt(p.full_name_encrypted),
-        "date_of_birth": encryptor.decrypt(p.date_of_birth_encrypted),
-        "gender": p.gender,
-        "phone": encryptor.decrypt(p.phone_encrypted) if p.phone_encrypted else None,
-        "address": encryptor.decrypt(p.address_encrypted) if p.address_encrypted else None,
-        "created_at": p.created_at.isoformat()
-    } for p in patients])
+    fields = requested_fields(PATIENT_RESPONSE_FIELDS)
+    query = load_fields(Patient.query, Patient, fields, PATIENT_FIELD_COLUMNS)
+    if wants_all():
+        return jsonify(serialize_patients(query.all(), fields))
+    patients, next_cursor = keyset_page(query, Patient.patient_id)
+    return jsonify(page_response(serialize_patients(patients, fields), next_cursor))
+
+@app.route("/patients/search", methods=["GET"])
+@handle_read_request
+def search_patients():
+    """Equality search on encrypted PII via the blind-index columns."""
+    filters = {param: request.args[param] for param in PATIENT_SEARCH_PARAMS if request.args.get(param)}
+    if not filters:
+        return jsonify({"error": f"Provide at least one of: {', '.join(PATIENT_SEARCH_PARAMS)}"}), 400
+
+    fields = requested_fields(PATIENT_RESPONSE_FIELDS)
+    query = load_fields(Patient.query, Patient, fields, PATIENT_FIELD_COLUMNS)
+    for param, value in filters.items():
+        field, column = PATIENT_SEARCH_PARAMS[param]
+        query = query.filter(column == blind_indexer.index(field, value))
+    patients, next_cursor = keyset_page(query, Patient.patient_id)
+    return jsonify(page_response(serialize_patients(patients, fields), next_cursor))
 
 @app.route("/patients/<int:patient_id>", methods=["GET"])
+@handle_read_request
+@cached("patient", item="patient_id")
 def get_patient(patient_id):
+    fields = requested_fields(PATIENT_RESPONSE_FIELDS)
+    patient = load_fields(Patient.query, Patient, fields, PATIENT_FIELD_COLUMNS).get_or_404(patient_id)
+    return jsonify(serialize_patients([patient], fields)[0])
+
+# CLINICAL RECORDS
+
+def parse_timestamp(value, field):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        abort(400, description=f"{field} must be an ISO-8601 timestamp")
+
+def filter_time_range(query, column):
+    """Apply the `?from=` / `?to=` (inclusive, ISO-8601) bounds to `column`."""
+    if request.args.get("from"):
+        query = query.filter(column >= parse_timestamp(request.args["from"], "from"))
+    if request.args.get("to"):
+        query = query.filter(column <= parse_timestamp(request.args["to"], "to"))
+    return query
+
+def require_fields(data, fields):
+    missing = [f for f in fields if not data.get(f)]
+    if missing:
+        abort(400, description=f"Missing required fields: {', '.join(missing)}")
+
+def string_error(data, fields):
+    """Error message if one of `fields` present in `data` is not a string or null."""
+    for field in fields:
+        if data.get(field) is not None and not isinstance(data[field], str):
+            return f"{field} must be a string"
+
+def column_error(model, payload):
+    """Error message if a value in `payload` does not fit its `model` column: type, length or NULL."""
+    columns = model.__table__.c
+    for field, value in payload.items():
+        column = columns.get(field)
+        if column is None:
+            continue
+        if value is None:
+            if not column.nullable:
+                return f"{field} must not be null"
+        elif isinstance(column.type, db.String):
+            if not isinstance(value, str):
+                return f"{field} must be a string"
+            if column.type.length and len(value) > column.type.length:
+                return f"{field} must be at most {column.type.length} characters"
+        elif isinstance(column.type, db.Integer) and (not isinstance(value, int) or isinstance(value, bool)):
+            return f"{field} must be an integer"
+
+def require_strings(data, fields):
+    error = string_error(data, fields)
+    if error:
+        abort(400, description=error)
+
+def check_columns(model, payload):
+    """400 unless every value in `payload` fits its `model` column.
+
+    Checked before proposing: a value the database refuses would otherwise
+    only be rejected after it was committed to the log.
+    """
+    error = column_error(model, payload)
+    if error:
+        abort(400, description=error)
+
+def get_or_400(model, record_id, name):
+    record = db.session.get(model, record_id) if record_id is not None else None
+    if record is None:
+        abort(400, description=f"Unknown {name}: {record_id}")
+    return record
+
+def local_id(model, data_uuid):
+    """Resolve a replicated parent uuid to this node's integer primary key."""
+    if data_uuid is None:
+        return None
+    row = db.session.query(*model.__table__.primary_key.columns).filter(model.uuid == data_uuid).first()
+    return row[0] if row else None
+
+OBSERVATION_RESPONSE_FIELDS = ("observation_id", "uuid", "encounter_id", "patient_id", "type", "value", "unit", "recorded_at")
+
+def serialize_observation(o, fields=None):
+    if fields is not None:
+        return project(o, fields)
+    return {
+        "observation_id": o.observation_id,
+        "uuid": o.uuid,
+        "encounter_id": o.encounter_id,
+        "patient_id": o.patient_id,
+        "type": o.type,
+        "value": o.value,
+        "unit": o.unit,
+        "recorded_at": o.recorded_at.isoformat()
+    }
+
+PRESCRIPTION_RESPONSE_FIELDS = ("prescription_id", "uuid", "encounter_id", "patient_id", "doctor_id",
+                                "medication", "dosage", "frequency", "duration", "notes", "prescribed_at")
+
+def serialize_prescriptions(prescriptions, fields=None):
+    """Serialize prescriptions, decrypting all their notes in one batch."""
+    if fields is not None:
+        notes = encryptor.decrypt_many([p.notes_encrypted for p in prescriptions]) if "notes" in fields else None
+        result = [project(p, [f for f in fields if f != "notes"]) for p in prescriptions]
+        if notes is not None:
+            for item, note in zip(result, notes):
+                item["notes"] = note
+        return result
+    notes = encryptor.decrypt_many([p.notes_encrypted for p in prescriptions])
+    return [{
+        "prescription_id": p.prescription_id,
+        "uuid": p.uuid,
+        "encounter_id": p.encounter_id,
+        "patient_id": p.patient_id,
+        "doctor_id": p.doctor_id,
+        "medication": p.medication,
+        "dosage": p.dosage,
+        "frequency": p.frequency,
+        "duration": p.duration,
+        "notes": note,
+        "prescribed_at": p.prescribed_at.isoformat()
+    } for p, note in zip(prescriptions, notes)]
+
+ENCOUNTER_RESPONSE_FIELDS = ("encounter_id", "uuid", "patient_id", "doctor_id", "hospital_id",
+                             "visit_type", "visit_reason", "visit_date")
+
+def serialize_encounter(e, fields=None):
+    if fields is not None:
+        return project(e, fields)
+    return {
+        "encounter_id": e.encounter_id,
+        "uuid": e.uuid,
+        "patient_id": e.patient_id,
+        "doctor_id": e.doctor_id,
+        "hospital_id": e.hospital_id,
+        "visit_type": e.visit_type,
+        "visit_reason": e.visit_reason,
+        "visit_date": e.visit_date.isoformat()
+    }
+
+def serialize_encounters_nested(encounters):
+    """Encounters with their observations and prescriptions (preloaded by the caller)."""
+    prescriptions = serialize_prescriptions([p for e in encounters for p in e.prescriptions])
+    by_encounter = {}
+    for p in prescriptions:
+        by_encounter.setdefault(p["encounter_id"], []).append(p)
+
+    result = []
+    for e in encounters:
+        item = serialize_encounter(e)
+        item["observations"] = [serialize_observation(o) for o in sorted(e.observations, key=lambda o: o.recorded_at)]
+        item["prescriptions"] = by_encounter.get(e.encounter_id, [])
+        result.append(item)
+    return result
+
+# ENCOUNTER
+
+def encounter_payload(e):
+    """Replication payload: parents are referenced by uuid, not node-local ids."""
+    return {
+        "patient_uuid": e.patient.uuid,
+        "doctor_uuid": e.doctor.uuid,
+        "hospital_uuid": e.hospital.uuid,
+        "visit_type": e.visit_type,
+        "visit_reason": e.visit_reason,
+        "visit_date": e.visit_date.isoformat()
+    }
+
+@app.route("/encounters", methods=["POST"])
+@handle_write_request(partition=by_body("patient_id"))
+def create_encounter():
+    data = request.json
+    require_fields(data, ("patient_id", "doctor_id", "hospital_id", "visit_type", "visit_date"))
+    new_uuid = str(uuid.uuid4())
+
+    payload = {
+        "patient_uuid": get_or_400(Patient, data["patient_id"], "patient_id").uuid,
+        "doctor_uuid": get_or_400(User, data["doctor_id"], "doctor_id").uuid,
+        "hospital_uuid": get_or_400(Hospital, data["hospital_id"], "hospital_id").uuid,
+        "visit_type": data["visit_type"],
+        "visit_reason": data.get("visit_reason"),
+        "visit_date": parse_timestamp(data["visit_date"], "visit_date").isoformat()
+    }
+    check_columns(Encounter, payload)
+    broadcast_replication("ENCOUNTER", "CREATE", new_uuid,
+                          with_id(payload, "encounter_id", ids.allocate(Encounter, current_group())[0]))
+    encounter = Encounter.query.filter_by(uuid=new_uuid).one()
+    return jsonify(serialize_encounter(encounter)), 201
+
+@app.route("/encounters/<int:encounter_id>", methods=["PUT"])
+@handle_write_request(partition=by_id("encounter_id"))
+def update_encounter(encounter_id):
+    encounter = Encounter.query.get_or_404(encounter_id)
+    data = request.json
+
+    payload = encounter_payload(encounter)
+    if "doctor_id" in data:
+        payload["doctor_uuid"] = get_or_400(User, data["doctor_id"], "doctor_id").uuid
+    if "hospital_id" in data:
+        payload["hospital_uuid"] = get_or_400(Hospital, data["hospital_id"], "hospital_id").uuid
+    if "visit_date" in data:
+        payload["visit_date"] = parse_timestamp(data["visit_date"], "visit_date").isoformat()
+    payload["visit_type"] = data.get("visit_type", encounter.visit_type)
+    payload["visit_reason"] = data.get("visit_reason", encounter.visit_reason)
+    check_columns(Encounter, payload)
+
+    broadcast_replication("ENCOUNTER", "UPDATE", encounter.uuid, payload)
+    return jsonify(serialize_encounter(encounter))
+
+@app.route("/encounters/<int:encounter_id>", methods=["DELETE"])
+@handle_write_request(partition=by_id("encounter_id"))
+def delete_encounter(encounter_id):
+    encounter = Encounter.query.get_or_404(encounter_id)
+    broadcast_replication("ENCOUNTER", "DELETE", encounter.uuid, None)
+    return jsonify({"message": "Encounter deleted"}), 200
+
+@app.route("/encounters", methods=["GET"])
+@handle_read_request
+def get_encounters():
+    fields = requested_fields(ENCOUNTER_RESPONSE_FIELDS)
+    query = load_fields(Encounter.query, Encounter, fields)
+    if request.args.get("patient_id"):
+        query = query.filter(Encounter.patient_id == request.args.get("patient_id", type=int))
+    query = filter_time_range(query, Encounter.visit_date)
+    encounters, next_cursor = keyset_page(query, Encounter.encounter_id)
+    return jsonify(page_response([serialize_encounter(e, fields) for e in encounters], next_cursor))
+
+@app.route("/encounters/<int:encounter_id>", methods=["GET"])
+@handle_read_request
+def get_encounter(encounter_id):
+    fields = requested_fields(ENCOUNTER_RESPONSE_FIELDS + ("observations", "prescriptions"))
+    if fields is None:
+        encounter = Encounter.query.options(
+            selectinload(Encounter.observations), selectinload(Encounter.prescriptions)
+        ).filter_by(encounter_id=encounter_id).first_or_404()
+        return jsonify(serialize_encounters_nested([encounter])[0])
+
+    query = load_fields(Encounter.query, Encounter, fields, {"observations": None, "prescriptions": None})
+    nested = [f for f in ("observations", "prescriptions") if f in fields]
+    query = query.options(*(selectinload(getattr(Encounter, f)) for f in nested))
+    encounter = query.filter_by(encounter_id=encounter_id).first_or_404()
+    item = serialize_encounter(encounter, [f for f in fields if f not in nested])
+    if "observations" in nested:
+        item["observations"] = [serialize_observation(o) for o in sorted(encounter.observations, key=lambda o: o.recorded_at)]
+    if "prescriptions" in nested:
+        item["prescriptions"] = serialize_prescriptions(encounter.prescriptions)
+    return jsonify(item)
+
+# OBSERVATION
+
+def observation_payload(o):
+    return {
+        "encounter_uuid": o.encounter.uuid,
+        "type": o.type,
+        "value": o.value,
+        "unit": o.unit,
+        "recorded_at": o.recorded_at.isoformat()
+    }
+
+@app.route("/observations", methods=["POST"])
+@handle_write_request(partition=by_body("encounter_id"))
+def create_observation():
+    data = request.json
+    require_fields(data, ("encounter_id", "type", "value"))
+    encounter = get_or_400(Encounter, data["encounter_id"], "encounter_id")
+    new_uuid = str(uuid.uuid4())
+
+    # Stamp the time here so every replica stores the same value
+    recorded_at = parse_timestamp(data["recorded_at"], "recorded_at") if data.get("recorded_at") else datetime.now(timezone.utc)
+    payload = {
+        "encounter_uuid": encounter.uuid,
+        "type": data["type"],
+        "value": str(data["value"]),
+        "unit": data.get("unit"),
+        "recorded_at": recorded_at.isoformat()
+    }
+    check_columns(Observation, payload)
+    broadcast_replication("OBSERVATION", "CREATE", new_uuid,
+                          with_id(payload, "observation_id", ids.allocate(Observation, current_group())[0]))
+    observation = Observation.query.filter_by(uuid=new_uuid).one()
+    return jsonify(serialize_observation(observation)), 201
+
+@app.route("/observations/<int:observation_id>", methods=["PUT"])
+@handle_write_request(partition=by_id("observation_id"))
+def update_observation(observation_id):
+    observation = Observation.query.get_or_404(observation_id)
+    data = request.json
+
+    payload = observation_payload(observation)
+    payload["type"] = data.get("type", observation.type)
+    if "value" in data:
+        payload["value"] = str(data["value"])
+    payload["unit"] = data.get("unit", observation.unit)
+    if "recorded_at" in data:
+        payload["recorded_at"] = parse_timestamp(data["recorded_at"], "recorded_at").isoformat()
+    check_columns(Observation, payload)
+
+    broadcast_replication("OBSERVATION", "UPDATE", observation.uuid, payload)
+    return jsonify(serialize_observation(observation))
+
+@app.route("/observations/<int:observation_id>", methods=["DELETE"])
+@handle_write_request(partition=by_id("observation_id"))
+def delete_observation(observation_id):
+    observation = Observation.query.get_or_404(observation_id)
+    broadcast_replication("OBSERVATION", "DELETE", observation.uuid, None)
+    return jsonify({"message": "Observation deleted"}), 200
+
+@app.route("/observations", methods=["GET"])
+@handle_read_request
+def get_observations():
+    fields = requested_fields(OBSERVATION_RESPONSE_FIELDS)
+    query = load_fields(Observation.query, Observation, fields)
+    if request.args.get("patient_id"):
+        query = query.filter(Observation.patient_id == request.args.get("patient_id", type=int))
+    if request.args.get("encounter_id"):
+        query = query.filter(Observation.encounter_id == request.args.get("encounter_id", type=int))
+    if request.args.get("type"):
+        query = query.filter(Observation.type == request.args["type"])
+    query = filter_time_range(query, Observation.recorded_at)
+    observations, next_cursor = keyset_page(query, Observation.observation_id)
+    return jsonify(page_response([serialize_observation(o, fields) for o in observations], next_cursor))
+
+@app.route("/observations/<int:observation_id>", methods=["GET"])
+@handle_read_request
+def get_observation(observation_id):
+    fields = requested_fields(OBSERVATION_RESPONSE_FIELDS)
+    observation = load_fields(Observation.query, Observation, fields).get_or_404(observation_id)
+    return jsonify(serialize_observation(observation, fields))
+
+# PRESCRIPTION
+
+PRESCRIPTION_FIELDS = ("medication", "dosage", "frequency", "duration")
+
+def prescription_payload(p):
+    payload = {field: getattr(p, field) for field in PRESCRIPTION_FIELDS}
+    payload.update({
+        "encounter_uuid": p.encounter.uuid,
+        "doctor_uuid": p.doctor.uuid,
+        "notes_encrypted": p.notes_encrypted,
+        "prescribed_at": p.prescribed_at.isoformat()
+    })
+    return payload
+
+@app.route("/prescriptions", methods=["POST"])
+@handle_write_request(partition=by_body("encounter_id"))
+def create_prescription():
+    data = request.json
+    require_fields(data, ("encounter_id", "medication"))
+    require_strings(data, ("notes",))
+    encounter = get_or_400(Encounter, data["encounter_id"], "encounter_id")
+    doctor = get_or_400(User, data["doctor_id"], "doctor_id") if data.get("doctor_id") else encounter.doctor
+    new_uuid = str(uuid.uuid4())
+
+    payload = {field: data.get(field) for field in PRESCRIPTION_FIELDS}
+    payload.update({
+        "encounter_uuid": encounter.uuid,
+        "doctor_uuid": doctor.uuid,
+        "notes_encrypted": encryptor.encrypt(data["notes"]) if data.get("notes") else None,
+        "prescribed_at": datetime.now(timezone.utc).isoformat()
+    })
+    check_columns(Prescription, payload)
+    broadcast_replication("PRESCRIPTION", "CREATE", new_uuid,
+                          with_id(payload, "prescription_id", ids.allocate(Prescription, current_group())[0]))
+    prescription = Prescription.query.filter_by(uuid=new_uuid).one()
+    return jsonify(serialize_prescriptions([prescription])[0]), 201
+
+@app.route("/prescriptions/<int:prescription_id>", methods=["PUT"])
+@handle_write_request(partition=by_id("prescription_id"))
+def update_prescription(prescription_id):
+    prescription = Prescription.query.get_or_404(prescription_id)
+    data = request.json
+
+    require_strings(data, ("notes",))
+    payload = prescription_payload(prescription)
+    for field in PRESCRIPTION_FIELDS:
+        if field in data:
+            payload[field] = data[field]
+    if "notes" in data:
+        payload["notes_encrypted"] = encryptor.encrypt(data["notes"]) if data["notes"] else None
+    check_columns(Prescription, payload)
+
+    broadcast_replication("PRESCRIPTION", "UPDATE", prescription.uuid, payload)
+    return jsonify(serialize_prescriptions([prescription])[0])
+
+@app.route("/prescriptions/<int:prescription_id>", methods=["DELETE"])
+@handle_write_request(partition=by_id("prescription_id"))
+def delete_prescription(prescription_id):
+    prescription = Prescription.query.get_or_404(prescription_id)
+    broadcast_replication("PRESCRIPTION", "DELETE", prescription.uuid, None)
+    return jsonify({"message": "Prescription deleted"}), 200
+
+@app.route("/prescriptions", methods=["GET"])
+@handle_read_request
+def get_prescriptions():
+    fields = requested_fields(PRESCRIPTION_RESPONSE_FIELDS)
+    query = load_fields(Prescription.query, Prescription, fields, {"notes": "notes_encrypted"})
+    if request.args.get("patient_id"):
+        query = query.filter(Prescription.patient_id == request.args.get("patient_id", type=int))
+    if request.args.get("encounter_id"):
+        query = query.filter(Prescription.encounter_id == request.args.get("encounter_id", type=int))
+    query = filter_time_range(query, Prescription.prescribed_at)
+    prescriptions, next_cursor = keyset_page(query, Prescription.prescription_id)
+    return jsonify(page_response(serialize_prescriptions(prescriptions, fields), next_cursor))
+
+@app.route("/prescriptions/<int:prescription_id>", methods=["GET"])
+@handle_read_request
+def get_prescription(prescription_id):
+    fields = requested_fields(PRESCRIPTION_RESPONSE_FIELDS)
+    prescription = load_fields(Prescription.query, Prescription, fields, {"notes": "notes_encrypted"}).get_or_404(prescription_id)
+    return jsonify(serialize_prescriptions([prescription], fields)[0])
+
+# TIMELINE
+
+@app.route("/patients/<int:patient_id>/timeline", methods=["GET"])
+@handle_read_request
+def get_patient_timeline(patient_id):
+    """A patient's encounters, newest first, with nested observations and prescriptions.
+
+    Always four queries regardless of history length: the patient, one range
+    scan of (patient_id, visit_date), and one IN query each for the
+    observations and prescriptions of the returned encounters.
+    """
     patient = Patient.query.get_or_404(patient_id)
+    limit = max(1, min(request.args.get("limit", app.config["PAGE_SIZE_DEFAULT"], type=int), app.config["PAGE_SIZE_MAX"]))
+
+    query = filter_time_range(Encounter.query.filter(Encounter.patient_id == patient_id), Encounter.visit_date)
+    encounters = query.options(
+        selectinload(Encounter.observations), selectinload(Encounter.prescriptions)
+    ).order_by(Encounter.visit_date.desc(), Encounter.encounter_id.desc()).limit(limit + 1).all()
+
+    has_more = len(encounters) > limit
+    encounters = encounters[:limit]
     return jsonify({
-        "patient_id": patient.patient_id,
-        "uuid": patient.uuid,
-        "full_name": encryptor.decrypt(patient.full_name_encrypted),
-        "date_of_birth": encryptor.decrypt(patient.date_of_birth_encrypted),
-        "gender": patient.gender,
-        "phone": encryptor.decrypt(patient.phone_encrypted) if patient.phone_encrypted else None,
-        "address": encryptor.decrypt(patient.address_encrypted) if patient.address_encrypted else None,
-        "created_at": patient.created_at.isoformat()
+        "patient": serialize_patients([patient])[0],
+        "encounters": serialize_encounters_nested(encounters),
+        # Narrow `to` below the oldest returned visit_date to fetch the next slice
+        "has_more": has_more
     })
 
-# RAFT & REPLICATION ENDPOINTS
+# VITALS
 
-@app.route("/raft/replicate_write", methods=["POST"])
-def replicate_write():
-    """Generic receiver that can handle ANY model type."""
-    data = request.json
-    m_type = data.get("type")
-    action = data.get("action")
-    payload = data.get("data")
-    uid = data.get("uuid")
+@app.route("/patients/<int:patient_id>/vitals/<vital_type>", methods=["GET"])
+@handle_read_request
+def get_patient_vitals(patient_id, vital_type):
+    """Downsampled numeric observations, answered from the rollup table only."""
+    if db.session.get(Patient, patient_id) is None:
+        abort(404)
+    resolution = request.args.get("resolution", "hour")
+    if resolution not in vitals.RESOLUTIONS:
+        return jsonify({"error": f"resolution must be one of: {', '.join(vitals.RESOLUTIONS)}"}), 400
+    start = parse_timestamp(request.args["from"], "from") if request.args.get("from") else None
+    end = parse_timestamp(request.args["to"], "to") if request.args.get("to") else None
+
+    max_points = app.config["VITALS_MAX_POINTS"]
+    starts, counts, mins, maxs, means = vitals.query_rollups(patient_id, vital_type, resolution, start, end,
+                                                             limit=max_points + 1)
+    if len(starts) > max_points:
+        return jsonify({"error": f"More than {max_points} points; narrow the range or use a coarser resolution"}), 400
+
+    return jsonify({
+        "patient_id": patient_id,
+        "type": vitals.series_type(vital_type),
+        "resolution": resolution,
+        "points": [{
+            "t": vitals.from_epoch(t).isoformat(),
+            "count": c,
+            "min": lo,
+            "max": hi,
+            "mean": round(mean, 4)
+        } for t, c, lo, hi, mean in zip(starts.tolist(), counts.tolist(), mins.tolist(), maxs.tolist(), means.tolist())]
+    })
+
+# BULK INGESTION
+
+def hospital_rows(items):
+    return [{"uuid": i["uuid"], "name": i["name"], "location": i.get("location")} for i in items]
+
+def user_rows(items):
+    """Items carry an already hashed password (the leader hashes, followers copy)."""
+    return [{
+        "uuid": i["uuid"],
+        "hospital_id": i["hospital_id"],
+        "full_name": i["full_name"],
+        "email": i["email"],
+        "password": i["password"],
+        "role_id": i["role_id"]
+    } for i in items]
+
+def patient_rows(items):
+    """Build patient rows, encrypting every PII field of the batch in one call."""
+    plaintexts = [i.get(field) or None for i in items for field, _ in PATIENT_ENCRYPTED_FIELDS]
+    ciphertexts = iter(encryptor.encrypt_many(plaintexts))
+    rows = []
+    for i in items:
+        row = {"uuid": i["uuid"], "gender": i.get("gender")}
+        for _, column in PATIENT_ENCRYPTED_FIELDS:
+            row[column] = next(ciphertexts)
+        for field, column in PATIENT_SEARCH_PARAMS.values():
+            row[column.key] = blind_indexer.index(field, i.get(field))
+        rows.append(row)
+    return rows
+
+# Model type -> (model, required fields, row builder)
+BULK_MODELS = {
+    "HOSPITAL": (Hospital, ("name",), hospital_rows),
+    "USER": (User, ("hospital_id", "full_name", "email", "password", "role_id"), user_rows),
+    "PATIENT": (Patient, ("full_name", "date_of_birth"), patient_rows),
+}
 
+def record_error(model, required, record):
+    """Why a bulk record cannot be inserted, checked before its batch is proposed, or None."""
+    missing = [f for f in required if not record.get(f)]
+    if missing:
+        return f"Missing required fields: {', '.join(missing)}"
+    if model is Patient:
+        return string_error(record, PATIENT_INPUT_FIELDS) or column_error(model, {"gender": record.get("gender")})
+    return column_error(model, record)
+
+def insert_new_rows(model, rows):
+    """Bulk-insert `rows`, skipping uuids that already exist (replays are no-ops).
+
+    One multi-row INSERT; if the database rejects it (see is_rejection), the
+    rows are retried one savepoint each to find the offending ones. Returns
+    {uuid: error} for the rows that could not be inserted.
+    """
+    uuids = [r["uuid"] for r in rows]
+    existing = {u for (u,) in db.session.query(model.uuid).filter(model.uuid.in_(uuids))}
+    rows = [r for r in rows if r["uuid"] not in existing]
+    if not rows:
+        return {}
     try:
-        if m_type == "PATIENT":
-            if action == "DELETE":
-                Patient.query.filter_by(uuid=uid).delete()
-            else:
-                p = Patient.query.filter_by(uuid=uid).first() or Patient(uuid=uid)
-                
-                p.full_name_encrypted = encryptor.encrypt(payload.get('full_name'))
-                p.date_of_birth_encrypted = encryptor.encrypt(payload.get('date_of_birth'))
-                p.gender = payload.get('gender')
-                phone = payload.get('phone')
-                p.phone_encrypted = encryptor.encrypt(phone) if phone else None
-                address = payload.get('address')
-                p.address_encrypted = encryptor.encrypt(address) if address else None
-                
-                db.session.add(p)
-        elif m_type == "HOSPITAL":
-            if action == "DELETE":
-                Hospital.query.filter_by(uuid=uid).delete()
-            else:
-                h = Hospital.query.filter_by(uuid=uid).first() or Hospital(uuid=uid)
-                h.name = payload.get('name')
-                h.location = payload.get('location')
-                db.session.add(h)
-
-        elif m_type == "USER":
-            if action == "DELETE":
-                User.query.filter_by(uuid=uid).delete()
-            else:
-                u = User.query.filter_by(uuid=uid).first() or User(uuid=uid)
-                u.hospital_id = payload.get('hospital_id')
-                u.full_name = payload.get('full_name')
-                u.email = payload.get('email')
-                u.password = payload.get('password')
-                u.role_id = payload.get('role_id')
-                db.session.add(u)
-        
-        elif m_type == "ROLE":
-            role_name = data.get("uuid") 
-            if action == "DELETE":
-                UserRole.query.filter_by(role_name=role_name).delete()
+        with db.session.begin_nested():
+            db.session.execute(insert(model), rows)
+        return {}
+    except Exception as e:
+        if not is_rejection(e):
+            raise
+
+    errors = {}
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(model), [row])
+        except Exception as e:
+            if not is_rejection(e):
+                raise
+            errors[row["uuid"]] = rejection(e)
+    return errors
+
+def bulk_create(model_type):
+    """Ingest a JSON array or NDJSON stream of new records.
+
+    Records are processed in BULK_BATCH_SIZE batches: one encryption pass
+    and one replicated log entry per batch, applied as one multi-row INSERT.
+    The response streams one NDJSON status line per input record followed by
+    a summary line.
+    """
+    model, required, build_rows = BULK_MODELS[model_type]
+    records = iter_records()
+    batch_size = app.config["BULK_BATCH_SIZE"]
+    group = current_group()
+
+    def process():
+        created = failed = batches = 0
+        for batch in batched(records, batch_size):
+            statuses, items = [], []
+            for position, record, error in batch:
+                error = error or record_error(model, required, record)
+                if error:
+                    statuses.append({"index": position, "status": 400, "error": error})
+                    continue
+                item = dict(record, uuid=mint_uuid(group) if model is Patient else str(uuid.uuid4()))
+                items.append(item)
+                statuses.append({"index": position, "status": 201, "uuid": item["uuid"]})
+
+            if model_type == "USER" and items:
+                # Hashed across the process pool, a window at a time, so the API keeps its share
+                for item, hashed in zip(items, password_hasher.hash_many([i["password"] for i in items])):
+                    item["password"] = hashed
+
+            rows = build_rows(items) if items else []
+            if rows:
+                batches += 1
+                # Every node inserts the built rows as-is (patient PII already encrypted)
+                try:
+                    if model is Patient and partitioned():
+                        for row, patient_id in zip(rows, ids.allocate(Patient, group, len(rows))):
+                            row["patient_id"] = patient_id
+                    result = broadcast_replication(model_type, "BULK_CREATE", None, {"rows": rows}, group=group)
+                    errors, failure = (result.get("result") or {}).get("errors", {}), None
+                except ReplicationError as e:
+                    errors, failure = {}, e
+                for status in statuses:
+                    if status.get("uuid") in errors:
+                        status.update(status=409, error=errors.pop(status["uuid"]))
+                        del status["uuid"]
+                    elif failure is not None and status["status"] == 201:
+                        status.update(status=failure.status, error=str(failure))
+
+            for status in statuses:
+                if status["status"] == 201:
+                    created += 1
+                else:
+                    failed += 1
+                yield status
+        yield {"summary": {"created": created, "failed": failed, "batches": batches}}
+
+    return ndjson_response(process())
+
+@app.route("/hospitals/bulk", methods=["POST"])
+@handle_write_request(streaming=True)
+def bulk_create_hospitals():
+    return bulk_create("HOSPITAL")
+
+@app.route("/users/bulk", methods=["POST"])
+@handle_write_request(streaming=True)
+def bulk_create_users():
+    return bulk_create("USER")
+
+@app.route("/patients/bulk", methods=["POST"])
+@handle_write_request(partition=NEW_PARTITION, streaming=True)
+def bulk_create_patients():
+    return bulk_create("PATIENT")
+
+# RAFT & REPLICATION ENDPOINTS
+
+def apply_write(command):
+    """Apply one replicated write command to the local session (caller commits).
+
+    Returns None, or a result for the proposing endpoint (rows a bulk insert skipped).
+    """
+    m_type = command.get("type")
+    action = command.get("action")
+    payload = command.get("data")
+    uid = command.get("uuid")
+
+    if m_type == "NOOP":
+        return
+    if action == "BULK_CREATE":
+        model, _, build_rows = BULK_MODELS[m_type]
+        errors = insert_new_rows(model, payload["rows"] if "rows" in payload else build_rows(payload["items"]))
+        return {"errors": errors} if errors else None
+    elif m_type == "PATIENT":
+        if action == "DELETE":
+            # ORM delete so the patient's clinical records cascade with it
+            p = Patient.query.filter_by(uuid=uid).first()
+            if p:
+                db.session.delete(p)
+        else:
+            p = Patient.query.filter_by(uuid=uid).first() or Patient(uuid=uid, patient_id=payload.get("patient_id"))
+            apply_patient_columns(p, payload)
+            db.session.add(p)
+    elif m_type == "HOSPITAL":
+        if action == "DELETE":
+            Hospital.query.filter_by(uuid=uid).delete()
+        else:
+            h = Hospital.query.filter_by(uuid=uid).first() or Hospital(uuid=uid)
+            h.name = payload.get('name')
+            h.location = payload.get('location')
+            db.session.add(h)
+
+    elif m_type == "USER":
+        if action == "DELETE":
+            User.query.filter_by(uuid=uid).delete()
+        else:
+            u = User.query.filter_by(uuid=uid).first() or User(uuid=uid)
+            u.hospital_id = payload.get('hospital_id')
+            u.full_name = payload.get('full_name')
+            u.email = payload.get('email')
+            u.password = payload.get('password')
+            u.role_id = payload.get('role_id')
+            db.session.add(u)
+
+    elif m_type == "ROLE":
+        role_name = uid
+        if action == "DELETE":
+            UserRole.query.filter_by(role_name=role_name).delete()
+        else:
+            r = UserRole.query.filter_by(role_name=role_name).first() or UserRole(role_name=role_name)
+            r.role_name = payload.get('role_name', role_name)
+            r.description = payload.get('description')
+            db.session.add(r)
+
+    elif m_type == "ENCOUNTER":
+        e = Encounter.query.filter_by(uuid=uid).first()
+        if action == "DELETE":
+            if e:
+                db.session.delete(e)
+        else:
+            e = e or Encounter(uuid=uid, encounter_id=payload.get("encounter_id"))
+            e.patient_id = local_id(Patient, payload.get('patient_uuid'))
+            e.doctor_id = local_id(User, payload.get('doctor_uuid'))
+            e.hospital_id = local_id(Hospital, payload.get('hospital_uuid'))
+            e.visit_type = payload.get('visit_type')
+            e.visit_reason = payload.get('visit_reason')
+            e.visit_date = datetime.fromisoformat(payload['visit_date'])
+            db.session.add(e)
+
+    elif m_type == "OBSERVATION":
+        o = Observation.query.filter_by(uuid=uid).first()
+        if action == "DELETE":
+            if o:
+                db.session.delete(o)
+        else:
+            o = o or Observation(uuid=uid, observation_id=payload.get("observation_id"))
+            encounter = Encounter.query.filter_by(uuid=payload.get('encounter_uuid')).first()
+            o.encounter_id = encounter.encounter_id if encounter else None
+            o.patient_id = encounter.patient_id if encounter else None
+            o.type = payload.get('type')
+            o.value = payload.get('value')
+            o.unit = payload.get('unit')
+            o.recorded_at = datetime.fromisoformat(payload['recorded_at'])
+            db.session.add(o)
+
+    elif m_type == "PRESCRIPTION":
+        p = Prescription.query.filter_by(uuid=uid).first()
+        if action == "DELETE":
+            if p:
+                db.session.delete(p)
+        else:
+            p = p or Prescription(uuid=uid, prescription_id=payload.get("prescription_id"))
+            encounter = Encounter.query.filter_by(uuid=payload.get('encounter_uuid')).first()
+            p.encounter_id = encounter.encounter_id if encounter else None
+            p.patient_id = encounter.patient_id if encounter else None
+            p.doctor_id = local_id(User, payload.get('doctor_uuid'))
+            for field in PRESCRIPTION_FIELDS:
+                setattr(p, field, payload.get(field))
+            if "notes" in payload:
+                p.notes_encrypted = encryptor.encrypt(payload['notes']) if payload['notes'] else None
             else:
-                r = UserRole.query.filter_by(role_name=role_name).first() or UserRole(role_name=role_name)
-                r.description = payload.get('description')
-                db.session.add(r)
+                p.notes_encrypted = payload.get('notes_encrypted')
+            p.prescribed_at = datetime.fromisoformat(payload['prescribed_at'])
+            db.session.add(p)
 
-        db.session.commit()
-        return jsonify({"success": True}), 200
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"success": False, "error": str(e)}), 500
+# Errors the same command raises on every replica, whatever the timing: a
+# constraint, a value the driver or column refuses (DataError,
+# ProgrammingError, InterfaceError), a malformed payload. OperationalError
+# (locked, unreachable, out of space) is transient and retried instead.
+REJECTED_ERRORS = (StatementError, ValueError, TypeError, KeyError)
+
+def is_rejection(e):
+    return isinstance(e, REJECTED_ERRORS) and not isinstance(e, OperationalError)
+
+def rejection(e):
+    return str(getattr(e, "orig", None) or e)
+
+def apply_commands(commands):
+    """Raft state machine: apply committed log commands in order, in one transaction.
+
+    A command the database refuses (a constraint, a bad value or type, see
+    is_rejection) is rejected: it is rolled back on its own and the rest of
+    the batch still applies. Every replica applies it to the same state, so
+    every replica rejects it. Any other error (a locked or unreachable
+    database) is raised with nothing committed, and RaftNode retries the
+    entries instead of skipping them.
+    Returns one result per command: apply_write's, or {"rejected": error}.
+
+    Commands of the patient groups carry the group 0 index their shared
+    rows were read at; they wait for group 0 to apply that far first, so
+    a lagging follower never resolves a doctor or hospital uuid to None.
+    """
+    shared_index = max(command.get("shared_index") or 0 for command in commands)
+    if shared_index and not raft.wait_for_applied(shared_index, raft.replication_timeout):
+        # Raised, so RaftNode retries the batch instead of applying it without its parents
+        raise RuntimeError(f"Group 0 has not applied index {shared_index} yet")
+    with app.app_context():
+        try:
+            results = [apply_write(command) for command in commands]
+            db.session.commit()
+            return results
+        except Exception as e:
+            db.session.rollback()
+            if not is_rejection(e):
+                raise
+
+        # Find the rejected commands, each in its own savepoint
+        results = []
+        try:
+            for command in commands:
+                try:
+                    # The savepoint flushes on exit, so a rejection surfaces after apply_write returns
+                    with db.session.begin_nested():
+                        result = apply_write(command)
+                except Exception as e:
+                    if not is_rejection(e):
+                        raise
+                    print(f"Rejected {command.get('type')} {command.get('action')} {command.get('uuid')}: {rejection(e)}")
+                    result = {"rejected": rejection(e)}
+                results.append(result)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return results
 
 @app.route("/raft/request_vote", methods=["POST"])
 def request_vote():
-    data = request.json
-    term = data.get("term")
-    if term > raft.current_term:
-        raft.current_term = term
-        raft.voted_for = None
-        raft.state = "FOLLOWER"
-    granted = False
-    if term == raft.current_term and (raft.voted_for is None or raft.voted_for == data.get("candidate_id")):
-        raft.voted_for = data.get("candidate_id")
-        granted = True
-        raft.start_election_timer()
-    return jsonify({"term": raft.current_term, "vote_granted": granted})
+    return jsonify(raft_groups.dispatch("handle_request_vote")(request.json))
 
 @app.route("/raft/append_entries", methods=["POST"])
 def append_entries():
-    data = request.json
-    if data.get("term") >= raft.current_term:
-        raft.state = "FOLLOWER"
-        raft.current_term = data.get("term")
-        raft.voted_for = data.get("leader_id") 
-        raft.start_election_timer()
-    return jsonify({"success": True})
+    return jsonify(raft_groups.dispatch("handle_append_entries")(request.json))
+
+@app.route("/raft/read_index", methods=["POST"])
+def read_index():
+    return jsonify(raft_groups.dispatch("handle_read_index")(request.json))
+
+@app.route("/raft/install_snapshot", methods=["POST"])
+def install_snapshot():
+    return jsonify(raft_groups.dispatch("handle_install_snapshot")(request.json))
+
+def raft_rpc_server():
+    return RpcServer({
+        "/raft/request_vote": raft_groups.dispatch("handle_request_vote"),
+        "/raft/append_entries": raft_groups.dispatch("handle_append_entries"),
+        "/raft/read_index": raft_groups.dispatch("handle_read_index"),
+        "/raft/install_snapshot": raft_groups.dispatch("handle_install_snapshot")
+    }, port=app.config["RAFT_RPC_PORT"], auth_token=app.config["CLUSTER_AUTH_TOKEN"],
+       compress_min=app.config["RAFT_RPC_COMPRESS_BYTES"])
+
+def raft_rpc_transport():
+    addresses = dict(p.split("=", 1) for p in app.config["RAFT_RPC_PEERS"] if "=" in p)
+    return RpcTransport(addresses, default_port=app.config["RAFT_RPC_PORT"],
+                        auth_token=app.config["CLUSTER_AUTH_TOKEN"],
+                        compress_min=app.config["RAFT_RPC_COMPRESS_BYTES"])
 
 # HELPER ENDPOINTS
 
+# AUTH
+
+# Verified against when the email is unknown, so both cases cost one hash
+_unknown_user_hash = None
+
+@app.route("/auth/login", methods=["POST"])
+def login():
+    global _unknown_user_hash
+    data = request.json or {}
+    if not data.get("email") or not data.get("password"):
+        return jsonify({"error": "email and password are required"}), 400
+
+    user = User.query.filter_by(email=data["email"]).first()
+    if user is None:
+        if _unknown_user_hash is None:
+            _unknown_user_hash = password_hasher.hash(uuid.uuid4().hex)
+        password_hasher.verify(data["password"], _unknown_user_hash)
+        return jsonify({"error": "Invalid email or password"}), 401
+    if not password_hasher.verify(data["password"], user.password):
+        return jsonify({"error": "Invalid email or password"}), 401
+
+    return jsonify({
+        "token": session_tokens.issue(user),
+        "token_type": "Bearer",
+        "expires_in": session_tokens.ttl,
+        "user": {"user_id": user.user_id, "uuid": user.uuid, "full_name": user.full_name}
+    })
+
+@app.route("/auth/session", methods=["GET"])
+@require_session(session_tokens)
+def get_session():
+    return jsonify(g.session)
+
+@app.errorhandler(ReplicationError)
+def replication_failed(e):
+    return jsonify({"error": str(e)}), e.status
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    resp = jsonify({"error": "Password hashing is at capacity, retry shortly"})
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
 @app.route("/endpoints", methods=["GET"])
 def list_endpoints():
     endpoints = []
@@ -430,6 +1341,56 @@ def list_endpoints():
         })
     return jsonify(endpoints), 200
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe((request.method, route, str(response.status_code)),
+                                             time.perf_counter() - started)
+    return response
+
+@metrics.registry.collector
+def cluster_metrics():
+    now = time.monotonic()
+    channels = raft.channels if raft.state == "LEADER" else {}
+    election = raft.election_stats()
+    forwarding = forwarder.stats()
+    cache = response_cache.stats()
+    return [
+        ("ehr_raft_term", "gauge", "Current Raft term", [({}, raft.current_term)]),
+        ("ehr_raft_is_leader", "gauge", "1 if this node is the leader", [({}, raft.state == "LEADER")]),
+        ("ehr_raft_group_is_leader", "gauge", "1 if this node leads the Raft group",
+         [({"group": str(node.group)}, node.state == "LEADER") for node in raft_groups]),
+        ("ehr_raft_log_index", "gauge", "Raft log positions", [
+            ({"kind": "last"}, raft.log.last_index),
+            ({"kind": "commit"}, raft.commit_index),
+            ({"kind": "applied"}, raft.last_applied),
+            ({"kind": "snapshot"}, raft.log.base_index)
+        ]),
+        ("ehr_raft_elections_started_total", "counter", "Elections started by this node",
+         [({}, election["elections_started"])]),
+        ("ehr_raft_elections_won_total", "counter", "Elections won by this node",
+         [({}, election["elections_won"])]),
+        ("ehr_raft_heartbeat_lag_seconds", "gauge", "Time since each follower last acknowledged the leader",
+         [({"peer": name}, now - c.last_ack_at) for name, c in channels.items() if c.last_ack_at]),
+        ("ehr_raft_peer_match_index", "gauge", "Highest log index known to be replicated on each follower",
+         [({"peer": name}, c.match_index) for name, c in channels.items()]),
+        ("ehr_forwarded_requests_total", "counter", "Writes proxied from this follower to the leader",
+         [({"outcome": outcome}, count) for outcome, count in forwarding.items()]),
+        ("ehr_response_cache_lookups_total", "counter", "Response cache lookups",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        ("ehr_response_cache_bytes", "gauge", "Response bodies held in the cache", [({}, cache["bytes"])])
+    ]
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "healthy"}), 200
@@ -439,16 +1400,81 @@ def get_leader_info():
     return jsonify({
         "current_node": raft.node_id,
         "is_leader": raft.state == "LEADER",
-        "leader_id": raft.voted_for if raft.state == "FOLLOWER" else raft.node_id
+        "leader_id": raft.leader_id,
+        "term": raft.current_term,
+        "last_log_index": raft.log.last_index,
+        "commit_index": raft.commit_index,
+        "snapshot_index": raft.log.base_index,
+        "last_applied": raft.last_applied,
+        "election": raft.election_stats(),
+        "heartbeats": raft.heartbeat_stats(),
+        "forwarding": forwarder.stats(),
+        "response_cache": response_cache.stats(),
+        "groups": [{
+            "group": node.group,
+            "state": node.state,
+            "leader_id": node.leader_id,
+            "term": node.current_term,
+            "commit_index": node.commit_index,
+            "last_applied": node.last_applied,
+            "apply_error": node.apply_error
+        } for node in raft_groups]
     })
 
+def election_bias(group):
+    """Delay elections for groups this node is not the preferred leader of.
+
+    Preferred leaders are dealt round-robin over the sorted node ids, so a
+    healthy cluster spreads the group leaders (and their write load) over
+    every node; if the preferred node is down another one still takes over.
+    """
+    if len(raft_groups) == 1:
+        return 0.0
+    nodes = sorted({app.config["NODE_ID"]} | {p.split("=", 1)[0] for p in app.config["PEERS"] if "=" in p})
+    if nodes[group % len(nodes)] == app.config["NODE_ID"]:
+        return 0.0
+    return app.config["ELECTION_TIMEOUT_RANGE"][1] / 1000
+
+def snapshot_store(group):
+    directory = app.config["SNAPSHOT_DIR"]
+    if len(raft_groups) > 1:
+        directory = os.path.join(directory, f"group-{group}")
+    return SnapshotStore(app, directory, app.config["SNAPSHOT_CHUNK_BYTES"], group=group, groups=len(raft_groups))
+
 if __name__ == "__main__":
+    password_hasher.start()
+    raft_groups.configure(app.config["RAFT_GROUPS"])
     with app.app_context():
         db.create_all()
-        raft.init_node(
-            node_id=app.config.get("NODE_ID"),
-            node_url=app.config.get("NODE_URL"),
-            peer_list=app.config.get("PEERS", [])
-        )
-        raft.start_election_timer()
+        use_rpc = app.config["RAFT_TRANSPORT"] == "rpc"
+        # One transport for all groups: each peer keeps a single connection
+        rpc_transport = raft_rpc_transport() if use_rpc else None
+        for node in raft_groups:
+            node.init_node(
+                node_id=app.config.get("NODE_ID"),
+                node_url=app.config.get("NODE_URL"),
+                peer_list=app.config.get("PEERS", []),
+                log=SqlLog(app, node.group),
+                apply_commands=apply_commands,
+                auth_token=app.config.get("CLUSTER_AUTH_TOKEN"),
+                group_commit_window=app.config.get("GROUP_COMMIT_WINDOW_MS") / 1000,
+                group_commit_max=app.config.get("GROUP_COMMIT_MAX_BATCH"),
+                replication_acks=app.config.get("REPLICATION_ACKS"),
+                replication_timeout=app.config.get("REPLICATION_TIMEOUT"),
+                snapshots=snapshot_store(node.group),
+                snapshot_threshold=app.config.get("SNAPSHOT_THRESHOLD"),
+                snapshot_interval=app.config.get("SNAPSHOT_INTERVAL"),
+                snapshot_timeout=app.config.get("SNAPSHOT_INSTALL_TIMEOUT"),
+                heartbeat_interval=app.config.get("HEARTBEAT_INTERVAL"),
+                election_timeout_range=tuple(ms / 1000 for ms in app.config.get("ELECTION_TIMEOUT_RANGE")),
+                lease_ratio=app.config.get("LEASE_RATIO"),
+                max_inflight=app.config.get("APPEND_MAX_INFLIGHT"),
+                max_batch_bytes=app.config.get("APPEND_MAX_BATCH_BYTES"),
+                transport=rpc_transport,
+                election_bias=election_bias(node.group)
+            )
+        if use_rpc:
+            raft_rpc_server().start()
+        for node in raft_groups:
+            node.start_election_timer()
     app.run(host="0.0.0.0", port=5001)
\ No newline at end of file
@@ -0,0 +1,50 @@
+from flask import request, jsonify, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+
+
+class SessionTokens:
+    """Short-lived signed session tokens.
+
+    The token carries the user's cluster-wide uuid, role and hospital and is
+    signed with SECRET_KEY, so any node can verify it from the token alone -
+    no database lookup and no password hash per request.
+    """
+    def __init__(self, secret_key, ttl):
+        self.serializer = URLSafeTimedSerializer(secret_key, salt="ehr-session")
+        self.ttl = ttl
+
+    def issue(self, user):
+        return self.serializer.dumps({
+            "uuid": user.uuid,
+            "role_id": user.role_id,
+            "hospital_id": user.hospital_id
+        })
+
+    def verify(self, token):
+        """Return the session claims, or None if the token is invalid or expired."""
+        try:
+            return self.serializer.loads(token, max_age=self.ttl)
+        except (SignatureExpired, BadSignature):
+            return None
+
+
+def bearer_token():
+    header = request.headers.get("Authorization", "")
+    if header.startswith("Bearer "):
+        return header[len("Bearer "):].strip()
+    return None
+
+
+def require_session(tokens):
+    """Reject requests without a valid session token; the claims go to `g.session`."""
+    def decorator(f):
+        def wrapper(*args, **kwargs):
+            token = bearer_token()
+            claims = tokens.verify(token) if token else None
+            if claims is None:
+                return jsonify({"error": "Invalid or expired session token"}), 401
+            g.session = claims
+            return f(*args, **kwargs)
+        wrapper.__name__ = f.__name__
+        return wrapper
+    return decorator
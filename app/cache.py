@@ -0,0 +1,195 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request, make_response, g
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+
+class ResponseCache:
+    """Per-node LRU of rendered GET responses, validated by data versions.
+
+    Every table, and every row by primary key, has a version counter that
+    is bumped when a transaction touching it commits - whether the write
+    came from a local endpoint or a replicated apply. An entry remembers
+    the versions of what it was built from and is only served while they
+    are unchanged, so invalidation is exact and needs no TTL.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.versions = {}
+        # Bumped by clear(); fills that started before a clear are discarded
+        self.epoch = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, max_bytes):
+        self.max_bytes = max_bytes
+
+    def snapshot(self, deps):
+        with self.lock:
+            return (self.epoch,) + tuple(self.versions.get(d, 0) for d in deps)
+
+    def bump(self, keys):
+        with self.lock:
+            for key in keys:
+                self.versions[key] = self.versions.get(key, 0) + 1
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.epoch += 1
+
+    def get(self, key, deps):
+        version = self.snapshot(deps)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["version"] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry, version
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None, version
+
+    def put(self, key, version, body, mimetype):
+        if len(body) > self.max_bytes:
+            return None
+        entry = {
+            "version": version,
+            "body": body,
+            "mimetype": mimetype,
+            "etag": hashlib.sha1(body).hexdigest()
+        }
+        with self.lock:
+            if version[0] != self.epoch:
+                return entry
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+        return entry
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.size -= len(entry["body"])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+
+response_cache = ResponseCache()
+
+
+# Version key for "rows of this table changed by a bulk statement", which the
+# ORM cannot attribute to primary keys; per-row entries depend on it too
+ANY_ROW = "*"
+
+
+def _pending(session):
+    return session.info.setdefault("cache_dirty", set())
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_dirty(session, flush_context):
+    dirty = _pending(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        state = inspect(obj)
+        table = state.mapper.local_table.name
+        dirty.add(table)
+        if state.identity:
+            dirty.add((table,) + state.identity)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table.name
+        _pending(orm_execute_state.session).update((table, (table, ANY_ROW)))
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_dirty(session):
+    dirty = session.info.pop("cache_dirty", None)
+    if dirty:
+        response_cache.bump(dirty)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dirty(session):
+    session.info.pop("cache_dirty", None)
+
+
+def _etag_matches(etag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    # If-None-Match uses weak comparison
+    return "*" in tags or any(t.removeprefix("W/").strip('"') == etag for t in tags)
+
+
+def cached(*tables, item=None):
+    """Cache a GET view's 200 responses; answer If-None-Match with 304.
+
+    `tables` are the tables the response is built from. With `item` (a view
+    argument holding a primary key) the entry depends on that row of the
+    first table instead, so writes to other rows leave it valid.
+    """
+    def decorator(view):
+        def wrapper(*args, **kwargs):
+            if item is not None:
+                deps = ((tables[0], kwargs[item]), (tables[0], ANY_ROW)) + tuple(tables[1:])
+            else:
+                deps = tables
+            key = request.full_path
+            entry, version = response_cache.get(key, deps)
+            state = "HIT"
+            if entry is None:
+                state = "MISS"
+                resp = make_response(view(*args, **kwargs))
+                # Replica reads may lag the versions snapshotted above; don't cache them
+                if resp.status_code != 200 or g.get("db_replica"):
+                    return resp
+                entry = response_cache.put(key, version, resp.get_data(), resp.mimetype)
+                if entry is None:
+                    return resp
+
+            if _etag_matches(entry["etag"]):
+                response_cache.not_modified += 1
+                resp = make_response("", 304)
+            else:
+                resp = make_response(entry["body"], 200)
+                resp.mimetype = entry["mimetype"]
+            resp.set_etag(entry["etag"])
+            resp.headers["Cache-Control"] = "no-cache"
+            resp.headers["X-Cache"] = state
+            return resp
+
+        wrapper.__name__ = view.__name__
+        return wrapper
+    return decorator
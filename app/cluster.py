@@ -1,19 +1,308 @@
-import time, threading, random, requests
+import time, threading, random
+from concurrent.futures import ThreadPoolExecutor
+from raftlog import MemoryLog
+from transport import transport, required_acks
+from metrics import REPLICATION_RPC_SECONDS, REPLICATION_RPC_FAILURES
+
+# Back-off between snapshot installs to a follower that keeps failing
+SNAPSHOT_RETRY_SECONDS = 1.0
+# Back-off before retrying committed entries whose apply failed
+APPLY_RETRY_SECONDS = 0.5
+# Appended by every new leader: entries of earlier terms only commit along with
+# an entry of the leader's own term (Raft paper, section 5.4.2)
+NOOP_COMMAND = {"type": "NOOP"}
+
+class ReplicationError(Exception):
+    """A write that was not committed and applied through its Raft group's log."""
+
+    def __init__(self, message, status=503):
+        super().__init__(message)
+        self.status = status
+
+class PeerChannel:
+    """Long-lived replication and heartbeat loop for one follower.
+
+    One thread per peer for the lifetime of the process, reusing the peer's
+    persistent session. It tracks the follower's nextIndex/matchIndex and
+    keeps up to `max_inflight` AppendEntries batches (each at most
+    `max_batch_bytes`) in flight, advancing nextIndex optimistically as it
+    sends. A mismatch or error restarts the pipeline from the follower's
+    hint; responses from the abandoned pipeline are ignored via `generation`.
+
+    Heartbeats are only sent when no entries went out during the interval.
+    Deadlines are computed from a fixed schedule rather than "sleep(interval)
+    after sending", so send latency does not accumulate as drift; deadlines
+    that are overrun are counted and skipped instead of being sent in a burst.
+    """
+
+    def __init__(self, node, name, url):
+        self.node = node
+        self.name = name
+        self.url = url
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+        self.next_index = 1
+        self.match_index = 0
+        self.inflight = 0
+        self.generation = 0
+        # Leadership term this channel replicates for; every RPC it sends carries this term
+        self.term = 0
+        # Start of the latest AppendEntries that carried entries (it doubles as a heartbeat)
+        self.last_send_at = 0.0
+        self.snapshot_retry_at = 0.0
+        self.sent = 0
+        self.failures = 0
+        self.mismatches = 0
+        self.missed_deadlines = 0
+        self.last_latency_ms = None
+        self.max_latency_ms = 0.0
+        self.total_latency_ms = 0.0
+        # Send time of the latest request this peer acknowledged in our term (for leases)
+        self.last_ack_at = None
+        self.thread = threading.Thread(target=self.run, name=f"raft-peer-{node.group}-{name}", daemon=True)
+        self.thread.start()
+
+    def reset(self, term):
+        """Start replicating for a new leadership term."""
+        with self.lock:
+            self.term = term
+            self.next_index = self.node.log.last_index + 1
+            self.match_index = 0
+            self.inflight = 0
+            self.generation += 1
+            self.last_ack_at = None
+        self.wake.set()
+
+    def run(self):
+        interval = self.node.heartbeat_interval
+        next_deadline = None
+        while True:
+            if self.node.state != "LEADER" or self.term != self.node.current_term:
+                next_deadline = None
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            if next_deadline is None:
+                next_deadline = time.monotonic()
+
+            try:
+                self.pump()
+            except Exception as e:
+                print(f"Replication to {self.name} failed: {e}")
+
+            now = time.monotonic()
+            if now >= next_deadline:
+                if self.last_send_at <= next_deadline - interval:
+                    self.send_heartbeat()
+                behind = int((now - next_deadline) // interval)
+                self.missed_deadlines += behind
+                next_deadline += (behind + 1) * interval
+            self.wake.wait(max(next_deadline - time.monotonic(), 0))
+            self.wake.clear()
+
+    def pump(self):
+        """Dispatch AppendEntries batches until the pipeline window is full."""
+        node = self.node
+        while node.state == "LEADER":
+            with self.lock:
+                if self.inflight >= node.max_inflight or self.next_index > node.log.last_index:
+                    return
+                if self.next_index <= node.log.base_index:
+                    needs_snapshot = True
+                else:
+                    needs_snapshot = False
+                    prev_index = self.next_index - 1
+                    entries = node.log.entries_for_batch(self.next_index, node.max_batch_bytes)
+                    if not entries:
+                        return
+                    self.next_index = entries[-1]["index"] + 1
+                    self.inflight += 1
+                    generation = self.generation
+                term = self.term
+            if needs_snapshot:
+                if time.monotonic() >= self.snapshot_retry_at:
+                    self.install_snapshot(term)
+                return
+            node.io_pool.submit(self.send, term, prev_index, entries, generation, node.replication_timeout)
+
+    def send_heartbeat(self):
+        with self.lock:
+            prev_index = max(self.match_index or self.next_index - 1, self.node.log.base_index)
+            generation = self.generation
+            term = self.term
+        self.node.io_pool.submit(self.send, term, prev_index, [], generation, self.node.heartbeat_interval)
+
+    def send(self, term, prev_index, entries, generation, timeout):
+        # `term` is the term the batch was cut in: a send that outlives our leadership must not
+        # carry a newer term, or that term's real leader would accept our stale entries
+        node = self.node
+        started = time.monotonic()
+        if entries:
+            # Heartbeats start just after their deadline, so counting them would skip every other one
+            self.last_send_at = started
+        outcome = node.transport.post(self.name, self.url, "/raft/append_entries", {
+            "group": node.group,
+            "term": term,
+            "leader_id": node.node_id,
+            "prev_log_index": prev_index,
+            "prev_log_term": node.log.term_at(prev_index),
+            "entries": entries,
+            "leader_commit": node.commit_index
+        }, headers=node._headers(), timeout=timeout)
+        self.record(outcome)
+        if outcome.get("latency_ms") is not None:
+            REPLICATION_RPC_SECONDS.observe((self.name,), outcome["latency_ms"] / 1000)
+        if not outcome["ok"]:
+            REPLICATION_RPC_FAILURES.inc((self.name,))
+
+        body = outcome.get("body") or {}
+        if body.get("term", 0) > term:
+            with node.lock:
+                node._step_down(body["term"])
+            return
+
+        with self.lock:
+            current = generation == self.generation
+            if current and entries:
+                self.inflight -= 1
+            acked = outcome["ok"] and body.get("success") and term == self.term
+            if acked:
+                if node.state == "LEADER" and node.current_term == term:
+                    self.last_ack_at = max(self.last_ack_at or 0, started)
+                self.match_index = max(self.match_index, body.get("match_index", prev_index))
+                self.next_index = max(self.next_index, self.match_index + 1)
+            elif current and (outcome["ok"] or entries):
+                if outcome["ok"]:
+                    # Log mismatch: jump straight to the follower's hint instead of stepping back one by one
+                    self.mismatches += 1
+                    hint = body.get("last_index", prev_index - 1)
+                    self.next_index = max(min(hint, prev_index - 1) + 1, 1)
+                else:
+                    # Lost batch: resend everything the follower has not confirmed
+                    self.next_index = self.match_index + 1
+                self.inflight = 0
+                self.generation += 1
+        if acked:
+            node.advance_commit_index()
+        self.wake.set()
+
+    def install_snapshot(self, term):
+        outcome, index = self.node._send_snapshot(self.name, self.url, term)
+        self.record(outcome)
+        if index is None:
+            self.snapshot_retry_at = time.monotonic() + SNAPSHOT_RETRY_SECONDS
+        else:
+            with self.lock:
+                if term != self.term:
+                    return
+                self.match_index = max(self.match_index, index)
+                self.next_index = self.match_index + 1
+                self.inflight = 0
+                self.generation += 1
+            self.node.advance_commit_index()
+
+    def record(self, outcome):
+        self.sent += 1
+        if not outcome["ok"]:
+            self.failures += 1
+        latency = outcome.get("latency_ms")
+        if latency is not None:
+            self.last_latency_ms = latency
+            self.total_latency_ms += latency
+            self.max_latency_ms = max(self.max_latency_ms, latency)
+
+    def stats(self):
+        return {
+            "next_index": self.next_index,
+            "match_index": self.match_index,
+            "inflight": self.inflight,
+            "sent": self.sent,
+            "failures": self.failures,
+            "mismatches": self.mismatches,
+            "missed_deadlines": self.missed_deadlines,
+            "last_latency_ms": self.last_latency_ms,
+            "avg_latency_ms": round(self.total_latency_ms / self.sent, 2) if self.sent else None,
+            "max_latency_ms": self.max_latency_ms
+        }
 
 class RaftNode:
-    def __init__(self):
+    def __init__(self, group=0):
+        # Raft group this node is a member of; every RPC it sends names the group
+        self.group = group
         self.node_id = None
         self.node_url = None
         self.state = "FOLLOWER"
         self.current_term = 0
         self.voted_for = None
-        self.log = []
+        # Leader of the current term, learned from its AppendEntries (None while unknown)
+        self.leader_id = None
+        self.leader_cond = threading.Condition()
+        # When we last accepted AppendEntries or InstallSnapshot from that leader (monotonic)
+        self.leader_contact_at = None
+        self.log = MemoryLog()
         self.commit_index = 0
-        self.peers = {} 
-        self.heartbeat_timer = None
+        self.last_applied = 0
+        self.peers = {}
+        self.channels = {}
+        self.heartbeat_interval = 0.05
+        self.election_timeout_range = (0.15, 0.3)
+        # Added to every election timeout; lets a group's preferred leader time out first
+        self.election_bias = 0.0
+        self.election_deadline = None
+        self.election_cond = threading.Condition()
+        self.election_thread = None
         self.lock = threading.Lock()
+        self.apply_lock = threading.Lock()
+        self.applied_cond = threading.Condition(self.apply_lock)
+        self.applier = None
+        # Last error raised by apply_commands, cleared once the entries apply
+        self.apply_error = None
+        # Index -> waiter of our own proposals, handed the state machine's result when applied
+        self.applying = {}
+        # Fraction of the minimum election timeout a leader lease is trusted for
+        self.lease_ratio = 0.8
+        self.apply_commands = None
+        self.auth_token = None
+        # Peer RPC transport (HTTP by default; see rpc.RpcTransport)
+        self.transport = transport
+
+        # Group commit: proposals queued while a batch is being persisted and
+        # replicated are written together as the next batch.
+        self.proposals = []
+        self.propose_cond = threading.Condition()
+        self.committer = None
+        self.group_commit_window = 0.002
+        self.group_commit_max = 256
+        self.replication_acks = "majority"
+        self.replication_timeout = 1.0
+        self.commit_cond = threading.Condition()
+
+        # AppendEntries pipeline
+        self.max_inflight = 4
+        self.max_batch_bytes = 1024 * 1024
+        self.io_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix=f"raft-io-{group}")
+
+        # Log compaction / InstallSnapshot
+        self.snapshots = None
+        self.snapshot_threshold = 10000
+        self.snapshot_interval = 30.0
+        self.snapshot_timeout = 30.0
+        self.snapshot_inflight = set()
+
+        # Election instrumentation
+        self.vote_timeout = 0.1
+        self.election_started_at = None
+        self.election_rounds = 0
+        self.elections_started = 0
+        self.elections_won = 0
+        self.last_election = None
 
-    def init_node(self, node_id, node_url, peer_list):
+    def init_node(self, node_id, node_url, peer_list, log=None, apply_commands=None, auth_token=None,
+                  group_commit_window=0.002, group_commit_max=256, replication_acks="majority",
+                  replication_timeout=1.0, snapshots=None, snapshot_threshold=10000,
+                  snapshot_interval=30.0, snapshot_timeout=30.0, heartbeat_interval=0.05,
+                  election_timeout_range=(0.15, 0.3), lease_ratio=0.8, max_inflight=4,
+                  max_batch_bytes=1024 * 1024, transport=None, election_bias=0.0):
         """Initialize node with config values so it doesn't need Flask context later."""
         self.node_id = node_id
         self.node_url = node_url
@@ -21,52 +310,658 @@ class RaftNode:
             if p and "=" in p:
                 name, url = p.split("=")
                 self.peers[name] = url
+        self.apply_commands = apply_commands
+        self.auth_token = auth_token
+        self.group_commit_window = group_commit_window
+        self.group_commit_max = group_commit_max
+        self.replication_acks = replication_acks
+        self.replication_timeout = replication_timeout
+        self.snapshots = snapshots
+        self.snapshot_threshold = snapshot_threshold
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_timeout = snapshot_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.election_timeout_range = election_timeout_range
+        self.election_bias = election_bias
+        self.lease_ratio = lease_ratio
+        self.max_inflight = max_inflight
+        self.max_batch_bytes = max_batch_bytes
+        if transport is not None:
+            self.transport = transport
+
+        if log is not None:
+            self.log = log
+        meta = self.log.load_meta()
+        self.current_term = max(meta["current_term"], self.log.last_term)
+        self.voted_for = meta["voted_for"]
+        # Everything up to last_applied (and the snapshot) is already reflected in the local DB
+        self.last_applied = self.commit_index = max(min(meta["last_applied"], self.log.last_index), self.log.base_index)
+
+        if self.snapshots is not None:
+            threading.Thread(target=self._snapshot_loop, name=f"raft-snapshot-{self.group}", daemon=True).start()
+        if self.apply_commands is not None and self.applier is None:
+            self.applier = threading.Thread(target=self._apply_loop, name=f"raft-apply-{self.group}", daemon=True)
+            self.applier.start()
+
+    @property
+    def label(self):
+        """Node id, qualified with the group when there is more than one."""
+        return f"{self.node_id}/g{self.group}" if self.group else self.node_id
+
+    def _headers(self):
+        return {"X-Cluster-Auth": self.auth_token} if self.auth_token else None
+
+    def _step_down(self, term):
+        """Adopt a newer term as follower. Caller holds self.lock."""
+        if term > self.current_term:
+            self.current_term = term
+            self.voted_for = None
+            self.log.save_meta(current_term=term, voted_for=None)
+            self._set_leader(None)
+        if self.state == "LEADER":
+            # become_leader stopped the election timer; a deposed leader must be able to campaign again
+            self.start_election_timer()
+        self.state = "FOLLOWER"
+        with self.commit_cond:
+            self.commit_cond.notify_all()
+
+    def _set_leader(self, leader_id):
+        if leader_id != self.leader_id:
+            with self.leader_cond:
+                self.leader_id = leader_id
+                self.leader_cond.notify_all()
+
+    def wait_for_leader(self, timeout, exclude=None):
+        """Return the id of a known leader other than `exclude`, waiting up to `timeout`."""
+        with self.leader_cond:
+            self.leader_cond.wait_for(lambda: self.leader_id not in (None, exclude), timeout)
+            return self.leader_id if self.leader_id != exclude else None
+
+    def election_stats(self):
+        return {
+            "elections_started": self.elections_started,
+            "elections_won": self.elections_won,
+            "last_election": self.last_election
+        }
+
+    # ELECTIONS
 
     def start_election_timer(self):
-        if self.heartbeat_timer: self.heartbeat_timer.cancel()
-        timeout = random.uniform(0.15, 0.3)
-        self.heartbeat_timer = threading.Timer(timeout, self.become_candidate)
-        self.heartbeat_timer.start()
+        """(Re)arm the election timeout.
+
+        Only moves a deadline; a single long-lived thread waits on it, so
+        followers do not spawn a Timer thread for every heartbeat received.
+        """
+        with self.election_cond:
+            self.election_deadline = time.monotonic() + random.uniform(*self.election_timeout_range) + self.election_bias
+            if self.election_thread is None:
+                self.election_thread = threading.Thread(target=self._election_loop, name=f"raft-election-{self.group}",
+                                                        daemon=True)
+                self.election_thread.start()
+            self.election_cond.notify()
+
+    def stop_election_timer(self):
+        with self.election_cond:
+            self.election_deadline = None
+            self.election_cond.notify()
+
+    def _election_loop(self):
+        while True:
+            with self.election_cond:
+                while self.election_deadline is None or time.monotonic() < self.election_deadline:
+                    if self.election_deadline is None:
+                        self.election_cond.wait()
+                    else:
+                        self.election_cond.wait(self.election_deadline - time.monotonic())
+                self.election_deadline = None
+            try:
+                self.become_candidate()
+            except Exception as e:
+                print(f"Election round failed on {self.label}: {e}")
 
     def become_candidate(self):
         with self.lock:
+            if self.state == "LEADER":
+                return
+            if self.election_started_at is None:
+                # First round since we lost the leader: time-to-leader starts here
+                self.election_started_at = time.monotonic()
+                self.election_rounds = 0
+            self.election_rounds += 1
+            self.elections_started += 1
             self.state = "CANDIDATE"
             self.current_term += 1
             self.voted_for = self.node_id # Use self instead of current_app
-            print(f"Node {self.node_id} becoming Candidate for Term {self.current_term}")
-        
-        votes = 1 
-        for name, url in self.peers.items():
-            try:
-                resp = requests.post(f"{url}/raft/request_vote", json={
-                    "term": self.current_term,
-                    "candidate_id": self.node_id
-                }, timeout=0.1)
-                if resp.json().get("vote_granted"): votes += 1
-            except: pass
-        
-        if votes > (len(self.peers) + 1) / 2:
-            self.become_leader()
-        else:
-            self.start_election_timer()
+            self.log.save_meta(current_term=self.current_term, voted_for=self.node_id)
+            self._set_leader(None)
+            term = self.current_term
+            request_body = {
+                "group": self.group,
+                "term": term,
+                "candidate_id": self.node_id,
+                "last_log_index": self.log.last_index,
+                "last_log_term": self.log.last_term
+            }
+            print(f"Node {self.label} becoming Candidate for Term {term}")
+        # Re-arm the timer now so a lost round retries with a fresh randomized timeout
+        self.start_election_timer()
 
-    def become_leader(self):
+        def request_vote(name, url):
+            outcome = self.transport.post(name, url, "/raft/request_vote", request_body,
+                                     headers=self._headers(), timeout=self.vote_timeout)
+            body = outcome.get("body") or {}
+            if body.get("term", 0) > term:
+                with self.lock:
+                    self._step_down(body["term"])
+            outcome["ok"] = bool(outcome["ok"] and body.get("vote_granted"))
+            return outcome
+
+        # Votes are requested concurrently; we return as soon as a majority has granted
+        result = self.transport.fan_out(self.peers, request_vote, timeout=self.vote_timeout, acks="majority")
+        if result["quorum"]:
+            self.become_leader(term)
+
+    def handle_request_vote(self, data):
+        term = data.get("term")
         with self.lock:
+            if term > self.current_term and self._leader_alive():
+                # A node that lost touch (or was partitioned away) must not depose a live
+                # leader; neither the vote nor the term is taken up (Raft thesis §4.2.3)
+                return {"term": self.current_term, "vote_granted": False}
+            if term > self.current_term:
+                self._step_down(term)
+            # Only vote for candidates whose log is at least as up-to-date as ours
+            up_to_date = (data.get("last_log_term", 0), data.get("last_log_index", 0)) >= \
+                (self.log.last_term, self.log.last_index)
+            granted = False
+            if term == self.current_term and up_to_date and \
+                    (self.voted_for is None or self.voted_for == data.get("candidate_id")):
+                self.voted_for = data.get("candidate_id")
+                self.log.save_meta(voted_for=self.voted_for)
+                granted = True
+                self.start_election_timer()
+            return {"term": self.current_term, "vote_granted": granted}
+
+    def _leader_alive(self):
+        """True within the minimum election timeout of hearing from the current leader.
+
+        No candidate can win a vote from us in that window, which is what
+        makes the leader's lease (lease_valid) safe. A leader counts itself
+        alive while its lease holds.
+        """
+        if self.state == "LEADER":
+            return self.lease_valid()
+        return self.leader_contact_at is not None and \
+            time.monotonic() - self.leader_contact_at < self.election_timeout_range[0]
+
+    def become_leader(self, term):
+        with self.lock:
+            if self.state != "CANDIDATE" or self.current_term != term:
+                return
             self.state = "LEADER"
-            print(f"--- Node {self.node_id} ELECTED LEADER ---")
-        self.send_heartbeats()
+            self._set_leader(self.node_id)
+            self.stop_election_timer()
+            self.elections_won += 1
+            self.last_election = {
+                "term": term,
+                "rounds": self.election_rounds,
+                "time_to_leader_ms": round((time.monotonic() - self.election_started_at) * 1000, 2)
+            }
+            self.election_started_at = None
+            print(f"--- Node {self.label} ELECTED LEADER ({self.last_election['time_to_leader_ms']} ms, "
+                  f"{self.last_election['rounds']} round(s)) ---")
+        self.start_heartbeats(term)
+        # Our log may end in entries of earlier terms that no majority stores yet. They are
+        # committed (and applied) only once this no-op from our own term is.
+        self._enqueue(NOOP_COMMAND)
 
-    def send_heartbeats(self):
-        if self.state != "LEADER": return
+    def start_heartbeats(self, term):
         for name, url in self.peers.items():
+            if name not in self.channels:
+                self.channels[name] = PeerChannel(self, name, url)
+            self.channels[name].reset(term)
+
+    def heartbeat_stats(self):
+        return {name: channel.stats() for name, channel in self.channels.items()}
+
+    # LOG REPLICATION
+
+    def propose(self, command, timeout=None):
+        """Append `command` to the replicated log and wait until it is committed and applied.
+
+        Only valid on the leader. Concurrent proposals are group-committed
+        into one log transaction; the peer channels then stream the entries
+        to followers and the commit index advances as a majority matches.
+        The leader applies its own entries like any follower, so once
+        "applied" is set the local DB reflects the write; "result" is what
+        apply_commands returned for it.
+        """
+        timeout = timeout or self.replication_timeout * 2
+        waiter = self._enqueue(command)
+        if not waiter["appended"].wait(timeout):
+            return {"committed": False, "error": "Timed out appending to the log"}
+        if waiter["error"]:
+            return {"committed": False, "error": waiter["error"]}
+
+        index, term = waiter["index"], waiter["term"]
+        required = required_acks(self.replication_acks, len(self.peers))
+        with self.commit_cond:
+            self.commit_cond.wait_for(
+                lambda: self.current_term != term or
+                (self.commit_index >= index and self._acked(index) >= required),
+                timeout
+            )
+        committed = self.commit_index >= index and self.current_term == term
+        if committed:
+            with self.applied_cond:
+                self.applied_cond.wait_for(lambda: waiter.get("applied") or self.last_applied >= index, timeout)
+        self.applying.pop(index, None)
+        return {
+            "committed": committed,
+            "applied": waiter.get("applied", False),
+            "result": waiter.get("result"),
+            "term": term,
+            "index": index,
+            "replication": {name: {"match_index": c.match_index, "last_latency_ms": c.last_latency_ms}
+                            for name, c in self.channels.items()}
+        }
+
+    def _enqueue(self, command):
+        """Queue `command` for the next group-committed batch; returns its waiter."""
+        waiter = {"command": command, "appended": threading.Event(), "index": None, "term": None, "error": None}
+        with self.propose_cond:
+            if self.committer is None:
+                self.committer = threading.Thread(target=self._group_commit_loop, name=f"raft-commit-{self.group}",
+                                                  daemon=True)
+                self.committer.start()
+            self.proposals.append(waiter)
+            self.propose_cond.notify()
+        return waiter
+
+    def _acked(self, index):
+        return sum(1 for c in self.channels.values() if c.match_index >= index)
+
+    def _group_commit_loop(self):
+        while True:
+            with self.propose_cond:
+                while not self.proposals:
+                    self.propose_cond.wait()
+                # Give concurrent writers a short window to join this batch
+                deadline = time.monotonic() + self.group_commit_window
+                while len(self.proposals) < self.group_commit_max:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.propose_cond.wait(remaining)
+                batch = self.proposals[:self.group_commit_max]
+                del self.proposals[:self.group_commit_max]
+
             try:
-                requests.post(f"{url}/raft/append_entries", json={
-                    "term": self.current_term,
+                self._append_batch(batch)
+            except Exception as e:
+                for w in batch:
+                    w["error"] = str(e)
+            for w in batch:
+                w["appended"].set()
+
+    def _append_batch(self, batch):
+        with self.lock:
+            if self.state != "LEADER":
+                for w in batch:
+                    w["error"] = "Not the leader"
+                return
+            term = self.current_term
+            first = self.log.last_index + 1
+            entries = [{"term": term, "index": first + i, "command": w["command"]} for i, w in enumerate(batch)]
+            self.log.append(entries)
+            for w, e in zip(batch, entries):
+                w["index"], w["term"] = e["index"], term
+                self.applying[e["index"]] = w
+        for channel in self.channels.values():
+            channel.wake.set()
+        self.advance_commit_index()
+
+    def advance_commit_index(self):
+        """Commit the highest index stored on a majority (the median matchIndex)."""
+        with self.lock:
+            if self.state != "LEADER":
+                return
+            matches = sorted([self.log.last_index] + [self.channels[name].match_index
+                                                      for name in self.peers if name in self.channels],
+                             reverse=True)
+            matches += [0] * (len(self.peers) + 1 - len(matches))
+            candidate = matches[(len(self.peers) + 1) // 2]
+            # Only entries from our own term are committed by counting replicas
+            if candidate > self.commit_index and self.log.term_at(candidate) == self.current_term:
+                self.commit_index = candidate
+        with self.commit_cond:
+            self.commit_cond.notify_all()
+
+    def handle_append_entries(self, data):
+        with self.lock:
+            term = data.get("term")
+            if term < self.current_term:
+                return {"term": self.current_term, "success": False, "last_index": self.log.last_index}
+            self._step_down(term)
+            self._set_leader(data.get("leader_id"))
+            self.leader_contact_at = time.monotonic()
+            self.election_started_at = None
+            self.start_election_timer()
+
+            prev_index = data.get("prev_log_index", 0)
+            prev_term = data.get("prev_log_term", 0)
+            entries = data.get("entries", [])
+            if prev_index < self.log.base_index:
+                # Everything up to our snapshot is committed and therefore matches
+                entries = [e for e in entries if e["index"] > self.log.base_index]
+                prev_index, prev_term = self.log.base_index, self.log.base_term
+            if prev_index > self.log.last_index or self.log.term_at(prev_index) != prev_term:
+                return {"term": self.current_term, "success": False, "last_index": min(self.log.last_index, prev_index - 1)}
+
+            new_entries = []
+            for entry in entries:
+                if new_entries or entry["index"] > self.log.last_index:
+                    new_entries.append(entry)
+                elif self.log.term_at(entry["index"]) != entry["term"]:
+                    # Conflicting uncommitted suffix from an old leader: drop it
+                    self.log.truncate_from(entry["index"])
+                    new_entries.append(entry)
+            self.log.append(new_entries)
+
+            match_index = prev_index + len(entries)
+            if data.get("leader_commit", 0) > self.commit_index:
+                self.commit_index = min(data["leader_commit"], match_index)
+        with self.commit_cond:
+            self.commit_cond.notify_all()
+        return {"term": self.current_term, "success": True, "match_index": match_index}
+
+    # SNAPSHOTS
+
+    def _snapshot_loop(self):
+        while True:
+            time.sleep(self.snapshot_interval)
+            if self.last_applied - self.log.base_index >= self.snapshot_threshold:
+                try:
+                    self.take_snapshot()
+                except Exception as e:
+                    print(f"Snapshot failed on {self.label}: {e}")
+
+    def take_snapshot(self):
+        """Dump the applied state and drop the log entries it covers.
+
+        The database only ever changes by applying entries, so reading
+        last_applied and opening the dump's read transaction under apply_lock
+        gives a view of exactly the state through last_applied. The rows are
+        streamed after the lock is released, so applying is only paused for
+        that moment rather than for the whole dump.
+        """
+        def position():
+            index = self.last_applied
+            term = self.log.term_at(index)
+            if index <= self.log.base_index or term is None:
+                return None
+            return index, term
+
+        created = self.snapshots.create(self.apply_lock, position)
+        if created is None:
+            return None
+        index, term, path = created
+        with self.lock:
+            if index <= self.log.base_index:
+                return None
+            self.log.compact(index, term)
+        print(f"Node {self.label} snapshotted through index {index} ({path})")
+        return index
+
+    def _send_snapshot(self, name, url, term):
+        """Stream the latest snapshot to a follower chunk by chunk.
+
+        Returns (outcome, last_included_index).
+        """
+        latest = self.snapshots.latest() if self.snapshots else None
+        if latest is None:
+            return {"ok": False, "status": None, "error": "No snapshot available", "latency_ms": None}, None
+        index, snapshot_term, path = latest
+        if name in self.snapshot_inflight:
+            return {"ok": False, "status": None, "error": "Snapshot install in progress", "latency_ms": None}, None
+
+        self.snapshot_inflight.add(name)
+        try:
+            print(f"Sending group {self.group} snapshot through index {index} to {name}")
+            for offset, data, done in self.snapshots.read_chunks(path):
+                outcome = self.transport.post(name, url, "/raft/install_snapshot", {
+                    "group": self.group,
+                    "term": term,
                     "leader_id": self.node_id,
-                    "commit_index": self.commit_index
-                }, timeout=0.05)
-            except: pass
-        # Schedule next heartbeat
-        threading.Timer(0.05, self.send_heartbeats).start()
+                    "last_included_index": index,
+                    "last_included_term": snapshot_term,
+                    "offset": offset,
+                    "data": data,
+                    "done": done
+                }, headers=self._headers(), timeout=self.snapshot_timeout)
+                body = outcome.get("body") or {}
+                if not outcome["ok"] or not body.get("success"):
+                    outcome["ok"] = False
+                    return outcome, None
+            return outcome, index
+        finally:
+            self.snapshot_inflight.discard(name)
+
+    def handle_install_snapshot(self, data):
+        with self.lock:
+            if data.get("term") < self.current_term:
+                return {"term": self.current_term, "success": False}
+            self._step_down(data["term"])
+            self._set_leader(data.get("leader_id"))
+            self.leader_contact_at = time.monotonic()
+            self.election_started_at = None
+            self.start_election_timer()
+
+        index, term = data["last_included_index"], data["last_included_term"]
+        self.snapshots.write_chunk(index, term, data["offset"], data["data"])
+        if not data.get("done"):
+            return {"term": self.current_term, "success": True}
+
+        with self.apply_lock:
+            if index > self.last_applied:
+                self.snapshots.finish_install(index, term)
+                with self.lock:
+                    self.log.compact(index, term)
+                    self.commit_index = max(self.commit_index, index)
+                self.last_applied = index
+                self.log.save_meta(last_applied=index)
+                self.applied_cond.notify_all()
+                print(f"Node {self.label} installed snapshot through index {index}")
+        return {"term": self.current_term, "success": True, "last_index": self.log.last_index}
+
+    def _apply_loop(self):
+        """Apply entries as they commit, on the leader and followers alike."""
+        while True:
+            with self.commit_cond:
+                self.commit_cond.wait_for(lambda: self.commit_index > self.last_applied)
+            try:
+                applied = self.apply_committed()
+            except Exception as e:
+                self.apply_error = str(e)
+                print(f"Applying entries after index {self.last_applied} failed on {self.label}, retrying: {e}")
+                applied = False
+            if not applied:
+                time.sleep(APPLY_RETRY_SECONDS)
+
+    def apply_committed(self):
+        """Apply committed log entries to the state machine, in index order.
+
+        If apply_commands raises, last_applied stays where it was and the
+        same entries are applied again on the next call; an entry is never
+        skipped. apply_commands turns errors every replica would repeat into
+        per-entry rejections, so only transient ones reach the retry.
+        Returns True if any entries were applied.
+        """
+        with self.apply_lock:
+            if self.last_applied >= self.commit_index or self.apply_commands is None:
+                return False
+            entries = self.log.entries_from(self.last_applied + 1, self.commit_index - self.last_applied)
+            if not entries:
+                return False
+            results = self.apply_commands([e["command"] for e in entries]) or [None] * len(entries)
+            self.last_applied = entries[-1]["index"]
+            self.log.save_meta(last_applied=self.last_applied)
+            for entry, result in zip(entries, results):
+                waiter = self.applying.pop(entry["index"], None)
+                if waiter is not None and waiter["term"] == entry["term"]:
+                    waiter["result"], waiter["applied"] = result, True
+            self.apply_error = None
+            self.applied_cond.notify_all()
+            return True
+
+    # CONSISTENT READS
+
+    def lease_valid(self):
+        """True while a majority acked heartbeats sent within the lease window.
+
+        Followers refuse to vote for the minimum election timeout after
+        hearing from us (_leader_alive), and acks carry the time the request
+        was sent, so until then no other node can have been elected.
+        """
+        if self.state != "LEADER":
+            return False
+        needed = (len(self.peers) + 1) // 2
+        if needed == 0:
+            return True
+        acks = sorted((c.last_ack_at for c in self.channels.values() if c.last_ack_at), reverse=True)
+        if len(acks) < needed:
+            return False
+        return time.monotonic() < acks[needed - 1] + self.election_timeout_range[0] * self.lease_ratio
+
+    def confirm_leadership(self, timeout):
+        """ReadIndex: return our commit index once a majority confirms we still lead."""
+        with self.lock:
+            if self.state != "LEADER":
+                return None
+            term = self.current_term
+            read_index = self.commit_index
+
+        def heartbeat(name, url):
+            outcome = self.transport.post(name, url, "/raft/append_entries", {
+                "group": self.group,
+                "term": term,
+                "leader_id": self.node_id,
+                "prev_log_index": self.log.last_index,
+                "prev_log_term": self.log.last_term,
+                "entries": [],
+                "leader_commit": self.commit_index
+            }, headers=self._headers(), timeout=timeout)
+            body = outcome.get("body") or {}
+            outcome["ok"] = bool(outcome["ok"] and body.get("term") == term)
+            return outcome
+
+        result = self.transport.fan_out(self.peers, heartbeat, timeout=timeout, acks="majority")
+        if not result["quorum"] or self.current_term != term:
+            return None
+        return read_index
+
+    def read_index(self, mode, timeout):
+        """Leader side of a read barrier; lease mode skips the confirmation round."""
+        term = self.current_term
+        with self.commit_cond:
+            # Until our no-op commits, commit_index may lag writes earlier leaders acknowledged
+            self.commit_cond.wait_for(lambda: self.state != "LEADER" or self.current_term != term or
+                                      self.log.term_at(self.commit_index) == term, timeout)
+        if self.state != "LEADER" or self.current_term != term or self.log.term_at(self.commit_index) != term:
+            return None
+        if mode == "lease" and self.lease_valid():
+            return self.commit_index
+        return self.confirm_leadership(timeout)
+
+    def handle_read_index(self, data):
+        index = self.read_index(data.get("mode", "linearizable"), self.replication_timeout)
+        if index is None:
+            return {"success": False, "term": self.current_term, "leader_id": self.leader_id}
+        return {"success": True, "term": self.current_term, "read_index": index}
+
+    def read_barrier(self, mode, timeout):
+        """Block until local state reflects every write committed before the call.
+
+        Returns None on success or an error message. On the leader the read
+        index comes from a lease or a heartbeat round; followers ask the
+        leader for it and then wait until they have applied that far.
+        """
+        if self.state == "LEADER":
+            index = self.read_index(mode, timeout)
+        else:
+            leader_id = self.leader_id
+            leader_url = self.peers.get(leader_id)
+            if not leader_url:
+                return "No leader elected in the cluster"
+            outcome = self.transport.post(leader_id, leader_url, "/raft/read_index", {"group": self.group, "mode": mode},
+                                     headers=self._headers(), timeout=timeout)
+            body = outcome.get("body") or {}
+            index = body.get("read_index") if body.get("success") else None
+        if index is None:
+            return "Could not confirm the leader's commit index"
+        if not self.wait_for_applied(index, timeout):
+            return f"Timed out applying up to index {index}"
+        return None
+
+    def wait_for_term_applied(self, timeout):
+        """Block until this leader has applied an entry of its own term (its no-op).
+
+        From then on the local DB reflects every entry earlier leaders
+        committed. Returns False on timeout or if leadership was lost.
+        """
+        term = self.current_term
+
+        def ready():
+            return self.state == "LEADER" and self.current_term == term and \
+                self.log.term_at(self.last_applied) == term
+
+        with self.applied_cond:
+            self.applied_cond.wait_for(lambda: ready() or self.state != "LEADER", timeout)
+            return ready()
+
+    def wait_for_applied(self, index, timeout):
+        """Block until this node has applied through `index`; False on timeout."""
+        with self.applied_cond:
+            return self.applied_cond.wait_for(lambda: self.last_applied >= index, timeout)
+
+class RaftGroups:
+    """This node's member of every Raft group, indexed by group number.
+
+    Group 0 replicates the shared tables (hospitals, roles, users). Patients
+    and their clinical records are hash-partitioned across all groups (see
+    partition.py), so each group has its own log and leader and writes to
+    different partitions do not serialize behind one another.
+    """
+
+    def __init__(self):
+        self.nodes = [RaftNode()]
+
+    def configure(self, count):
+        """Create the members of groups 1..count-1 (group 0 always exists)."""
+        self.nodes += [RaftNode(group=group) for group in range(len(self.nodes), count)]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, group):
+        return self.nodes[group]
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def led(self):
+        """Groups this node currently leads."""
+        return [node.group for node in self.nodes if node.state == "LEADER"]
+
+    def dispatch(self, handler):
+        """Return an RPC handler that routes a payload to the member of the group it names."""
+        def handle(data):
+            group = data.get("group", 0)
+            if not isinstance(group, int) or not 0 <= group < len(self.nodes):
+                return {"term": 0, "success": False, "vote_granted": False, "error": f"Unknown Raft group {group}"}
+            return getattr(self.nodes[group], handler)(data)
+        return handle
 
-raft = RaftNode()
\ No newline at end of file
+raft_groups = RaftGroups()
+# Group 0, which owns the shared tables; also the only group when RAFT_GROUPS is 1
+raft = raft_groups[0]
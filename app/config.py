@@ -1,11 +1,65 @@
 import os
 
+def engine_options(url):
+    """SQLAlchemy engine settings for one database URL.
+
+    Pool sizing only applies to server databases: SQLite picks its own
+    pool class, and in-memory SQLite rejects these arguments.
+    """
+    options = {
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    }
+    if not url.startswith("sqlite"):
+        options.update({
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+            "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30))
+        })
+    return options
+
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")
     ENCRYPTION_KEY = os.environ.get("ENCRYPTION_KEY", "dev-encryption-key-32-bytes-long!")
+    # HMAC key for the searchable blind-index columns on patient PII
+    BLIND_INDEX_KEY = os.environ.get("BLIND_INDEX_KEY", "dev-blind-index-key")
+    # Worker threads used by Encryptor.decrypt_many for batched reads
+    DECRYPT_WORKERS = int(os.environ.get("DECRYPT_WORKERS", os.cpu_count() or 1))
+    DECRYPT_BATCH_MIN = int(os.environ.get("DECRYPT_BATCH_MIN", 64))
+    # Password hashing process pool: workers, max queued+running hashes, and
+    # how long a request waits for a free slot before getting a 503
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 4 * (os.cpu_count() or 1)))
+    PASSWORD_HASH_WAIT = float(os.environ.get("PASSWORD_HASH_WAIT", 2.0))
+    # Lifetime of /auth/login session tokens, in seconds
+    SESSION_TTL = int(os.environ.get("SESSION_TTL", 900))
     
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///ehr.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool per engine: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    # DB_POOL_RECYCLE (seconds) and DB_POOL_PRE_PING
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    # Optional read-only replicas of this node's database (comma-separated URLs).
+    # Stale-mode GETs are spread across them; writes and Raft applies
+    # always use the primary.
+    DATABASE_REPLICA_URLS = [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+    SQLALCHEMY_BINDS = {f"replica{i}": dict(engine_options(url), url=url)
+                        for i, url in enumerate(DATABASE_REPLICA_URLS, 1)}
+    # After a write, the client's reads stay on the primary this long (replica lag allowance)
+    DB_REPLICA_STICKY_SECONDS = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", 5))
+
+    # List endpoint pagination
+    PAGE_SIZE_DEFAULT = int(os.environ.get("PAGE_SIZE_DEFAULT", 100))
+    PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX", 1000))
+
+    # Max buckets one /vitals response may return
+    VITALS_MAX_POINTS = int(os.environ.get("VITALS_MAX_POINTS", 5000))
+
+    # Records per transaction (and per replicated log entry) on the /bulk endpoints
+    BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 1000))
+
+    # Memory budget for the per-node GET response cache (LRU)
+    RESPONSE_CACHE_BYTES = int(os.environ.get("RESPONSE_CACHE_BYTES", 64 * 1024 * 1024))
 
     # Cluster/Raft Settings
     NODE_ID = os.environ.get("NODE_ID", "node1")
@@ -13,7 +67,55 @@ class Config:
     # Comma-separated list: node1=http://node1:5001,node2=http://node2:5001
     PEERS = os.environ.get("PEERS", "").split(",") 
     CLUSTER_AUTH_TOKEN = os.environ.get("CLUSTER_AUTH_TOKEN", "dev-token")
+
+    # Independent Raft groups. Group 0 owns hospitals, roles and users; patients and
+    # their records are hash-partitioned by uuid over all groups, each with its own
+    # leader. Every node must use the same value, fixed for the life of the data.
+    RAFT_GROUPS = int(os.environ.get("RAFT_GROUPS", 1))
+
+    # Raft RPC transport: "rpc" (binary protocol on its own port) or "http" (the /raft/* routes)
+    RAFT_TRANSPORT = os.environ.get("RAFT_TRANSPORT", "rpc")
+    RAFT_RPC_PORT = int(os.environ.get("RAFT_RPC_PORT", 7001))
+    # Optional per-peer RPC addresses: node2=node2:7001,node3=node3:7001
+    # (defaults to the host of the peer's PEERS url on RAFT_RPC_PORT)
+    RAFT_RPC_PEERS = os.environ.get("RAFT_RPC_PEERS", "").split(",")
+    # Frames at least this large are zlib-compressed; 0 disables compression
+    RAFT_RPC_COMPRESS_BYTES = int(os.environ.get("RAFT_RPC_COMPRESS_BYTES", 16384))
+
+    # Follower -> leader write forwarding. The leader's answer may take its
+    # commit and apply waits (2 x REPLICATION_TIMEOUT) plus FORWARD_TIMEOUT_MARGIN;
+    # streamed bulk responses may go FORWARD_STREAM_TIMEOUT between lines
+    FORWARD_CONNECT_TIMEOUT = float(os.environ.get("FORWARD_CONNECT_TIMEOUT", 2.0))
+    FORWARD_TIMEOUT_MARGIN = float(os.environ.get("FORWARD_TIMEOUT_MARGIN", 5.0))
+    FORWARD_STREAM_TIMEOUT = float(os.environ.get("FORWARD_STREAM_TIMEOUT", 300))
+    FORWARD_RETRIES = int(os.environ.get("FORWARD_RETRIES", 2))
+    FORWARD_POOL_SIZE = int(os.environ.get("FORWARD_POOL_SIZE", 32))
+    # Request bodies up to this size are buffered so they can be retried on a new leader
+    FORWARD_BUFFER_BYTES = int(os.environ.get("FORWARD_BUFFER_BYTES", 1024 * 1024))
+
+    # Peer acks a write waits for: "1", "majority" or "all"
+    REPLICATION_ACKS = os.environ.get("REPLICATION_ACKS", "majority")
+    REPLICATION_TIMEOUT = float(os.environ.get("REPLICATION_TIMEOUT", 1.0))
+    # Leader writes arriving within this window share one log fsync
+    GROUP_COMMIT_WINDOW_MS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", 2))
+    GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", 256))
+    # AppendEntries pipeline: batches in flight per follower and max batch size
+    APPEND_MAX_INFLIGHT = int(os.environ.get("APPEND_MAX_INFLIGHT", 4))
+    APPEND_MAX_BATCH_BYTES = int(os.environ.get("APPEND_MAX_BATCH_BYTES", 1024 * 1024))
+
+    # Log compaction: snapshot once this many applied entries sit in the log
+    SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "snapshots")
+    SNAPSHOT_THRESHOLD = int(os.environ.get("SNAPSHOT_THRESHOLD", 10000))
+    SNAPSHOT_INTERVAL = float(os.environ.get("SNAPSHOT_INTERVAL", 30))
+    SNAPSHOT_CHUNK_BYTES = int(os.environ.get("SNAPSHOT_CHUNK_BYTES", 1024 * 1024))
+    SNAPSHOT_INSTALL_TIMEOUT = float(os.environ.get("SNAPSHOT_INSTALL_TIMEOUT", 30))
     
+    # Default read mode for GET endpoints: "linearizable", "lease" or "stale"
+    READ_CONSISTENCY = os.environ.get("READ_CONSISTENCY", "stale")
+    READ_TIMEOUT = float(os.environ.get("READ_TIMEOUT", 1.0))
+    # Leader leases last this fraction of the minimum election timeout (clock drift margin)
+    LEASE_RATIO = float(os.environ.get("LEASE_RATIO", 0.8))
+
     # Raft Timing (ms)
     ELECTION_TIMEOUT_RANGE = (150, 300) 
     HEARTBEAT_INTERVAL = 0.05 # 50ms
\ No newline at end of file
@@ -1,7 +1,43 @@
+import itertools
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from sqlalchemy import func
 
-db = SQLAlchemy()
+# SQLALCHEMY_BINDS keys of the read replicas (see Config.SQLALCHEMY_BINDS)
+REPLICA_BIND_PREFIX = "replica"
+
+
+class RoutingSession(Session):
+    """Session that sends a request's reads to its assigned read replica.
+
+    Only requests that called `use_replica()` are routed. Writes, the Raft
+    log and state machine applies run without it and use the primary. A
+    session with pending changes or mid-flush also stays on the primary,
+    so it never reads from a replica that cannot see them.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = g.get("db_replica") if has_app_context() else None
+        if replica and bind is None and not (self._flushing or self.new or self.dirty or self.deleted):
+            return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+_replica_turn = itertools.count()
+
+
+def use_replica():
+    """Route the rest of this request's reads to a read replica, round-robin.
+
+    Returns the bind key, or None when no replicas are configured.
+    """
+    replicas = sorted(k for k in db.engines if k and k.startswith(REPLICA_BIND_PREFIX))
+    if not replicas:
+        return None
+    g.db_replica = replicas[next(_replica_turn) % len(replicas)]
+    return g.db_replica
 
 
 class Hospital(db.Model):
@@ -75,17 +111,29 @@ class Patient(db.Model):
     phone_encrypted = db.Column(db.Text, nullable=True)
     address_encrypted = db.Column(db.Text, nullable=True)
 
+    # Blind indexes: HMAC of the normalized plaintext, used for equality search
+    full_name_bidx = db.Column(db.String(64), index=True, nullable=True)
+    date_of_birth_bidx = db.Column(db.String(64), index=True, nullable=True)
+    phone_bidx = db.Column(db.String(64), index=True, nullable=True)
+
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     encounters = db.relationship("Encounter", back_populates="patient", cascade="all, delete-orphan")
     observations = db.relationship("Observation", back_populates="patient", cascade="all, delete-orphan")
     prescriptions = db.relationship("Prescription", back_populates="patient", cascade="all, delete-orphan")
+    vital_chunks = db.relationship("VitalChunk", cascade="all, delete-orphan")
+    vital_rollups = db.relationship("VitalRollup", cascade="all, delete-orphan")
 
 
 class Encounter(db.Model):
     __tablename__ = "encounter"
+    __table_args__ = (
+        # Patient timeline: one range scan per chart, newest visits first
+        db.Index("ix_encounter_patient_visit_date", "patient_id", "visit_date"),
+    )
 
     encounter_id = db.Column(db.Integer, primary_key=True)
+    uuid = db.Column(db.String(64), unique=True, index=True, nullable=False)
 
     patient_id = db.Column(db.Integer, db.ForeignKey("patient.patient_id", ondelete="CASCADE"), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey("user.user_id", ondelete="RESTRICT"), nullable=False)
@@ -107,10 +155,14 @@ class Encounter(db.Model):
 
 class Observation(db.Model):
     __tablename__ = "observation"
+    __table_args__ = (
+        db.Index("ix_observation_patient_recorded_at", "patient_id", "recorded_at"),
+    )
 
     observation_id = db.Column(db.Integer, primary_key=True)
+    uuid = db.Column(db.String(64), unique=True, index=True, nullable=False)
 
-    encounter_id = db.Column(db.Integer, db.ForeignKey("encounter.encounter_id", ondelete="CASCADE"), nullable=False)
+    encounter_id = db.Column(db.Integer, db.ForeignKey("encounter.encounter_id", ondelete="CASCADE"), index=True, nullable=False)
     patient_id = db.Column(db.Integer, db.ForeignKey("patient.patient_id", ondelete="CASCADE"), nullable=False)
 
     type = db.Column(db.String(100), nullable=False)
@@ -125,10 +177,14 @@ class Observation(db.Model):
 
 class Prescription(db.Model):
     __tablename__ = "prescription"
+    __table_args__ = (
+        db.Index("ix_prescription_patient_prescribed_at", "patient_id", "prescribed_at"),
+    )
 
     prescription_id = db.Column(db.Integer, primary_key=True)
+    uuid = db.Column(db.String(64), unique=True, index=True, nullable=False)
 
-    encounter_id = db.Column(db.Integer, db.ForeignKey("encounter.encounter_id", ondelete="CASCADE"), nullable=False)
+    encounter_id = db.Column(db.Integer, db.ForeignKey("encounter.encounter_id", ondelete="CASCADE"), index=True, nullable=False)
     patient_id = db.Column(db.Integer, db.ForeignKey("patient.patient_id", ondelete="CASCADE"), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey("user.user_id", ondelete="RESTRICT"), nullable=False)
 
@@ -147,9 +203,64 @@ class Prescription(db.Model):
     patient = db.relationship("Patient", back_populates="prescriptions")
     doctor = db.relationship("User", back_populates="doctor_prescriptions", foreign_keys=[doctor_id])
 
+class VitalChunk(db.Model):
+    """One UTC day of numeric readings for a patient/vital type, stored column-wise.
+
+    `timestamps` and `values` are packed float64 arrays (epoch seconds and
+    reading), sorted by time - 16 bytes per reading instead of an ORM row.
+    """
+    __tablename__ = "vital_chunk"
+    __table_args__ = (
+        db.Index("ix_vital_chunk_series_day", "patient_id", "type", "day_start", unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey("patient.patient_id", ondelete="CASCADE"), nullable=False)
+    type = db.Column(db.String(100), nullable=False)
+    day_start = db.Column(db.BigInteger, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    timestamps = db.Column(db.LargeBinary, nullable=False)
+    values = db.Column(db.LargeBinary, nullable=False)
+
+
+class VitalRollup(db.Model):
+    """Min/max/sum/count of a vital type per minute, hour or day bucket."""
+    __tablename__ = "vital_rollup"
+    __table_args__ = (
+        db.Index("ix_vital_rollup_series_bucket", "patient_id", "type", "resolution", "bucket_start", unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey("patient.patient_id", ondelete="CASCADE"), nullable=False)
+    type = db.Column(db.String(100), nullable=False)
+    resolution = db.Column(db.String(10), nullable=False)
+    bucket_start = db.Column(db.BigInteger, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    min = db.Column(db.Float, nullable=False)
+    max = db.Column(db.Float, nullable=False)
+    sum = db.Column(db.Float, nullable=False)
+
+
 class RaftLog(db.Model):
     __tablename__ = "raft_log"
+    __table_args__ = (
+        db.Index("ix_raft_log_group_index", "group_id", "index", unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
+    # Raft group the entry belongs to (see RAFT_GROUPS); each group has its own index sequence
+    group_id = db.Column(db.Integer, nullable=False, default=0)
     term = db.Column(db.Integer, nullable=False)
     index = db.Column(db.Integer, nullable=False)
-    command = db.Column(db.JSON, nullable=False)
\ No newline at end of file
+    command = db.Column(db.JSON, nullable=False)
+
+
+class RaftMeta(db.Model):
+    """One row per Raft group (id = group + 1) holding the state that must survive restarts."""
+    __tablename__ = "raft_meta"
+    id = db.Column(db.Integer, primary_key=True)
+    current_term = db.Column(db.Integer, nullable=False, default=0)
+    voted_for = db.Column(db.String(64), nullable=True)
+    last_applied = db.Column(db.Integer, nullable=False, default=0)
+    # Last log entry folded into the most recent snapshot
+    snapshot_index = db.Column(db.Integer, nullable=False, default=0)
+    snapshot_term = db.Column(db.Integer, nullable=False, default=0)
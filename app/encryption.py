@@ -1,7 +1,15 @@
 from cryptography.fernet import Fernet
 from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
 import base64
 import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from metrics import CRYPTO_OPERATIONS, CRYPTO_SECONDS
 
 def get_encryption_key(key_string):
     """Generate a valid Fernet key from a string"""
@@ -9,22 +17,197 @@ def get_encryption_key(key_string):
     key_hash = hashlib.sha256(key_bytes).digest()
     return base64.urlsafe_b64encode(key_hash)
 
+def _count(operation, fields, start):
+    CRYPTO_OPERATIONS.inc((operation,), fields)
+    CRYPTO_SECONDS.inc((operation,), time.perf_counter() - start)
+
 class Encryptor:
-    def __init__(self, key_string):
+    def __init__(self, key_string, workers=None, batch_min=64):
         self.fernet = Fernet(get_encryption_key(key_string))
+        self.workers = workers or os.cpu_count() or 1
+        # Below this many ciphertexts the pool hand-off costs more than it saves
+        self.batch_min = batch_min
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crypto")
+        return self._pool
     
     def encrypt(self, plaintext):
         if plaintext is None:
             return None
-        return self.fernet.encrypt(plaintext.encode()).decode()
+        start = time.perf_counter()
+        ciphertext = self.fernet.encrypt(plaintext.encode()).decode()
+        _count("encrypt", 1, start)
+        return ciphertext
     
     def decrypt(self, encrypted_text):
         if encrypted_text is None:
             return None
-        return self.fernet.decrypt(encrypted_text.encode()).decode()
+        start = time.perf_counter()
+        plaintext = self.fernet.decrypt(encrypted_text.encode()).decode()
+        _count("decrypt", 1, start)
+        return plaintext
+
+    def _decrypt_chunk(self, chunk):
+        decrypt = self.fernet.decrypt
+        return [decrypt(c.encode()).decode() for c in chunk]
+
+    def _encrypt_chunk(self, chunk):
+        encrypt = self.fernet.encrypt
+        return [encrypt(p.encode()).decode() for p in chunk]
+
+    def _map_batch(self, operation, chunk_fn, values):
+        """Run `chunk_fn` over the non-empty `values`, preserving order.
+
+        None/empty values are skipped and come back as None. Large batches are
+        split into one contiguous chunk per worker so each task amortizes the
+        pool hand-off over many Fernet tokens.
+        """
+        results = [None] * len(values)
+        positions = [i for i, v in enumerate(values) if v]
+        pending = [values[i] for i in positions]
+        if not pending:
+            return results
+
+        start = time.perf_counter()
+        if self.workers <= 1 or len(pending) < self.batch_min:
+            done = chunk_fn(pending)
+        else:
+            size = -(-len(pending) // self.workers)
+            chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+            done = []
+            for part in self._get_pool().map(chunk_fn, chunks):
+                done.extend(part)
+        _count(operation, len(pending), start)
+
+        for i, value in zip(positions, done):
+            results[i] = value
+        return results
+
+    def decrypt_many(self, encrypted_texts):
+        """Decrypt a batch of ciphertexts, preserving order."""
+        return self._map_batch("decrypt", self._decrypt_chunk, encrypted_texts)
+
+    def encrypt_many(self, plaintexts):
+        """Encrypt a batch of plaintexts, preserving order."""
+        return self._map_batch("encrypt", self._encrypt_chunk, plaintexts)
+
+class BlindIndexer:
+    """Keyed HMAC-SHA256 digests of normalized PII for equality lookups.
+
+    The digest is deterministic, so it can be stored next to the Fernet
+    ciphertext and indexed, while revealing nothing without the key. The field
+    name is mixed into the MAC so equal values in different columns do not
+    produce equal digests.
+    """
+    def __init__(self, key_string):
+        self.key = hashlib.sha256(b"blind-index:" + key_string.encode()).digest()
+
+    @staticmethod
+    def normalize(field, value):
+        value = value.strip()
+        if field == "phone":
+            return re.sub(r"\D", "", value)
+        if field == "full_name":
+            return " ".join(value.casefold().split())
+        return value
+
+    def index(self, field, value):
+        if not value:
+            return None
+        message = f"{field}:{self.normalize(field, value)}".encode()
+        return hmac.new(self.key, message, hashlib.sha256).hexdigest()
 
 def hash_password(password):
     return generate_password_hash(password)
 
 def verify_password(password, hashed):
     return check_password_hash(hashed, password)
+
+
+class HasherBusy(Exception):
+    """Raised when the password hashing pool has no free slot within the wait limit."""
+
+
+class PasswordHasher:
+    """Runs password hashing and verification in a bounded process pool.
+
+    Werkzeug's hashes are deliberately CPU-expensive. Run on request
+    threads, a burst of logins or a bulk user upload would occupy as many
+    cores as there are requests, starving the API and Raft threads. A fixed
+    pool of worker processes caps the CPU spent on hashing. At most
+    `max_pending` hashes may be queued or running; callers that cannot get
+    a slot within `slot_timeout` seconds get HasherBusy (a 503) instead of
+    queueing without bound. Batches (hash_many) keep at most one task per worker in flight,
+    so interactive calls are never queued behind a whole bulk upload.
+
+    Call start() before the process starts threads. Without it the pool is
+    created on first use from a forkserver, whose workers re-import the
+    main module: a script that hashes must then keep its top-level code
+    under `if __name__ == "__main__":`, or every worker re-runs it and the
+    pool breaks (BrokenProcessPool).
+    """
+    def __init__(self, workers=None, max_pending=None, slot_timeout=2.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self.slot_timeout = slot_timeout
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def start(self):
+        """Fork the workers now, before the server starts its own threads."""
+        pool = self._get_pool("fork")
+        for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def _get_pool(self, method="forkserver"):
+        """The worker pool, created on first use if start() was not called.
+
+        Forking a process that already runs threads can hand the child a
+        lock some other thread was holding, so a pool created lazily starts
+        its workers from a clean forkserver process instead (which needs the
+        main module to be import-safe, see the class docstring).
+        """
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+                    )
+        return self._pool
+
+    def _submit(self, fn, *args, block=False):
+        if not self.slots.acquire(timeout=None if block else self.slot_timeout):
+            raise HasherBusy()
+        try:
+            future = self._get_pool().submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def hash(self, password):
+        return self._submit(generate_password_hash, password).result()
+
+    def verify(self, password, hashed):
+        return self._submit(check_password_hash, hashed, password).result()
+
+    def hash_many(self, passwords):
+        """Hash a batch, preserving order, with one task per worker in flight."""
+        results = [None] * len(passwords)
+        inflight = {}
+        for i, password in enumerate(passwords):
+            if len(inflight) >= self.workers:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[inflight.pop(future)] = future.result()
+            inflight[self._submit(generate_password_hash, password, block=True)] = i
+        for future in wait(inflight).done:
+            results[inflight[future]] = future.result()
+        return results
@@ -0,0 +1,75 @@
+import json
+from flask import request, Response, stream_with_context, abort
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+READ_BLOCK_BYTES = 64 * 1024
+
+
+def iter_records():
+    """Return an iterator of (position, record, error) over a bulk request body.
+
+    NDJSON bodies are read line by line straight off the request stream, so
+    memory stays flat however large the upload is. A plain JSON array is
+    parsed (and rejected with a 400 if it is not an array) up front. A
+    malformed item is reported as an error for its position and does not
+    abort the rest of the stream.
+    """
+    if request.mimetype in NDJSON_TYPES:
+        return _iter_ndjson(request.stream)
+
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        abort(400, description="Expected a JSON array or an application/x-ndjson body")
+    return ((position, record, None) if isinstance(record, dict) else (position, None, "Each item must be a JSON object")
+            for position, record in enumerate(records))
+
+
+def _iter_lines(stream):
+    """Split a byte stream into lines, reading it in large blocks."""
+    tail = b""
+    while True:
+        block = stream.read(READ_BLOCK_BYTES)
+        if not block:
+            break
+        lines = (tail + block).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def _iter_ndjson(stream):
+    position = 0
+    for line in _iter_lines(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield position, None, f"Invalid JSON: {e}"
+        else:
+            if isinstance(record, dict):
+                yield position, record, None
+            else:
+                yield position, None, "Each line must be a JSON object"
+        position += 1
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ndjson_response(lines, status=200):
+    """Stream an iterable of dicts back as NDJSON while it is being produced."""
+    def generate():
+        for line in lines:
+            yield json.dumps(line, separators=(",", ":")) + "\n"
+    return Response(stream_with_context(generate()), status=status, mimetype="application/x-ndjson")
@@ -0,0 +1,222 @@
+import bisect
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Default latency buckets in seconds (500µs .. 10s)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    """Counters and histograms recorded into per-thread shards.
+
+    Each thread updates only its own shard (a plain dict), so the hot path
+    takes no lock; only a thread's first sample registers its shard. A
+    scrape sums the shards, folding those of finished threads into a base
+    total so thread-per-request servers do not grow the list forever.
+    Gauges are computed at scrape time by collector callbacks.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.local = threading.local()
+        self.shards = []
+        self.retired = {}
+        self.lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.shards.append((threading.current_thread(), shard))
+        return shard
+
+    def counter(self, name, help_text, labels=()):
+        metric = self.metrics[name] = Counter(self, name, help_text, labels)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = self.metrics[name] = Histogram(self, name, help_text, labels, buckets)
+        return metric
+
+    def collector(self, fn):
+        """Register `fn() -> [(name, type, help, [(labels dict, value), ...]), ...]`."""
+        self.collectors.append(fn)
+        return fn
+
+    def _totals(self):
+        with self.lock:
+            live = []
+            for thread, shard in self.shards:
+                if thread.is_alive():
+                    live.append(shard)
+                else:
+                    _merge(self.retired, dict(shard))
+            self.shards = [(t, s) for t, s in self.shards if t.is_alive()]
+            totals = {}
+            _merge(totals, self.retired)
+        for shard in live:
+            _merge(totals, dict(shard))
+        return totals
+
+    def render(self):
+        """Prometheus text exposition (format 0.0.4)."""
+        totals = self._totals()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            series = sorted((key[1], value) for key, value in totals.items() if key[0] == name)
+            for label_values, value in series:
+                metric.render(lines, label_values, value)
+        for collect in self.collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"Metrics collector {collect.__name__} failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.items())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(into, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            current = into.get(key)
+            if current is None:
+                into[key] = list(value)
+            else:
+                for i, v in enumerate(value):
+                    current[i] += v
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    pairs = [(k, v) for k, v in pairs]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, help_text, labels):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+
+    def inc(self, label_values=(), amount=1):
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        shard[key] = shard.get(key, 0) + amount
+
+    def render(self, lines, label_values, value):
+        lines.append(f"{self.name}{_labels(zip(self.labels, label_values))} {_number(value)}")
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, labels, buckets):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+
+    def observe(self, label_values, seconds):
+        shard = self.registry.shard()
+        key = (self.name, label_values)
+        counts = shard.get(key)
+        if counts is None:
+            # One slot per bucket, then +Inf, then the sum
+            counts = shard[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        counts[-1] += seconds
+
+    def time(self, label_values=()):
+        return _Timer(self, label_values)
+
+    def render(self, lines, label_values, counts):
+        pairs = list(zip(self.labels, label_values))
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), counts):
+            cumulative += count
+            le = bound if bound == "+Inf" else repr(float(bound))
+            lines.append(f"{self.name}_bucket{_labels(pairs + [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(pairs)} {_number(counts[-1])}")
+        lines.append(f"{self.name}_count{_labels(pairs)} {cumulative}")
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(self.label_values, time.perf_counter() - self.start)
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "ehr_http_request_duration_seconds", "API request latency by route", ("method", "route", "status"))
+DB_QUERY_SECONDS = registry.histogram(
+    "ehr_db_query_duration_seconds", "Database statement execution time", ("operation",))
+CRYPTO_OPERATIONS = registry.counter(
+    "ehr_crypto_operations_total", "Fields encrypted or decrypted", ("operation",))
+CRYPTO_SECONDS = registry.counter(
+    "ehr_crypto_seconds_total", "Time spent encrypting or decrypting", ("operation",))
+REPLICATION_RPC_SECONDS = registry.histogram(
+    "ehr_raft_append_entries_duration_seconds", "AppendEntries round trip per peer", ("peer",))
+REPLICATION_RPC_FAILURES = registry.counter(
+    "ehr_raft_append_entries_failures_total", "Failed AppendEntries RPCs per peer", ("peer",))
+REPLICATION_COMMIT_SECONDS = registry.histogram(
+    "ehr_replication_commit_duration_seconds", "Time for a write to commit through Raft", ("type",))
+REPLICATION_UNCOMMITTED = registry.counter(
+    "ehr_replication_uncommitted_total", "Writes that failed to commit", ("type",))
+
+
+# The start time lives on the statement's execution context, not the connection, so
+# a statement that raises (and never reaches after_cursor_execute) leaves nothing behind
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.ehr_query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "ehr_query_started", None)
+    if started is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+    if operation not in ("select", "insert", "update", "delete"):
+        operation = "other"
+    DB_QUERY_SECONDS.observe((operation,), time.perf_counter() - started)
@@ -0,0 +1,64 @@
+import base64
+import json
+from flask import request, current_app, abort
+
+
+def encode_cursor(last_id):
+    raw = json.dumps({"after": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["after"])
+    except (ValueError, KeyError, TypeError):
+        abort(400, description="Invalid cursor")
+
+
+def wants_all():
+    """`?all=true` keeps the legacy un-paginated array response."""
+    return request.args.get("all", "").lower() in ("1", "true", "yes")
+
+
+def page_args():
+    default = current_app.config["PAGE_SIZE_DEFAULT"]
+    maximum = current_app.config["PAGE_SIZE_MAX"]
+    limit = request.args.get("limit", default, type=int)
+    limit = max(1, min(limit, maximum))
+
+    after = None
+    if request.args.get("cursor"):
+        after = decode_cursor(request.args["cursor"])
+    elif request.args.get("after"):
+        after = request.args.get("after", type=int)
+        if after is None:
+            abort(400, description="after must be an integer id")
+    return after, limit
+
+
+def keyset_page(query, key_column):
+    """Fetch one page ordered by `key_column` starting strictly after the cursor.
+
+    Seeks on the primary key instead of using OFFSET, so every page costs one
+    index range scan no matter how deep the client has paged.
+    """
+    after, limit = page_args()
+    if after is not None:
+        query = query.filter(key_column > after)
+    rows = query.order_by(key_column).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(getattr(rows[-1], key_column.key))
+    return rows, next_cursor
+
+
+def page_response(items, next_cursor):
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    }
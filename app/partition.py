@@ -0,0 +1,90 @@
+import itertools
+import threading
+import uuid
+import zlib
+from sqlalchemy import func
+from database import db
+from cluster import raft_groups, ReplicationError
+
+
+def partitioned():
+    return len(raft_groups) > 1
+
+
+def partition_of(patient_uuid):
+    """Raft group owning a patient: CRC32 of its uuid modulo RAFT_GROUPS."""
+    return zlib.crc32(patient_uuid.encode()) % len(raft_groups)
+
+
+def group_of_id(record_id):
+    """Raft group owning a patient, encounter, observation or prescription id.
+
+    With more than one group these ids are allocated inside their patient's
+    partition (id % RAFT_GROUPS == group), so the id alone routes a write.
+    Anything that is not an id goes to group 0; the endpoint rejects it.
+    """
+    try:
+        return int(record_id) % len(raft_groups)
+    except (TypeError, ValueError):
+        return 0
+
+
+def mint_uuid(group):
+    """A new uuid4 that hashes to `group` (RAFT_GROUPS draws on average)."""
+    while True:
+        value = str(uuid.uuid4())
+        if partition_of(value) == group:
+            return value
+
+
+_turn = itertools.count()
+
+def choose_group():
+    """Partition for a new patient: one this node leads when there is one, round-robin.
+
+    Creating in a led group saves the forwarding hop, and since clients
+    spread requests over the nodes, new patients spread over the groups.
+    """
+    groups = raft_groups.led() or list(range(len(raft_groups)))
+    return groups[next(_turn) % len(groups)]
+
+
+class IdAllocator:
+    """Primary keys for partitioned tables, inside one group's residue class.
+
+    Only a group's leader allocates, and it replicates the ids it chose, so
+    every node stores a record under the same id. On the first allocation
+    of each leadership term the leader waits until it has applied its
+    term's no-op, and with it every create earlier leaders committed, and
+    then reads the high-water mark from the database. Within the term the
+    counter continues in memory, which covers the leader's own creates that
+    are not applied yet. As with SQLite rowids, an id can come back only if
+    the record holding the highest id was deleted before the leader changed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next = {}
+
+    def allocate(self, model, group, count=1):
+        """Return `count` new ids of `model` for `group` (Nones with a single group: autoincrement)."""
+        groups = len(raft_groups)
+        if groups == 1:
+            return [None] * count
+        column = list(model.__table__.primary_key.columns)[0]
+        key = (model.__tablename__, group)
+        node = raft_groups[group]
+        term = node.current_term
+        if self.next.get(key, (None, None))[1] != term and \
+                not node.wait_for_term_applied(node.replication_timeout * 2):
+            raise ReplicationError(f"Group {group} leader has not applied its term yet")
+        with self.lock:
+            start, start_term = self.next.get(key, (None, None))
+            if start is None or start_term != term:
+                highest = db.session.query(func.max(column)).filter(column % groups == group).scalar()
+                start = highest + groups if highest is not None else group or groups
+            self.next[key] = (start + count * groups, term)
+        return list(range(start, start + count * groups, groups))
+
+
+ids = IdAllocator()
@@ -0,0 +1,45 @@
+from datetime import datetime
+from flask import request, abort
+from sqlalchemy.orm import load_only
+
+
+def requested_fields(allowed):
+    """Parse `?fields=a,b` against the fields an endpoint can return.
+
+    Returns the requested names in `allowed` order, or None when the client
+    did not ask for a projection. Unknown names are rejected with a 400.
+    """
+    raw = request.args.get("fields")
+    if raw is None:
+        return None
+    fields = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = fields - set(allowed)
+    if not fields:
+        abort(400, description=f"`fields` must name at least one of: {', '.join(allowed)}")
+    if unknown:
+        abort(400, description=f"Unknown fields: {', '.join(sorted(unknown))}. Available: {', '.join(allowed)}")
+    return [f for f in allowed if f in fields]
+
+
+def load_fields(query, model, fields, columns=None):
+    """Restrict `query` to the columns behind `fields` (the primary key is always loaded).
+
+    `columns` maps a response field to its column when the names differ,
+    e.g. an encrypted field to its ciphertext column.
+    """
+    if fields is None:
+        return query
+    columns = columns or {}
+    attrs = [getattr(model, columns.get(f, f)) for f in fields if columns.get(f, f) is not None]
+    if not attrs:
+        attrs = [getattr(model, column.key) for column in model.__mapper__.primary_key]
+    return query.options(load_only(*attrs))
+
+
+def project(obj, fields):
+    """Serialize only `fields` of a plain (unencrypted) row."""
+    item = {}
+    for field in fields:
+        value = getattr(obj, field)
+        item[field] = value.isoformat() if isinstance(value, datetime) else value
+    return item
@@ -0,0 +1,207 @@
+import json
+from database import db, RaftLog, RaftMeta
+
+EMPTY_META = {"current_term": 0, "voted_for": None, "last_applied": 0, "snapshot_index": 0, "snapshot_term": 0}
+
+TAIL_CACHE_ENTRIES = 4096
+BATCH_FETCH_ROWS = 256
+
+
+def cut_batch(entries, max_bytes):
+    """Return the longest prefix of `entries` within `max_bytes` (at least one entry)."""
+    size = 0
+    for i, entry in enumerate(entries):
+        size += len(json.dumps(entry["command"], default=str))
+        if i and size > max_bytes:
+            return entries[:i]
+    return entries
+
+
+class MemoryLog:
+    """Volatile Raft log, used until a node is bound to its database.
+
+    Entries up to `base_index` have been compacted into a snapshot; only
+    their last index/term is remembered.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.base_index = 0
+        self.base_term = 0
+        self.meta = dict(EMPTY_META)
+
+    @property
+    def last_index(self):
+        return self.entries[-1]["index"] if self.entries else self.base_index
+
+    @property
+    def last_term(self):
+        return self.entries[-1]["term"] if self.entries else self.base_term
+
+    def term_at(self, index):
+        if index == self.base_index:
+            return self.base_term
+        if self.base_index < index <= self.last_index:
+            return self.entries[index - self.base_index - 1]["term"]
+        return None
+
+    def append(self, entries, **meta):
+        self.entries.extend(entries)
+        self.meta.update(meta)
+
+    def entries_from(self, start, limit=None):
+        offset = start - self.base_index - 1
+        end = len(self.entries) if limit is None else offset + limit
+        return self.entries[offset:end]
+
+    def entries_for_batch(self, start, max_bytes):
+        return cut_batch(self.entries_from(start, BATCH_FETCH_ROWS), max_bytes)
+
+    def truncate_from(self, index):
+        del self.entries[index - self.base_index - 1:]
+
+    def compact(self, index, term):
+        """Drop entries up to `index`; they are covered by a snapshot."""
+        keep = [e for e in self.entries if e["index"] > index]
+        if self.term_at(index) != term:
+            keep = []
+        self.entries = keep
+        self.base_index, self.base_term = index, term
+        self.meta.update(snapshot_index=index, snapshot_term=term)
+
+    def load_meta(self):
+        return dict(self.meta)
+
+    def save_meta(self, **fields):
+        self.meta.update(fields)
+
+
+class SqlLog:
+    """One Raft group's log, persisted in the `raft_log` table.
+
+    Every call runs in its own app context (and therefore its own session), so
+    log writes never get mixed into the transaction of the request that
+    triggered them. One `append` is one transaction, i.e. one fsync for a
+    whole group-committed batch. The newest appended entries are also kept in
+    memory, so the replication pipeline rarely reads the table back.
+    """
+
+    def __init__(self, app, group=0):
+        self.app = app
+        self.group = group
+        self.tail = []
+        meta = self.load_meta()
+        self.base_index = meta["snapshot_index"]
+        self.base_term = meta["snapshot_term"]
+        self._refresh_last()
+
+    def _rows(self):
+        return RaftLog.query.filter(RaftLog.group_id == self.group)
+
+    def _refresh_last(self):
+        with self.app.app_context():
+            last = self._rows().order_by(RaftLog.index.desc()).first()
+            self._last_index = last.index if last else self.base_index
+            self._last_term = last.term if last else self.base_term
+
+    @property
+    def last_index(self):
+        return self._last_index
+
+    @property
+    def last_term(self):
+        return self._last_term
+
+    def term_at(self, index):
+        if index == self.base_index:
+            return self.base_term
+        if index < self.base_index:
+            return None
+        if index == self._last_index:
+            return self._last_term
+        if self.tail and self.tail[0]["index"] <= index <= self.tail[-1]["index"]:
+            return self.tail[index - self.tail[0]["index"]]["term"]
+        with self.app.app_context():
+            row = db.session.query(RaftLog.term).filter(RaftLog.group_id == self.group, RaftLog.index == index).first()
+            return row[0] if row else None
+
+    def append(self, entries, **meta):
+        """Persist `entries` (and optional meta fields) in a single transaction."""
+        if not entries:
+            return
+        with self.app.app_context():
+            db.session.add_all([RaftLog(group_id=self.group, term=e["term"], index=e["index"], command=e["command"])
+                                for e in entries])
+            if meta:
+                self._set_meta(meta)
+            db.session.commit()
+        self._last_index = entries[-1]["index"]
+        self._last_term = entries[-1]["term"]
+        if self.tail and self.tail[-1]["index"] + 1 != entries[0]["index"]:
+            self.tail = []
+        self.tail.extend(entries)
+        del self.tail[:-TAIL_CACHE_ENTRIES]
+
+    def entries_from(self, start, limit=None):
+        tail = self.tail
+        if tail and tail[0]["index"] <= start:
+            offset = start - tail[0]["index"]
+            return tail[offset:] if limit is None else tail[offset:offset + limit]
+        with self.app.app_context():
+            query = self._rows().filter(RaftLog.index >= start).order_by(RaftLog.index)
+            if limit is not None:
+                query = query.limit(limit)
+            return [{"term": r.term, "index": r.index, "command": r.command} for r in query]
+
+    def entries_for_batch(self, start, max_bytes):
+        return cut_batch(self.entries_from(start, BATCH_FETCH_ROWS), max_bytes)
+
+    def truncate_from(self, index):
+        self.tail = [e for e in self.tail if e["index"] < index]
+        with self.app.app_context():
+            self._rows().filter(RaftLog.index >= index).delete()
+            db.session.commit()
+        self._refresh_last()
+
+    def compact(self, index, term):
+        """Drop entries up to `index`; they are covered by a snapshot.
+
+        If our entry at `index` has a different term (a follower installing a
+        leader's snapshot over a divergent log) the whole log is discarded.
+        """
+        keep_tail = self.term_at(index) == term
+        with self.app.app_context():
+            query = self._rows()
+            if keep_tail:
+                query = query.filter(RaftLog.index <= index)
+            query.delete()
+            self._set_meta({"snapshot_index": index, "snapshot_term": term})
+            db.session.commit()
+        self.tail = [e for e in self.tail if e["index"] > index] if keep_tail else []
+        self.base_index, self.base_term = index, term
+        self._refresh_last()
+
+    def load_meta(self):
+        with self.app.app_context():
+            meta = db.session.get(RaftMeta, self.group + 1)
+            if meta is None:
+                return dict(EMPTY_META)
+            return {
+                "current_term": meta.current_term,
+                "voted_for": meta.voted_for,
+                "last_applied": meta.last_applied,
+                "snapshot_index": meta.snapshot_index,
+                "snapshot_term": meta.snapshot_term
+            }
+
+    def _set_meta(self, fields):
+        meta = db.session.get(RaftMeta, self.group + 1) or RaftMeta(id=self.group + 1, current_term=0, last_applied=0,
+                                                                    snapshot_index=0, snapshot_term=0)
+        for key, value in fields.items():
+            setattr(meta, key, value)
+        db.session.add(meta)
+
+    def save_meta(self, **fields):
+        with self.app.app_context():
+            self._set_meta(fields)
+            db.session.commit()
@@ -1,45 +1,293 @@
+import threading
 import requests
-from flask import request, jsonify, current_app
-from cluster import raft
+from flask import request, jsonify, current_app, Response, after_this_request, g, has_app_context
+from cluster import raft, raft_groups, ReplicationError
+from database import db, use_replica
+from partition import choose_group
+from transport import HttpTransport
+from metrics import REPLICATION_COMMIT_SECONDS, REPLICATION_UNCOMMITTED
 
-def broadcast_replication(model_type, action, data_uuid, payload):
-    headers = {"X-Cluster-Auth": current_app.config.get("CLUSTER_AUTH_TOKEN")}
-    replication_payload = {
+def current_group():
+    """Raft group the current write request was routed to (group 0 outside of one)."""
+    return g.get("raft_group", 0) if has_app_context() else 0
+
+def broadcast_replication(model_type, action, data_uuid, payload, group=None):
+    """Commit a write through its Raft group's log and apply it on this node.
+
+    `group` defaults to the one handle_write_request routed the request to.
+    The leader changes its database only by applying committed entries, in
+    log order, exactly like the followers, so endpoints build the command
+    instead of writing rows. The request's transaction is rolled back
+    first; objects the endpoint loaded are re-read from the applied state.
+
+    Blocks until the entry is committed by a majority, matched by
+    REPLICATION_ACKS peers and applied locally. Raises ReplicationError
+    with 503 if it did not commit, 504 if it committed but was not applied
+    in time and 409 if the state machine rejected it. Returns the outcome,
+    with apply_write's result under "result".
+    """
+    db.session.rollback()
+    command = {
         "type": model_type,
         "action": action,
         "uuid": data_uuid,
         "data": payload
     }
-    for name, url in raft.peers.items():
-        if name == current_app.config.get("NODE_ID"): 
-            continue
-        try:
-            requests.post(f"{url}/raft/replicate_write", json=replication_payload, headers=headers, timeout=1.0)
-        except Exception as e:
-            print(f"Failed to sync {model_type} to {name}: {e}")
-
-def handle_write_request(endpoint_func):
+    node = raft_groups[current_group() if group is None else group]
+    if node is not raft:
+        # The shared rows this write refers to (doctor, hospital) were read at or before
+        # this group 0 index; every node applies group 0 that far before applying the write
+        command["shared_index"] = raft.last_applied
+    with REPLICATION_COMMIT_SECONDS.time((model_type,)):
+        result = node.propose(command)
+    if not result.get("committed"):
+        REPLICATION_UNCOMMITTED.inc((model_type,))
+        for name, status in result.get("replication", {}).items():
+            if status["match_index"] < result["index"]:
+                print(f"Failed to sync {model_type} to {name}: matched through {status['match_index']}")
+        print(f"Replication of {model_type} {data_uuid} not committed: {result.get('error', 'no quorum')}")
+        raise ReplicationError(f"Write not committed: {result.get('error', 'no quorum')}")
+    if not result.get("applied"):
+        raise ReplicationError("Write committed but not yet applied on the leader", 504)
+    rejected = (result.get("result") or {}).get("rejected")
+    if rejected:
+        raise ReplicationError(f"Write rejected: {rejected}", 409)
+    return result
+
+# Marks a request already forwarded by a follower; a non-leader rejects it instead of forwarding again
+FORWARDED_HEADER = "X-Raft-Forwarded-By"
+NOT_LEADER_HEADER = "X-Raft-Not-Leader"
+HOP_BY_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+                      "te", "trailers", "transfer-encoding", "upgrade", "host", "content-length"}
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class ForwardBody:
+    """File-like view of the incoming request body for `requests` to stream.
+
+    Small bodies are buffered so they can be re-sent after a leader change;
+    larger ones are streamed straight from the client and can only be
+    retried if not a single byte was read yet.
+    """
+
+    def __init__(self, length, buffer_limit):
+        self.length = length
+        self.buffer = None
+        self.stream = request.stream
+        self.offset = 0
+        self.touched = False
+        if length is not None and length <= buffer_limit:
+            # Cached on the request, so the local endpoint can still read it if we become leader
+            self.buffer = request.get_data(cache=True)
+
+    def __len__(self):
+        return self.length
+
+    def payload(self):
+        """What to hand `requests` as `data`: nothing, this file, or a chunked generator."""
+        if self.length == 0:
+            return None
+        if self.length is None:
+            return iter(lambda: self.read(STREAM_CHUNK_BYTES), b"")
+        return self
+
+    def rewind(self):
+        """Prepare for a resend; returns False if the body can no longer be replayed."""
+        self.offset = 0
+        return self.buffer is not None or not self.touched
+
+    def read(self, size=-1):
+        if self.buffer is None:
+            self.touched = True
+            return self.stream.read(size)
+        end = len(self.buffer) if size is None or size < 0 else self.offset + size
+        data = self.buffer[self.offset:end]
+        self.offset += len(data)
+        return data
+
+
+class LeaderForwarder:
+    """Proxies writes to the cached leader of their Raft group over pooled connections.
+
+    The leader identity comes from AppendEntries (node.leader_id), so no
+    lookup happens per request. If the leader is unreachable or answers that
+    it is no longer leader, the forwarder waits for the cluster to settle on
+    a new one and retries, up to `retries` times.
+    """
+
+    def __init__(self):
+        self.http = None
+        self.lock = threading.Lock()
+        self.forwarded = 0
+        self.retried = 0
+        self.failed = 0
+
+    def session(self, leader_id, pool_size):
+        if self.http is None:
+            with self.lock:
+                if self.http is None:
+                    self.http = HttpTransport(max_workers=1, connections_per_peer=pool_size)
+        return self.http.session(leader_id)
+
+    def forward(self, config, node=raft, streaming=False):
+        """Relay the current request to the leader and return its response.
+
+        The read timeout covers the leader's commit and apply waits plus a
+        margin. A `streaming` response (bulk ingestion) sends its first line
+        only after a whole batch is hashed and replicated, so it gets the
+        much longer FORWARD_STREAM_TIMEOUT instead.
+        """
+        if streaming:
+            read_timeout = config.get("FORWARD_STREAM_TIMEOUT")
+        else:
+            read_timeout = node.replication_timeout * 2 + config.get("FORWARD_TIMEOUT_MARGIN")
+        timeout = (config.get("FORWARD_CONNECT_TIMEOUT"), read_timeout)
+        settle = node.election_timeout_range[1] * 2 + node.election_bias
+        headers = {k: v for k, v in request.headers if k.lower() not in HOP_BY_HOP_HEADERS}
+        headers[FORWARDED_HEADER] = node.node_id
+        body = ForwardBody(request.content_length, config.get("FORWARD_BUFFER_BYTES"))
+
+        leader_id = node.leader_id or node.wait_for_leader(settle)
+        error = "No leader elected in the cluster"
+        for attempt in range(config.get("FORWARD_RETRIES") + 1):
+            leader_url = node.peers.get(leader_id)
+            if not leader_url:
+                break
+            if attempt:
+                self.retried += 1
+                print(f"Retrying forwarded {request.method} {request.path} on new leader {leader_id}")
+            try:
+                resp = self.session(leader_id, config.get("FORWARD_POOL_SIZE")).request(
+                    method=request.method,
+                    url=f"{leader_url.rstrip('/')}{request.full_path.rstrip('?')}",
+                    data=body.payload(),
+                    headers=headers,
+                    timeout=timeout,
+                    stream=True
+                )
+            except requests.ConnectionError as e:
+                error = f"Forwarding to {leader_id} failed: {e}"
+                resp = None
+            except requests.Timeout as e:
+                # The leader may have applied the write; resending could duplicate it
+                self.failed += 1
+                return jsonify({"error": f"Forwarding to {leader_id} timed out: {e}"}), 504
+
+            if resp is not None and not resp.headers.get(NOT_LEADER_HEADER):
+                self.forwarded += 1
+                return self.relay(resp)
+            if resp is not None:
+                error = f"{leader_id} is no longer the leader"
+                resp.close()
+            if node.state == "LEADER" or not body.rewind():
+                break
+            leader_id = node.wait_for_leader(settle, exclude=leader_id)
+
+        if node.state == "LEADER" and body.rewind():
+            # Leadership moved to us while retrying
+            return None
+        self.failed += 1
+        return jsonify({"error": error}), 503
+
+    def relay(self, resp):
+        """Stream the leader's response back without buffering it."""
+        headers = [(k, v) for k, v in resp.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+        if "Content-Length" in resp.headers:
+            headers.append(("Content-Length", resp.headers["Content-Length"]))
+        out = Response(resp.raw.stream(STREAM_CHUNK_BYTES, decode_content=False), status=resp.status_code,
+                       headers=headers)
+        out.call_on_close(resp.close)
+        return out
+
+    def stats(self):
+        return {"forwarded": self.forwarded, "retried": self.retried, "failed": self.failed}
+
+
+forwarder = LeaderForwarder()
+
+# Set on successful writes; while present the client's reads skip the read replicas
+PRIMARY_COOKIE = "ehr_read_primary"
+
+def stick_to_primary():
+    """Pin this client's reads to the primary for DB_REPLICA_STICKY_SECONDS after a write.
+
+    Replicas apply a write some time after the primary commits it, so without
+    this a client could fail to read back what it just wrote.
+    """
+    seconds = current_app.config.get("DB_REPLICA_STICKY_SECONDS")
+    if not seconds or not current_app.config.get("SQLALCHEMY_BINDS"):
+        return
+
+    @after_this_request
+    def set_cookie(response):
+        if response.status_code < 400:
+            response.set_cookie(PRIMARY_COOKIE, "1", max_age=seconds, httponly=True, samesite="Lax")
+        return response
+
+# handle_write_request(partition=NEW_PARTITION): the write creates a patient, any group will do
+NEW_PARTITION = object()
+
+def handle_write_request(endpoint_func=None, partition=None, streaming=False):
+    """Run a write on the leader of its Raft group, forwarding it there if needed.
+
+    Without `partition` the write belongs to group 0 (the shared tables).
+    `partition(kwargs)` returns the group from the view arguments or body;
+    NEW_PARTITION picks a group for a new patient, preferring one this node
+    leads. The chosen group is kept in `g.raft_group` for
+    broadcast_replication and id allocation. `streaming` marks endpoints
+    whose response is streamed while the write proceeds (see forward).
+    """
+    if endpoint_func is None:
+        return lambda func: handle_write_request(func, partition, streaming)
+
     def wrapper(*args, **kwargs):
-        if raft.state == "LEADER":
+        stick_to_primary()
+        if partition is NEW_PARTITION:
+            g.raft_group = choose_group()
+        else:
+            g.raft_group = partition(kwargs) if partition else 0
+        node = raft_groups[g.raft_group]
+        if node.state == "LEADER":
+            return endpoint_func(*args, **kwargs)
+        if request.headers.get(FORWARDED_HEADER):
+            # Stale leader cache on the forwarding node: let it re-resolve rather than chaining hops
+            resp = jsonify({"error": "Not the leader", "group": node.group, "leader_id": node.leader_id})
+            resp.headers[NOT_LEADER_HEADER] = node.leader_id or "unknown"
+            return resp, 503
+
+        resp = forwarder.forward(current_app.config, node, streaming)
+        if resp is None:
             return endpoint_func(*args, **kwargs)
-        
-        leader_id = raft.voted_for
-        leader_url = raft.peers.get(leader_id)
-        if not leader_url:
-            return jsonify({"error": "No leader elected in the cluster"}), 503
-
-        try:
-            print(f"Forwarding {request.method} request to leader at {leader_url}")
-            resp = requests.request(
-                method=request.method,
-                url=f"{leader_url.rstrip('/')}{request.path}",
-                json=request.json,
-                headers={k: v for k, v in request.headers if k.lower() != 'host'},
-                timeout=2.0
-            )
-            return (resp.content, resp.status_code, resp.headers.items())
-        except Exception as e:
-            return jsonify({"error": f"Forwarding failed: {str(e)}"}), 500
-            
+        return resp
+
+    wrapper.__name__ = endpoint_func.__name__
+    return wrapper
+
+READ_CONSISTENCY_MODES = ("linearizable", "lease", "stale")
+
+def handle_read_request(endpoint_func):
+    """Apply the `?consistency=` read mode before serving a read locally.
+
+    `stale` reads the local DB as-is, from a read replica when one is
+    configured and the client has not written recently. `linearizable` first
+    obtains the leader's commit index (ReadIndex) and waits until this node
+    has applied it. `lease` does the same, but a leader holding a valid
+    lease answers without a network round trip. Both read the primary,
+    since only it is known to have applied that index, and wait on every
+    Raft group, since a response may draw on several partitions.
+    """
+    def wrapper(*args, **kwargs):
+        mode = request.args.get("consistency", current_app.config.get("READ_CONSISTENCY"))
+        if mode not in READ_CONSISTENCY_MODES:
+            return jsonify({"error": f"consistency must be one of: {', '.join(READ_CONSISTENCY_MODES)}"}), 400
+        if mode != "stale":
+            for node in raft_groups:
+                error = node.read_barrier(mode, current_app.config.get("READ_TIMEOUT"))
+                if error:
+                    return jsonify({"error": error}), 503
+        elif not request.cookies.get(PRIMARY_COOKIE):
+            use_replica()
+        return endpoint_func(*args, **kwargs)
+
     wrapper.__name__ = endpoint_func.__name__
-    return wrapper
\ No newline at end of file
+    return wrapper
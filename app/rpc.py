@@ -0,0 +1,237 @@
+import asyncio
+import hmac
+import itertools
+import json
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from transport import Transport
+
+# Frame: body length, request id, kind, flags, method; then the (JSON) body
+HEADER = struct.Struct("!IIBBB")
+MAX_FRAME_BYTES = 256 * 1024 * 1024
+
+KIND_HELLO, KIND_REQUEST, KIND_RESPONSE, KIND_ERROR = range(4)
+FLAG_ZLIB = 1
+
+# Wire method ids; the paths are the HTTP routes they replace
+METHODS = ("/raft/request_vote", "/raft/append_entries", "/raft/install_snapshot",
+           "/raft/read_index")
+METHOD_IDS = {path: i for i, path in enumerate(METHODS)}
+# Handlers that may block for a replication timeout or a whole snapshot load;
+# they get their own pool so they cannot hold up votes and AppendEntries
+SLOW_METHODS = ("/raft/read_index", "/raft/install_snapshot")
+
+
+class RpcError(Exception):
+    """The peer's handler raised; carries its error message."""
+
+
+def encode_frame(request_id, kind, method, payload, compress_min):
+    body = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    flags = 0
+    if compress_min and len(body) >= compress_min:
+        body = zlib.compress(body, 1)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(len(body), request_id, kind, flags, method) + body
+
+
+async def read_frame(reader):
+    """Return (request_id, kind, method, payload); raises on EOF or an oversized frame."""
+    length, request_id, kind, flags, method = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {length} bytes exceeds the limit")
+    body = await reader.readexactly(length)
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    return request_id, kind, method, json.loads(body)
+
+
+class RpcServer:
+    """Serves Raft RPCs on a dedicated port, away from the HTTP API.
+
+    An asyncio loop on its own thread owns the sockets. Each connection
+    carries many concurrent requests (responses go back tagged with the
+    request id, in completion order), and handlers run on a private thread
+    pool, so a busy API worker pool cannot delay a heartbeat. ReadIndex and
+    snapshot installs (SLOW_METHODS) run on a second pool, so they cannot
+    starve votes and AppendEntries either. The first frame on a connection
+    must be a HELLO carrying the cluster token.
+    """
+
+    def __init__(self, handlers, host="0.0.0.0", port=7001, auth_token=None, workers=16, slow_workers=8,
+                 compress_min=16384):
+        self.handlers = {METHOD_IDS[path]: fn for path, fn in handlers.items()}
+        self.host = host
+        self.port = port
+        self.auth_token = auth_token
+        self.compress_min = compress_min
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rpc-handler")
+        self.slow_pool = ThreadPoolExecutor(max_workers=slow_workers, thread_name_prefix="rpc-slow-handler")
+        self.slow_methods = {METHOD_IDS[path] for path in SLOW_METHODS}
+        # The loop only keeps weak references to tasks; these keep in-flight dispatches alive
+        self.tasks = set()
+        self.loop = None
+        self.listening = False
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+            except OSError as e:
+                print(f"Raft RPC server failed to listen on {self.host}:{self.port}: {e}")
+                ready.set()
+                return
+            self.listening = True
+            print(f"Raft RPC listening on {self.host}:{self.port}")
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="rpc-server", daemon=True).start()
+        if not ready.wait(5):
+            print(f"Raft RPC server did not start listening on {self.host}:{self.port} within 5s")
+
+    async def _serve(self, reader, writer):
+        write_lock = asyncio.Lock()
+        try:
+            _, kind, _, payload = await read_frame(reader)
+            token = payload.get("token") if isinstance(payload, dict) else None
+            if kind != KIND_HELLO or (self.auth_token and not hmac.compare_digest(str(token), self.auth_token)):
+                return
+            while True:
+                request_id, kind, method, payload = await read_frame(reader)
+                if kind == KIND_REQUEST:
+                    task = asyncio.ensure_future(self._dispatch(writer, write_lock, request_id, method, payload))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, writer, write_lock, request_id, method, payload):
+        handler = self.handlers.get(method)
+        try:
+            if handler is None:
+                raise RpcError(f"Unknown method {method}")
+            pool = self.slow_pool if method in self.slow_methods else self.pool
+            result = await self.loop.run_in_executor(pool, handler, payload)
+            frame = encode_frame(request_id, KIND_RESPONSE, method, result, self.compress_min)
+        except Exception as e:
+            frame = encode_frame(request_id, KIND_ERROR, method, str(e), 0)
+        async with write_lock:
+            if writer.is_closing():
+                return
+            writer.write(frame)
+            await writer.drain()
+
+
+class _Connection:
+    """One persistent, multiplexed connection to a peer (used on the client loop only)."""
+
+    def __init__(self, rpc, host, port):
+        self.rpc = rpc
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+        self.pending = {}
+        self.read_task = None
+        self.connect_lock = asyncio.Lock()
+
+    async def ensure(self, timeout):
+        async with self.connect_lock:
+            if self.writer is not None and not self.writer.is_closing():
+                return
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), timeout)
+            writer.write(encode_frame(0, KIND_HELLO, 0, {"token": self.rpc.auth_token}, 0))
+            self.reader, self.writer = reader, writer
+            # Held so the loop's weak reference is not the only one
+            self.read_task = asyncio.ensure_future(self._read_loop(reader, writer))
+
+    async def request(self, method, payload, timeout):
+        await self.ensure(timeout)
+        request_id = next(self.rpc.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            self.writer.write(encode_frame(request_id, KIND_REQUEST, method, payload, self.rpc.compress_min))
+            await self.writer.drain()
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _read_loop(self, reader, writer):
+        error = ConnectionError("Connection closed by peer")
+        try:
+            while True:
+                request_id, kind, _, payload = await read_frame(reader)
+                future = self.pending.get(request_id)
+                if future is None or future.done():
+                    continue
+                if kind == KIND_ERROR:
+                    future.set_exception(RpcError(payload))
+                else:
+                    future.set_result(payload)
+        except Exception as e:
+            if not isinstance(e, asyncio.IncompleteReadError):
+                error = ConnectionError(str(e))
+        writer.close()
+        if self.writer is writer:
+            self.reader = self.writer = None
+        for future in list(self.pending.values()):
+            if not future.done():
+                future.set_exception(error)
+
+
+class RpcTransport(Transport):
+    """Client side of the Raft RPC port, a drop-in for HttpTransport in RaftNode.
+
+    Peers are addressed by name. `addresses` maps a name to "host:port"; a
+    peer missing from it is reached on `default_port` at the host of its
+    HTTP url. Callers block on a future resolved by the client event loop.
+    """
+
+    def __init__(self, addresses=None, default_port=7001, auth_token=None, compress_min=16384, max_workers=32):
+        super().__init__(max_workers)
+        self.addresses = addresses or {}
+        self.default_port = default_port
+        self.auth_token = auth_token
+        self.compress_min = compress_min
+        self.ids = itertools.count(1)
+        self.connections = {}
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="rpc-client", daemon=True).start()
+
+    def address(self, name, url):
+        if name in self.addresses:
+            host, _, port = self.addresses[name].rpartition(":")
+            return host, int(port)
+        return urlparse(url).hostname, self.default_port
+
+    async def _call(self, name, url, method, payload, timeout):
+        connection = self.connections.get(name)
+        if connection is None:
+            connection = self.connections[name] = _Connection(self, *self.address(name, url))
+        return await connection.request(method, payload, timeout)
+
+    def post(self, name, url, path, payload, headers=None, timeout=1.0):
+        """Same contract as HttpTransport.post; `headers` is unused (auth is per connection)."""
+        start = time.monotonic()
+        future = asyncio.run_coroutine_threadsafe(
+            self._call(name, url, METHOD_IDS[path], payload, timeout), self.loop
+        )
+        try:
+            outcome = {"ok": True, "status": 200, "body": future.result(timeout)}
+        except RpcError as e:
+            outcome = {"ok": False, "status": 500, "error": str(e)[:200]}
+        except Exception as e:
+            future.cancel()
+            outcome = {"ok": False, "status": None, "error": str(e) or type(e).__name__}
+        outcome["latency_ms"] = round((time.monotonic() - start) * 1000, 2)
+        return outcome
@@ -1,8 +1,19 @@
-from app import app, db
+from app import app, db, set_patient_fields
 from database import Hospital, UserRole, User, Patient, Encounter, Observation, Prescription
-from encryption import Encryptor, hash_password
-from datetime import datetime, timedelta
+from encryption import Encryptor, BlindIndexer, hash_password
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter, deque
+from sqlalchemy import func, insert
+import argparse
+import csv
+import io
+import multiprocessing
+import os
+import random
+import time
 import uuid
+import vitals
 
 def seed_database():
     with app.app_context():
@@ -69,38 +80,41 @@ def seed_database():
         db.session.flush()
         
         print("Creating patients...")
-        patients = [
-            Patient(
-                uuid=str(uuid.uuid4()),
-                full_name_encrypted=encryptor.encrypt("Alice Williams"),
-                date_of_birth_encrypted=encryptor.encrypt("1985-03-15"),
-                gender="Female",
-                phone_encrypted=encryptor.encrypt("555-0101"),
-                address_encrypted=encryptor.encrypt("456 Oak Ave, New York, NY 10002")
-            ),
-            Patient(
-                uuid=str(uuid.uuid4()),
-                full_name_encrypted=encryptor.encrypt("Bob Martinez"),
-                date_of_birth_encrypted=encryptor.encrypt("1978-07-22"),
-                gender="Male",
-                phone_encrypted=encryptor.encrypt("555-0102"),
-                address_encrypted=encryptor.encrypt("789 Elm St, New York, NY 10003")
-            ),
-            Patient(
-                uuid=str(uuid.uuid4()),
-                full_name_encrypted=encryptor.encrypt("Carol Anderson"),
-                date_of_birth_encrypted=encryptor.encrypt("1992-11-08"),
-                gender="Female",
-                phone_encrypted=encryptor.encrypt("555-0103"),
-                address_encrypted=encryptor.encrypt("321 Pine Rd, New York, NY 10004")
-            )
+        patient_data = [
+            {
+                "full_name": "Alice Williams",
+                "date_of_birth": "1985-03-15",
+                "gender": "Female",
+                "phone": "555-0101",
+                "address": "456 Oak Ave, New York, NY 10002"
+            },
+            {
+                "full_name": "Bob Martinez",
+                "date_of_birth": "1978-07-22",
+                "gender": "Male",
+                "phone": "555-0102",
+                "address": "789 Elm St, New York, NY 10003"
+            },
+            {
+                "full_name": "Carol Anderson",
+                "date_of_birth": "1992-11-08",
+                "gender": "Female",
+                "phone": "555-0103",
+                "address": "321 Pine Rd, New York, NY 10004"
+            }
         ]
+        patients = []
+        for data in patient_data:
+            patient = Patient(uuid=str(uuid.uuid4()))
+            set_patient_fields(patient, data)
+            patients.append(patient)
         db.session.add_all(patients)
         db.session.flush()
         
         print("Creating encounters...")
         encounters = [
             Encounter(
+                uuid=str(uuid.uuid4()),
                 patient_id=patients[0].patient_id,
                 doctor_id=users[0].user_id,
                 hospital_id=hospital.hospital_id,
@@ -109,6 +123,7 @@ def seed_database():
                 visit_date=datetime.now() - timedelta(days=5)
             ),
             Encounter(
+                uuid=str(uuid.uuid4()),
                 patient_id=patients[1].patient_id,
                 doctor_id=users[1].user_id,
                 hospital_id=hospital.hospital_id,
@@ -117,6 +132,7 @@ def seed_database():
                 visit_date=datetime.now() - timedelta(days=2)
             ),
             Encounter(
+                uuid=str(uuid.uuid4()),
                 patient_id=patients[2].patient_id,
                 doctor_id=users[0].user_id,
                 hospital_id=hospital.hospital_id,
@@ -131,6 +147,7 @@ def seed_database():
         print("Creating observations...")
         observations = [
             Observation(
+                uuid=str(uuid.uuid4()),
                 encounter_id=encounters[0].encounter_id,
                 patient_id=patients[0].patient_id,
                 type="Blood Pressure",
@@ -138,6 +155,7 @@ def seed_database():
                 unit="mmHg"
             ),
             Observation(
+                uuid=str(uuid.uuid4()),
                 encounter_id=encounters[0].encounter_id,
                 patient_id=patients[0].patient_id,
                 type="Heart Rate",
@@ -145,6 +163,7 @@ def seed_database():
                 unit="bpm"
             ),
             Observation(
+                uuid=str(uuid.uuid4()),
                 encounter_id=encounters[1].encounter_id,
                 patient_id=patients[1].patient_id,
                 type="Blood Pressure",
@@ -152,6 +171,7 @@ def seed_database():
                 unit="mmHg"
             ),
             Observation(
+                uuid=str(uuid.uuid4()),
                 encounter_id=encounters[1].encounter_id,
                 patient_id=patients[1].patient_id,
                 type="Temperature",
@@ -159,6 +179,7 @@ def seed_database():
                 unit="°F"
             ),
             Observation(
+                uuid=str(uuid.uuid4()),
                 encounter_id=encounters[2].encounter_id,
                 patient_id=patients[2].patient_id,
                 type="Weight",
@@ -172,6 +193,7 @@ def seed_database():
         print("Creating prescriptions...")
         prescriptions = [
             Prescription(
+                uuid=str(uuid.uuid4()),
                 encounter_id=encounters[1].encounter_id,
                 patient_id=patients[1].patient_id,
                 doctor_id=users[1].user_id,
@@ -182,6 +204,7 @@ def seed_database():
                 notes_encrypted=encryptor.encrypt("Take in the morning with food")
             ),
             Prescription(
+                uuid=str(uuid.uuid4()),
                 encounter_id=encounters[1].encounter_id,
                 patient_id=patients[1].patient_id,
                 doctor_id=users[1].user_id,
@@ -192,6 +215,7 @@ def seed_database():
                 notes_encrypted=encryptor.encrypt("Low dose for heart health")
             ),
             Prescription(
+                uuid=str(uuid.uuid4()),
                 encounter_id=encounters[2].encounter_id,
                 patient_id=patients[2].patient_id,
                 doctor_id=users[0].user_id,
@@ -214,5 +238,399 @@ def seed_database():
         print(f"   - {len(observations)} Observations")
         print(f"   - {len(prescriptions)} Prescriptions")
 
-if __name__ == "__main__":
+# SYNTHETIC DATASET GENERATOR
+#
+# Every patient's records come from a Random seeded with "<seed>:<patient index>",
+# so a given --seed and set of parameters always yields the same plaintext
+# rows, ids and uuids, whatever --workers or --batch-size. (Ciphertext
+# differs between runs: Fernet uses a random IV.)
+
+FEMALE_NAMES = ("Mary", "Patricia", "Jennifer", "Linda", "Elizabeth", "Barbara", "Susan", "Jessica", "Sarah",
+                "Karen", "Lisa", "Nancy", "Sandra", "Ashley", "Emily", "Maria", "Olivia", "Emma", "Sophia",
+                "Isabella", "Mia", "Grace", "Chloe", "Aaliyah", "Priya", "Mei", "Fatima", "Ana", "Zoe", "Hannah")
+MALE_NAMES = ("James", "Robert", "John", "Michael", "David", "William", "Richard", "Joseph", "Thomas",
+              "Christopher", "Charles", "Daniel", "Matthew", "Anthony", "Mark", "Steven", "Andrew", "Joshua",
+              "Kevin", "Brian", "Ethan", "Noah", "Liam", "Lucas", "Omar", "Wei", "Raj", "Carlos", "Jamal", "Ivan")
+LAST_NAMES = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez",
+              "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore",
+              "Jackson", "Martin", "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez",
+              "Lewis", "Robinson", "Walker", "Young", "Allen", "King", "Wright", "Scott", "Nguyen", "Hill",
+              "Flores", "Green", "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell", "Chen",
+              "Patel", "Kim")
+STREETS = ("Oak", "Maple", "Pine", "Cedar", "Elm", "Washington", "Lake", "Hill", "Park", "Main", "Church",
+           "High", "Sunset", "River", "Spring", "Highland", "Forest", "Madison", "Lincoln", "Franklin")
+STREET_SUFFIXES = ("St", "Ave", "Rd", "Blvd", "Ln", "Dr", "Ct", "Way")
+CITIES = (("New York", "NY", "100"), ("Brooklyn", "NY", "112"), ("Newark", "NJ", "071"), ("Boston", "MA", "021"),
+          ("Philadelphia", "PA", "191"), ("Chicago", "IL", "606"), ("Houston", "TX", "770"),
+          ("Phoenix", "AZ", "850"), ("Seattle", "WA", "981"), ("Denver", "CO", "802"), ("Atlanta", "GA", "303"),
+          ("Miami", "FL", "331"))
+AREA_CODES = ("212", "718", "917", "973", "617", "215", "312", "713", "602", "206", "303", "404", "305")
+HOSPITAL_KINDS = ("General Hospital", "Medical Center", "Community Hospital", "Memorial Hospital", "Health Clinic")
+
+# (youngest, oldest, share of patients)
+AGE_BANDS = ((0, 17, 22), (18, 34, 22), (35, 49, 19), (50, 64, 19), (65, 79, 13), (80, 99, 5))
+GENDERS = (("Female", 51), ("Male", 48), ("Other", 1))
+# Visit type -> (share of visits, reasons)
+VISIT_TYPES = {
+    "Checkup": (40, ("Annual physical examination", "Well visit", "Routine blood work", "Vaccination")),
+    "Follow-up": (25, ("Post-surgery check", "Medication review", "Lab results review", "Blood pressure follow-up")),
+    "Consultation": (15, ("Persistent cough", "Joint pain", "Skin rash", "Headaches", "Fatigue")),
+    "Emergency": (10, ("Chest pain", "Shortness of breath", "Fracture", "Abdominal pain", "High fever")),
+    "Lab Visit": (10, ("Lipid panel", "HbA1c test", "Complete blood count", "Thyroid panel")),
+}
+# Vital type -> unit; values come from vital_value()
+VITAL_TYPES = {
+    "Blood Pressure": "mmHg",
+    "Heart Rate": "bpm",
+    "Temperature": "°F",
+    "Weight": "kg",
+    "Respiratory Rate": "breaths/min",
+    "Oxygen Saturation": "%",
+    "Blood Glucose": "mg/dL",
+}
+# (medication, dosages, frequencies, durations)
+MEDICATIONS = (
+    ("Lisinopril", ("5mg", "10mg", "20mg"), ("Once daily",), ("30 days", "90 days", "Ongoing")),
+    ("Metformin", ("500mg", "850mg", "1000mg"), ("Twice daily", "Once daily"), ("90 days", "Ongoing")),
+    ("Atorvastatin", ("10mg", "20mg", "40mg"), ("Once daily",), ("90 days", "Ongoing")),
+    ("Amoxicillin", ("250mg", "500mg"), ("Three times daily",), ("7 days", "10 days")),
+    ("Ibuprofen", ("200mg", "400mg", "600mg"), ("Every 6 hours as needed",), ("5 days", "10 days")),
+    ("Aspirin", ("81mg",), ("Once daily",), ("Ongoing",)),
+    ("Levothyroxine", ("25mcg", "50mcg", "100mcg"), ("Once daily",), ("90 days", "Ongoing")),
+    ("Albuterol", ("90mcg/puff",), ("Every 4-6 hours as needed",), ("30 days",)),
+    ("Omeprazole", ("20mg", "40mg"), ("Once daily",), ("14 days", "30 days")),
+    ("Sertraline", ("25mg", "50mg", "100mg"), ("Once daily",), ("90 days",)),
+)
+NOTES = ("Take in the morning with food", "Take with a full glass of water", "Complete full course even if symptoms improve",
+         "Avoid alcohol", "May cause drowsiness", "Monitor blood pressure weekly", "Do not exceed 4 doses in 24 hours",
+         "Take on an empty stomach")
+DATASET_END = "2025-01-01"
+
+# Generated tables in foreign key order, with the columns loaded (ids left to the database are omitted)
+TABLES = (
+    ("patient", ("patient_id", "uuid", "full_name_encrypted", "date_of_birth_encrypted", "gender", "phone_encrypted",
+                 "address_encrypted", "full_name_bidx", "date_of_birth_bidx", "phone_bidx", "created_at")),
+    ("encounter", ("encounter_id", "uuid", "patient_id", "doctor_id", "hospital_id", "visit_type", "visit_reason",
+                   "visit_date", "created_at")),
+    ("observation", ("uuid", "encounter_id", "patient_id", "type", "value", "unit", "recorded_at")),
+    ("prescription", ("uuid", "encounter_id", "patient_id", "doctor_id", "medication", "dosage", "frequency",
+                      "duration", "notes_encrypted", "prescribed_at")),
+    ("vital_chunk", ("patient_id", "type", "day_start", "count", "timestamps", "values")),
+    ("vital_rollup", ("patient_id", "type", "resolution", "bucket_start", "count", "min", "max", "sum")),
+)
+
+def patient_rng(seed, index):
+    return random.Random(f"{seed}:{index}")
+
+def seeded_uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def encounter_count(rng, mean):
+    """Heavy-tailed visit count: most patients come rarely, a few very often. Must be a patient's first draw."""
+    if mean <= 0:
+        return 0
+    return min(round(rng.expovariate(1 / mean)), int(mean * 10))
+
+def poisson(rng, mean):
+    limit, k, p = 2.718281828459045 ** -mean, 0, rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k
+
+def weighted(rng, pairs):
+    return rng.choices([p[0] for p in pairs], weights=[p[-1] for p in pairs])[0]
+
+def vital_value(rng, type_, baseline):
+    if type_ == "Blood Pressure":
+        systolic = round(rng.gauss(baseline["systolic"], 8))
+        return f"{systolic}/{round(systolic * 0.65 + rng.gauss(0, 4))}"
+    if type_ == "Heart Rate":
+        return str(round(rng.gauss(baseline["heart_rate"], 6)))
+    if type_ == "Temperature":
+        return f"{rng.gauss(98.4, 0.7):.1f}"
+    if type_ == "Weight":
+        return f"{baseline['weight'] + rng.gauss(0, 1.5):.1f}"
+    if type_ == "Respiratory Rate":
+        return str(round(rng.gauss(16, 2)))
+    if type_ == "Oxygen Saturation":
+        return str(min(100, round(rng.gauss(97.5, 1.2))))
+    return str(round(rng.gauss(baseline["glucose"], 20)))
+
+def generate_patient(index, encounter_id, cfg, rows, plaintexts, readings):
+    """Append one patient's rows to `rows`; PII goes to `plaintexts` to be encrypted in one pass.
+
+    Returns the next free encounter id.
+    """
+    rng = patient_rng(cfg["seed"], index)
+    visits = encounter_count(rng, cfg["encounters"])
+    end = cfg["end"]
+    patient_id = cfg["patient_base"] + index + 1
+
+    gender = weighted(rng, GENDERS)
+    first_names = {"Female": FEMALE_NAMES, "Male": MALE_NAMES}.get(gender, FEMALE_NAMES + MALE_NAMES)
+    full_name = f"{rng.choice(first_names)} {rng.choice(LAST_NAMES)}"
+    youngest, oldest, _ = weighted(rng, [(band, band[2]) for band in AGE_BANDS])
+    born = end - timedelta(days=rng.uniform(youngest * 365.25, (oldest + 1) * 365.25))
+    city, state, zip_prefix = rng.choice(CITIES)
+    phone = None if rng.random() < 0.05 else f"{rng.choice(AREA_CODES)}-555-{rng.randrange(10000):04d}"
+    address = None if rng.random() < 0.08 else \
+        f"{rng.randint(1, 9999)} {rng.choice(STREETS)} {rng.choice(STREET_SUFFIXES)}, {city}, {state} {zip_prefix}{rng.randrange(100):02d}"
+    registered = max(end - timedelta(days=rng.uniform(0, cfg["years"] * 365.25)), born)
+    baseline = {"systolic": rng.gauss(118 + (end - born).days / 365.25 * 0.3, 10),
+                "heart_rate": rng.gauss(74, 8), "weight": max(rng.gauss(78, 16), 45), "glucose": rng.gauss(100, 12)}
+
+    plaintexts.append((("patient", len(rows["patient"])), (full_name, born.date().isoformat(), phone, address)))
+    rows["patient"].append([patient_id, seeded_uuid(rng), None, None, gender, None, None,
+                            cfg["indexer"].index("full_name", full_name),
+                            cfg["indexer"].index("date_of_birth", born.date().isoformat()),
+                            cfg["indexer"].index("phone", phone), registered])
+
+    hospital_id = rng.choice(cfg["hospital_ids"])
+    doctors = cfg["doctors_by_hospital"].get(hospital_id) or cfg["doctor_ids"]
+    span = (end - registered).total_seconds()
+    dates = sorted(registered + timedelta(seconds=rng.uniform(0, span)) for _ in range(visits))
+    for visit_date in dates:
+        visit_date = visit_date.replace(hour=rng.randint(8, 17), minute=rng.randrange(60), second=0, microsecond=0)
+        visit_type = weighted(rng, [(t, w) for t, (w, _) in VISIT_TYPES.items()])
+        # Mostly the home hospital's doctors, sometimes a referral elsewhere
+        doctor_id = rng.choice(doctors) if rng.random() < 0.9 else rng.choice(cfg["doctor_ids"])
+        rows["encounter"].append([encounter_id, seeded_uuid(rng), patient_id, doctor_id, hospital_id, visit_type,
+                                  rng.choice(VISIT_TYPES[visit_type][1]), visit_date, visit_date])
+
+        panel = cfg["observations"]
+        size = rng.randint(max(panel - 2, 0), panel + 2) if panel >= 2 else poisson(rng, panel)
+        recorded_at = visit_date + timedelta(minutes=rng.randint(5, 45))
+        for type_ in rng.sample(list(VITAL_TYPES), min(size, len(VITAL_TYPES))):
+            value = vital_value(rng, type_, baseline)
+            rows["observation"].append([seeded_uuid(rng), encounter_id, patient_id, type_, value,
+                                        VITAL_TYPES[type_], recorded_at])
+            item = vitals.reading(patient_id, type_, recorded_at, value)
+            if item is not None:
+                readings.append(item)
+            recorded_at += timedelta(minutes=rng.randint(1, 5))
+
+        for _ in range(poisson(rng, cfg["prescriptions"])):
+            medication, dosages, frequencies, durations = rng.choice(MEDICATIONS)
+            notes = rng.choice(NOTES) if rng.random() < 0.6 else None
+            plaintexts.append((("prescription", len(rows["prescription"])), (notes,)))
+            rows["prescription"].append([seeded_uuid(rng), encounter_id, patient_id, doctor_id, medication,
+                                         rng.choice(dosages), rng.choice(frequencies), rng.choice(durations), None,
+                                         visit_date + timedelta(minutes=rng.randint(30, 120))])
+        encounter_id += 1
+    return encounter_id
+
+# Ciphertext columns filled after the batch's encryption pass
+ENCRYPTED_SLOTS = {"patient": (2, 3, 5, 6), "prescription": (8,)}
+
+_worker = {}
+
+def _init_worker(encryption_key, blind_index_key):
+    _worker["encryptor"] = Encryptor(encryption_key, workers=1)
+    _worker["indexer"] = BlindIndexer(blind_index_key)
+
+def generate_batch(cfg, first, count, encounter_id, fmt):
+    """Build, encrypt and format the rows of patients [first, first + count) in a worker process."""
+    cfg = dict(cfg, indexer=_worker["indexer"])
+    rows = {table: [] for table, _ in TABLES}
+    plaintexts, readings = [], []
+    for index in range(first, first + count):
+        encounter_id = generate_patient(index, encounter_id, cfg, rows, plaintexts, readings)
+
+    ciphertexts = iter(_worker["encryptor"].encrypt_many([v for _, values in plaintexts for v in values]))
+    for (table, position), values in plaintexts:
+        row = rows[table][position]
+        for slot in ENCRYPTED_SLOTS[table][:len(values)]:
+            row[slot] = next(ciphertexts)
+
+    chunks, rollups = vitals.series_rows(readings)
+    for table, items in (("vital_chunk", chunks), ("vital_rollup", rollups)):
+        columns = dict(TABLES)[table]
+        rows[table] = [[item[c] for c in columns] for item in items]
+
+    counts = {table: len(table_rows) for table, table_rows in rows.items()}
+    return counts, {table: format_rows(table_rows, fmt) for table, table_rows in rows.items() if table_rows}
+
+def format_rows(rows, fmt):
+    """CSV text for COPY, or DB-API tuples in SQLite's storage formats for executemany."""
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for row in rows:
+            writer.writerow([v.isoformat(sep=" ") if isinstance(v, datetime)
+                             else "\\x" + v.hex() if isinstance(v, bytes) else v for v in row])
+        return out.getvalue()
+    # SQLAlchemy stores SQLite datetimes as naive UTC text in this format
+    return [tuple(v.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f") if isinstance(v, datetime) else v
+                  for v in row) for row in rows]
+
+class BulkLoader:
+    """Writes generated batches on one raw connection: COPY on PostgreSQL, executemany on SQLite.
+
+    Each batch is one transaction, so memory stays bounded by the batch size.
+    """
+
+    def __init__(self, engine):
+        self.dialect = engine.dialect.name
+        if self.dialect not in ("postgresql", "sqlite"):
+            raise ValueError(f"The generator supports PostgreSQL and SQLite, not {self.dialect}")
+        self.format = "csv" if self.dialect == "postgresql" else "rows"
+        self.quote = engine.dialect.identifier_preparer.quote
+        self.conn = engine.raw_connection()
+
+    def load(self, batch):
+        cursor = self.conn.cursor()
+        try:
+            for table, columns in TABLES:
+                if table not in batch:
+                    continue
+                names = ", ".join(self.quote(c) for c in columns)
+                if self.format == "csv":
+                    cursor.copy_expert(f"COPY {self.quote(table)} ({names}) FROM STDIN WITH (FORMAT csv)",
+                                       io.StringIO(batch[table]))
+                else:
+                    cursor.executemany(f"INSERT INTO {self.quote(table)} ({names}) VALUES ({', '.join('?' * len(columns))})",
+                                       batch[table])
+            self.conn.commit()
+        finally:
+            cursor.close()
+
+    def finish(self):
+        cursor = self.conn.cursor()
+        if self.dialect == "postgresql":
+            # Ids were loaded explicitly; move the sequences past them
+            for table, column in (("patient", "patient_id"), ("encounter", "encounter_id")):
+                cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                               f"(SELECT MAX({column}) FROM {self.quote(table)}))")
+        cursor.execute("ANALYZE")
+        self.conn.commit()
+        cursor.close()
+        self.conn.close()
+
+def create_staff(rng, hospital_count, doctor_count):
+    """Insert the synthetic hospitals and doctors; returns (hospital ids, {hospital id: doctor ids})."""
+    hospitals = []
+    for _ in range(hospital_count):
+        city, state, zip_prefix = rng.choice(CITIES)
+        hospitals.append({"uuid": seeded_uuid(rng), "name": f"{city} {rng.choice(HOSPITAL_KINDS)}",
+                          "location": f"{rng.randint(1, 999)} {rng.choice(STREETS)} {rng.choice(STREET_SUFFIXES)}, "
+                                      f"{city}, {state} {zip_prefix}{rng.randrange(100):02d}"})
+    db.session.execute(insert(Hospital), hospitals)
+    ids = dict(db.session.query(Hospital.uuid, Hospital.hospital_id).filter(
+        Hospital.uuid.in_([h["uuid"] for h in hospitals])))
+    hospital_ids = [ids[h["uuid"]] for h in hospitals]
+
+    role_id = db.session.query(UserRole.role_id).filter_by(role_name="Doctor").scalar()
+    # One shared hash: hashing thousands of passwords would dominate small runs
+    password = hash_password("password123")
+    doctors = []
+    for n in range(doctor_count):
+        first, last = rng.choice(FEMALE_NAMES + MALE_NAMES), rng.choice(LAST_NAMES)
+        doctors.append({"uuid": seeded_uuid(rng), "hospital_id": rng.choice(hospital_ids),
+                        "full_name": f"Dr. {first} {last}", "email": f"{first}.{last}.{n}@ehr.example.org".lower(),
+                        "password": password, "role_id": role_id})
+    db.session.execute(insert(User), doctors)
+    by_hospital = {}
+    for hospital_id, user_id in db.session.query(User.hospital_id, User.user_id).filter(
+            User.uuid.in_([d["uuid"] for d in doctors])).order_by(User.user_id):
+        by_hospital.setdefault(hospital_id, []).append(user_id)
+    db.session.commit()
+    return hospital_ids, by_hospital
+
+def generate_dataset(patients, encounters_per_patient=20, observations_per_encounter=4,
+                     prescriptions_per_encounter=0.6, hospitals=20, doctors=500, years=5, until=DATASET_END,
+                     seed=1, workers=None, batch_size=500):
+    """Reset to the sample data, then add a large synthetic dataset.
+
+    Patients are generated and encrypted in worker processes, `batch_size`
+    at a time, and bulk-loaded by this process in order. At most two
+    batches per worker are in flight, so memory use does not grow with
+    the dataset size.
+    """
     seed_database()
+    workers = workers or os.cpu_count() or 1
+    with app.app_context():
+        started = time.monotonic()
+        print(f"\nGenerating {patients:,} patients (seed {seed}, {workers} workers)...")
+        hospital_ids, doctors_by_hospital = create_staff(random.Random(f"{seed}:staff"), hospitals, doctors)
+        cfg = {
+            "seed": seed,
+            "end": datetime.fromisoformat(until).replace(tzinfo=timezone.utc),
+            "years": years,
+            "encounters": encounters_per_patient,
+            "observations": observations_per_encounter,
+            "prescriptions": prescriptions_per_encounter,
+            "hospital_ids": hospital_ids,
+            "doctor_ids": [d for ids in doctors_by_hospital.values() for d in ids],
+            "doctors_by_hospital": doctors_by_hospital,
+            "patient_base": db.session.query(func.max(Patient.patient_id)).scalar() or 0,
+        }
+        encounter_id = (db.session.query(func.max(Encounter.encounter_id)).scalar() or 0) + 1
+        db.session.remove()
+        # Fork the workers before opening the loader's connection so they never share it
+        db.engine.dispose()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                                   initializer=_init_worker,
+                                   initargs=(app.config["ENCRYPTION_KEY"], app.config["BLIND_INDEX_KEY"]))
+        pool.submit(int).result()
+        loader = BulkLoader(db.engine)
+
+        totals = Counter()
+        pending = deque()
+
+        def drain():
+            counts, batch = pending.popleft().result()
+            loader.load(batch)
+            totals.update(counts)
+            elapsed = time.monotonic() - started
+            print(f"   {totals['patient']:,}/{patients:,} patients, {totals['encounter']:,} encounters "
+                  f"({totals['patient'] / elapsed:,.0f} patients/s)")
+
+        with pool:
+            for first in range(0, patients, batch_size):
+                count = min(batch_size, patients - first)
+                pending.append(pool.submit(generate_batch, cfg, first, count, encounter_id, loader.format))
+                # The next batch's first encounter id depends only on this batch's visit counts
+                encounter_id += sum(encounter_count(patient_rng(seed, i), encounters_per_patient)
+                                    for i in range(first, first + count))
+                if len(pending) >= 2 * workers:
+                    drain()
+            while pending:
+                drain()
+        loader.finish()
+
+        elapsed = time.monotonic() - started
+        print(f"\n✅ Generated dataset in {elapsed:.1f}s!")
+        print(f"   - {hospitals} Hospitals, {doctors} Doctors")
+        for table, _ in TABLES:
+            print(f"   - {totals[table]:,} {table} rows")
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the sample data, or generate a large synthetic dataset")
+    parser.add_argument("--patients", type=int, help="Generate this many synthetic patients on top of the sample data")
+    parser.add_argument("--encounters-per-patient", type=float, default=20, help="Mean visits per patient (heavy-tailed)")
+    parser.add_argument("--observations-per-encounter", type=float, default=4, help="Mean vitals recorded per visit")
+    parser.add_argument("--prescriptions-per-encounter", type=float, default=0.6, help="Mean prescriptions per visit")
+    parser.add_argument("--hospitals", type=int, default=20)
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--years", type=float, default=5, help="Years of history per patient, at most")
+    parser.add_argument("--until", default=DATASET_END, help="Date the generated history ends (YYYY-MM-DD)")
+    parser.add_argument("--seed", type=int, default=1, help="Same seed and parameters, same dataset")
+    parser.add_argument("--workers", type=int, help="Generator/encryption processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Patients per generated and loaded batch")
+    args = parser.parse_args()
+
+    if app.config["RAFT_GROUPS"] > 1:
+        # Sequential ids and random uuids would land patients outside their partitions
+        parser.error("seeding needs RAFT_GROUPS=1: with more groups, patient ids and uuids are "
+                     "allocated per partition; load data through the /bulk endpoints instead")
+
+    if not args.patients:
+        seed_database()
+        return
+    generate_dataset(args.patients, args.encounters_per_patient, args.observations_per_encounter,
+                     args.prescriptions_per_encounter, args.hospitals, args.doctors, args.years, args.until,
+                     args.seed, args.workers, args.batch_size)
+
+if __name__ == "__main__":
+    main()
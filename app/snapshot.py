@@ -0,0 +1,260 @@
+import os
+import gzip
+import json
+import base64
+import threading
+from datetime import datetime
+from sqlalchemy import select, text, bindparam
+from cache import response_cache
+from database import db, Hospital, UserRole, User, Patient, Encounter, Observation, Prescription, VitalChunk, VitalRollup
+
+# Parents before children, so a snapshot can be loaded with foreign keys enforced
+SNAPSHOT_MODELS = [Hospital, UserRole, User, Patient, Encounter, Observation, Prescription, VitalChunk, VitalRollup]
+# Replicated by Raft group 0 only; every other table is partitioned by patient_id
+SHARED_MODELS = (Hospital, UserRole, User)
+# Surrogate keys each node assigns itself, left out of partition snapshots
+LOCAL_KEY_MODELS = (VitalChunk, VitalRollup)
+
+LOAD_BATCH_ROWS = 1000
+
+
+def _encode_row(row):
+    item = {}
+    for name, value in row.items():
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, bytes):
+            value = base64.b64encode(value).decode()
+        item[name] = value
+    return item
+
+
+def _decode_row(table, item):
+    for column in table.columns:
+        value = item.get(column.name)
+        if isinstance(value, str) and isinstance(column.type, db.DateTime):
+            item[column.name] = datetime.fromisoformat(value)
+        elif isinstance(value, str) and isinstance(column.type, db.LargeBinary):
+            item[column.name] = base64.b64decode(value)
+    return item
+
+
+class SnapshotStore:
+    """Point-in-time dumps of the EHR tables used for log compaction.
+
+    A snapshot is a gzipped NDJSON file: a header line with the last included
+    Raft index/term followed by one line per row. It is written and loaded a
+    line at a time and shipped to followers in fixed-size chunks, so neither
+    side ever holds a whole snapshot in memory.
+
+    With several Raft groups, each group's store covers only its partition:
+    the rows whose patient_id % groups == group, plus the shared tables for
+    group 0. Loading it replaces just those rows and leaves the other
+    groups' data alone.
+    """
+
+    def __init__(self, app, directory, chunk_bytes=1024 * 1024, group=0, groups=1):
+        self.app = app
+        self.directory = directory
+        self.chunk_bytes = chunk_bytes
+        self.group = group
+        self.groups = groups
+        # Guards swapping in and pruning snapshot files: an install may finish during a dump
+        self.files_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def models(self):
+        if self.groups == 1:
+            return SNAPSHOT_MODELS
+        return [m for m in SNAPSHOT_MODELS if m not in SHARED_MODELS or self.group == 0]
+
+    def _scope(self, model):
+        """WHERE clause limiting `model` to this group's rows, or None for the whole table."""
+        if self.groups == 1 or model in SHARED_MODELS:
+            return None
+        return model.__table__.c.patient_id % self.groups == self.group
+
+    def _select(self, model):
+        table = model.__table__
+        columns = table.columns
+        if self.groups > 1 and model in LOCAL_KEY_MODELS:
+            columns = [c for c in columns if not c.primary_key]
+        query = select(*columns)
+        scope = self._scope(model)
+        return query if scope is None else query.where(scope)
+
+    def path(self, index, term):
+        return os.path.join(self.directory, f"snapshot-{term}-{index}.ndjson.gz")
+
+    def latest(self):
+        """Return (index, term, path) of the newest complete snapshot, or None."""
+        best = None
+        for name in os.listdir(self.directory):
+            if name.startswith("snapshot-") and name.endswith(".ndjson.gz"):
+                term, index = name[len("snapshot-"):-len(".ndjson.gz")].split("-")
+                if best is None or int(index) > best[0]:
+                    best = (int(index), int(term), os.path.join(self.directory, name))
+        return best
+
+    def _prune(self, keep):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path != keep and name.startswith("snapshot-") and not name.endswith(".partial"):
+                os.remove(path)
+
+    def create(self, lock, position):
+        """Dump this store's rows as of the applied state; return (index, term, path) or None.
+
+        `position()` returns the (index, term) the database has applied
+        through, or None to skip the snapshot. It is called under `lock`,
+        which keeps the applier out, and the dump's read transaction is
+        opened before the lock is released: the rows are then streamed from
+        that view while new entries apply. (SQLite without WAL still makes a
+        commit wait for the read to finish.)
+        """
+        with self.app.app_context():
+            options = {}
+            if db.engine.dialect.name == "postgresql":
+                # One consistent view across all tables for the whole dump
+                options["isolation_level"] = "REPEATABLE READ"
+            connection = db.session.connection(execution_options=options)
+            with lock:
+                current = position()
+                if current is None:
+                    db.session.rollback()
+                    return None
+                if db.engine.dialect.name == "sqlite":
+                    # pysqlite only emits BEGIN before a write, so each SELECT would
+                    # otherwise see its own commit point; one read transaction pins them all
+                    connection.exec_driver_sql("BEGIN")
+                # The view is fixed by the transaction's first read, not by BEGIN
+                first = self.models()[0].__table__
+                connection.execute(select(*first.primary_key.columns).limit(1)).first()
+            index, term = current
+            path = self.path(index, term)
+            tmp = path + ".tmp"
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                f.write(json.dumps({"last_included_index": index, "last_included_term": term}) + "\n")
+                for model in self.models():
+                    table = model.__table__
+                    result = connection.execute(self._select(model).execution_options(yield_per=LOAD_BATCH_ROWS))
+                    for row in result.mappings():
+                        f.write(json.dumps({"t": table.name, "r": _encode_row(row)}, default=str) + "\n")
+            db.session.rollback()
+        with self.files_lock:
+            latest = self.latest()
+            if latest is not None and latest[0] >= index:
+                # A leader's snapshot was installed while we were dumping
+                os.remove(tmp)
+                return None
+            os.replace(tmp, path)
+            self._prune(keep=path)
+        return index, term, path
+
+    def read_chunks(self, path):
+        """Yield (offset, base64 data, done) for the snapshot file."""
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            offset = 0
+            while True:
+                data = f.read(self.chunk_bytes)
+                done = offset + len(data) >= size
+                yield offset, base64.b64encode(data).decode(), done
+                offset += len(data)
+                if done:
+                    return
+
+    def write_chunk(self, index, term, offset, data):
+        """Append one received chunk to the partial snapshot file."""
+        tmp = self.path(index, term) + ".partial"
+        mode = "r+b" if offset and os.path.exists(tmp) else "wb"
+        with open(tmp, mode) as f:
+            f.seek(offset)
+            f.write(base64.b64decode(data))
+            f.truncate()
+        return tmp
+
+    def finish_install(self, index, term):
+        path = self.path(index, term)
+        with self.files_lock:
+            os.replace(path + ".partial", path)
+            self._prune(keep=path)
+        self.load(path)
+        return path
+
+    def _write(self, table, rows, kept):
+        if table.name in kept:
+            self._upsert(table, rows, kept[table.name])
+        else:
+            db.session.execute(table.insert(), rows)
+
+    def _upsert(self, table, rows, kept):
+        """Update shared rows in place: other groups' records may reference them."""
+        pk = list(table.primary_key.columns)[0]
+        existing = {k for (k,) in db.session.execute(select(pk).where(pk.in_([r[pk.name] for r in rows])))}
+        updates = [dict(r, _pk=r[pk.name]) for r in rows if r[pk.name] in existing]
+        if updates:
+            db.session.execute(table.update().where(pk == bindparam("_pk")), updates)
+        inserts = [r for r in rows if r[pk.name] not in existing]
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        kept.update(r[pk.name] for r in rows)
+
+    def _unreferenced(self, table):
+        """Conditions excluding rows of `table` that a foreign key still points at.
+
+        Another group's records may reference a shared row the snapshot no
+        longer has; deleting it would break a RESTRICT key and fail the install.
+        """
+        conditions = []
+        for model in SNAPSHOT_MODELS:
+            for fk in model.__table__.foreign_keys:
+                if fk.column.table is table:
+                    conditions.append(~select(fk.parent).where(fk.parent == fk.column).exists())
+        return conditions
+
+    def load(self, path):
+        """Replace this store's share of the EHR tables with the contents of a snapshot file."""
+        models = self.models()
+        tables = {model.__table__.name: model.__table__ for model in models}
+        # Shared tables of a partitioned cluster are upserted; rows missing from the snapshot go afterwards
+        kept = {m.__table__.name: set() for m in models if self.groups > 1 and m in SHARED_MODELS}
+        with self.app.app_context():
+            for model in reversed(models):
+                if model.__table__.name not in kept:
+                    scope = self._scope(model)
+                    delete = model.__table__.delete()
+                    db.session.execute(delete if scope is None else delete.where(scope))
+
+            batch, batch_table = [], None
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                f.readline()  # header
+                for line in f:
+                    item = json.loads(line)
+                    table = tables[item["t"]]
+                    if batch and table is not batch_table:
+                        self._write(batch_table, batch, kept)
+                        batch = []
+                    batch_table = table
+                    batch.append(_decode_row(table, item["r"]))
+                    if len(batch) >= LOAD_BATCH_ROWS:
+                        self._write(batch_table, batch, kept)
+                        batch = []
+            if batch:
+                self._write(batch_table, batch, kept)
+            for model in reversed(models):
+                table = model.__table__
+                if table.name in kept:
+                    pk = list(table.primary_key.columns)[0]
+                    db.session.execute(table.delete().where(pk.notin_(kept[table.name]), *self._unreferenced(table)))
+
+            if db.session.connection().dialect.name == "postgresql":
+                # Explicit primary keys were inserted; move the sequences past them
+                for table in tables.values():
+                    pk = list(table.primary_key.columns)[0].name
+                    db.session.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', '{pk}'), "
+                        f"COALESCE((SELECT MAX({pk}) FROM \"{table.name}\"), 0) + 1, false)"
+                    ))
+            db.session.commit()
+        response_cache.clear()
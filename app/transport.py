@@ -0,0 +1,144 @@
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def required_acks(mode, peer_count):
+    """Translate an ack mode ("1", "majority", "all" or a number) into peer acks.
+
+    The sender counts as one replica, so "majority" needs floor(N/2) peer acks
+    for a cluster of N = peer_count + 1 nodes.
+    """
+    mode = str(mode).lower()
+    if mode == "all":
+        return peer_count
+    if mode == "majority":
+        return (peer_count + 1) // 2
+    return min(int(mode), peer_count)
+
+
+class BroadcastResult:
+    """Collects per-peer outcomes of one fan-out and wakes the caller at quorum."""
+
+    def __init__(self, peer_names, required):
+        self.required = required
+        self.pending = set(peer_names)
+        self.peers = {}
+        self.acked = 0
+        self.started = time.monotonic()
+        self.cond = threading.Condition()
+
+    def record(self, name, outcome):
+        with self.cond:
+            self.pending.discard(name)
+            self.peers[name] = outcome
+            if outcome["ok"]:
+                self.acked += 1
+            self.cond.notify_all()
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while self.acked < self.required and self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            return self.snapshot()
+
+    def snapshot(self):
+        return {
+            "acked": self.acked,
+            "required": self.required,
+            "quorum": self.acked >= self.required,
+            "elapsed_ms": round((time.monotonic() - self.started) * 1000, 2),
+            "peers": dict(self.peers),
+            "pending": sorted(self.pending)
+        }
+
+
+class Transport:
+    """Peer RPC interface used by RaftNode.
+
+    Subclasses implement `post(name, url, path, payload, headers, timeout)`,
+    returning an outcome dict ({"ok", "status", "body" or "error",
+    "latency_ms"}) and never raising. Fan-out is shared.
+    """
+
+    def __init__(self, max_workers=32):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="peer-io")
+
+    def post(self, name, url, path, payload, headers=None, timeout=1.0):
+        raise NotImplementedError
+
+    def fan_out(self, peers, send, timeout=1.0, acks="majority"):
+        """Run `send(name, url) -> outcome` for every peer concurrently.
+
+        Returns as soon as `acks` peers have answered successfully (or all have
+        answered, or `timeout` expires). Slower peers keep running in the
+        background so their connections stay warm; their outcomes are simply
+        not waited for.
+        """
+        result = BroadcastResult(peers.keys(), required_acks(acks, len(peers)))
+
+        def run(name, url):
+            try:
+                outcome = send(name, url)
+            except Exception as e:
+                outcome = {"ok": False, "status": None, "error": str(e), "latency_ms": None}
+            result.record(name, outcome)
+
+        for name, url in peers.items():
+            self.pool.submit(run, name, url)
+        return result.wait(timeout)
+
+    def broadcast(self, peers, path, payload, headers=None, timeout=1.0, acks="majority"):
+        """POST the same `payload` to every peer; see `fan_out`."""
+        return self.fan_out(
+            peers, lambda name, url: self.post(name, url, path, payload, headers, timeout),
+            timeout=timeout, acks=acks
+        )
+
+
+class HttpTransport(Transport):
+    """Persistent per-peer HTTP sessions plus a shared pool for concurrent fan-out."""
+
+    def __init__(self, max_workers=32, connections_per_peer=8):
+        super().__init__(max_workers)
+        self.connections_per_peer = connections_per_peer
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, name):
+        s = self.sessions.get(name)
+        if s is None:
+            with self.lock:
+                s = self.sessions.get(name)
+                if s is None:
+                    s = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.connections_per_peer)
+                    s.mount("http://", adapter)
+                    s.mount("https://", adapter)
+                    self.sessions[name] = s
+        return s
+
+    def post(self, name, url, path, payload, headers=None, timeout=1.0):
+        """POST to one peer and return an outcome dict; never raises."""
+        start = time.monotonic()
+        try:
+            resp = self.session(name).post(f"{url.rstrip('/')}{path}", json=payload, headers=headers, timeout=timeout)
+            ok = resp.ok
+            outcome = {"ok": ok, "status": resp.status_code}
+            if ok:
+                outcome["body"] = resp.json()
+            else:
+                outcome["error"] = resp.text[:200]
+        except Exception as e:
+            outcome = {"ok": False, "status": None, "error": str(e)}
+        outcome["latency_ms"] = round((time.monotonic() - start) * 1000, 2)
+        return outcome
+
+
+transport = HttpTransport()
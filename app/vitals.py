@@ -0,0 +1,205 @@
+from datetime import datetime, timezone
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from database import db, Patient, Observation, VitalChunk, VitalRollup
+
+# Rollup resolutions and their bucket width in seconds (UTC-aligned)
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+DAY = RESOLUTIONS["day"]
+
+
+def series_type(name):
+    """Normalize an observation type into a series key ("Heart  Rate" -> "heart rate")."""
+    return " ".join(name.casefold().split()) if name else None
+
+
+def to_epoch(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def from_epoch(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def reading(patient_id, type_, recorded_at, value):
+    """Return (patient_id, series type, epoch seconds, float), or None if not numeric."""
+    if patient_id is None or not type_ or recorded_at is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not np.isfinite(number):
+        return None
+    return patient_id, series_type(type_), to_epoch(recorded_at), number
+
+
+def bucket_starts(timestamps, width):
+    return (timestamps // width).astype(np.int64) * width
+
+
+def rollup(timestamps, values, width):
+    """Vectorized min/max/sum/count per `width`-second bucket of a time-sorted series."""
+    buckets = bucket_starts(timestamps, width)
+    starts, first = np.unique(buckets, return_index=True)
+    counts = np.diff(np.append(first, len(buckets)))
+    return (starts, counts, np.minimum.reduceat(values, first),
+            np.maximum.reduceat(values, first), np.add.reduceat(values, first))
+
+
+def series_rows(readings):
+    """Chunk and rollup rows for `reading()` tuples of series that have no stored data yet.
+
+    For bulk loads that insert observations without the ORM (and so bypass
+    `track_observations`). Returns (chunk rows, rollup rows) as column dicts.
+    """
+    days = {}
+    for patient_id, type_, ts, value in readings:
+        days.setdefault((patient_id, type_, int(ts // DAY) * DAY), []).append((ts, value))
+    chunks, rollups = [], []
+    for (patient_id, type_, day), points in days.items():
+        points.sort()
+        timestamps = np.array([ts for ts, _ in points], dtype=np.float64)
+        values = np.array([v for _, v in points], dtype=np.float64)
+        chunks.append({"patient_id": patient_id, "type": type_, "day_start": day, "count": len(points),
+                       "timestamps": timestamps.tobytes(), "values": values.tobytes()})
+        for resolution, width in RESOLUTIONS.items():
+            for start, count, low, high, total in zip(*(a.tolist() for a in rollup(timestamps, values, width))):
+                rollups.append({"patient_id": patient_id, "type": type_, "resolution": resolution,
+                                "bucket_start": start, "count": count, "min": low, "max": high, "sum": total})
+    return chunks, rollups
+
+
+def _apply_day(session, patient_id, type_, day, added, removed):
+    """Fold readings added to/removed from one day into its chunk and rollups.
+
+    Only the minute/hour/day buckets that contain a changed reading are
+    recomputed, from that day's chunk, so the cost of a write is bounded by
+    one day of readings no matter how long the series is.
+    """
+    chunk = session.query(VitalChunk).filter_by(patient_id=patient_id, type=type_, day_start=day).first()
+    if chunk is None:
+        chunk = VitalChunk(patient_id=patient_id, type=type_, day_start=day, count=0, timestamps=b"", values=b"")
+        session.add(chunk)
+    timestamps = np.frombuffer(chunk.timestamps, dtype=np.float64)
+    values = np.frombuffer(chunk.values, dtype=np.float64)
+
+    for ts, value in removed:
+        match = np.flatnonzero((timestamps == ts) & (values == value))
+        if len(match):
+            timestamps = np.delete(timestamps, match[0])
+            values = np.delete(values, match[0])
+    if added:
+        timestamps = np.concatenate([timestamps, np.array([ts for ts, _ in added], dtype=np.float64)])
+        values = np.concatenate([values, np.array([v for _, v in added], dtype=np.float64)])
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, values = timestamps[order], values[order]
+
+    if len(timestamps):
+        chunk.timestamps = timestamps.tobytes()
+        chunk.values = values.tobytes()
+        chunk.count = len(timestamps)
+    elif chunk in session.new:
+        session.expunge(chunk)
+    else:
+        session.delete(chunk)
+
+    touched = np.array([ts for ts, _ in added + removed], dtype=np.float64)
+    for resolution, width in RESOLUTIONS.items():
+        affected = np.unique(bucket_starts(touched, width))
+        mask = np.isin(bucket_starts(timestamps, width), affected)
+        existing = {r.bucket_start: r for r in session.query(VitalRollup).filter(
+            VitalRollup.patient_id == patient_id,
+            VitalRollup.type == type_,
+            VitalRollup.resolution == resolution,
+            VitalRollup.bucket_start.in_(affected.tolist())
+        )}
+        if mask.any():
+            for start, count, low, high, total in zip(*(a.tolist() for a in rollup(timestamps[mask], values[mask], width))):
+                row = existing.pop(start, None)
+                if row is None:
+                    row = VitalRollup(patient_id=patient_id, type=type_, resolution=resolution, bucket_start=start)
+                    session.add(row)
+                row.count, row.min, row.max, row.sum = count, low, high, total
+        for row in existing.values():
+            # Every reading in this bucket was removed
+            session.delete(row)
+
+
+def _committed(obj, attr):
+    """Value of `attr` as last loaded from the database (before pending changes)."""
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(obj, attr)
+
+
+@event.listens_for(Session, "before_flush")
+def track_observations(session, flush_context, instances):
+    """Keep vital chunks and rollups in step with every Observation write.
+
+    Hooked into the flush so endpoint writes, replicated applies and ORM
+    cascades (deleting an encounter) all maintain the series the same way.
+    """
+    changes = {}
+
+    def record(item, bucket):
+        if item is not None and item[0] not in deleted_patients:
+            patient_id, type_, ts, value = item
+            key = (patient_id, type_, int(ts // DAY) * DAY)
+            changes.setdefault(key, ([], []))[bucket].append((ts, value))
+
+    deleted_patients = {p.patient_id for p in session.deleted if isinstance(p, Patient)}
+    for obj in session.new:
+        if isinstance(obj, Observation):
+            if obj.recorded_at is None:
+                # The column's server default is only filled in by the INSERT, after this hook
+                obj.recorded_at = datetime.now(timezone.utc)
+            record(reading(obj.patient_id, obj.type, obj.recorded_at, obj.value), 0)
+    for obj in session.dirty:
+        if isinstance(obj, Observation) and session.is_modified(obj):
+            old = reading(*(_committed(obj, a) for a in ("patient_id", "type", "recorded_at", "value")))
+            new = reading(obj.patient_id, obj.type, obj.recorded_at, obj.value)
+            if old != new:
+                record(old, 1)
+                record(new, 0)
+    for obj in session.deleted:
+        if isinstance(obj, Observation):
+            record(reading(*(_committed(obj, a) for a in ("patient_id", "type", "recorded_at", "value"))), 1)
+
+    if changes:
+        with session.no_autoflush:
+            for (patient_id, type_, day), (added, removed) in changes.items():
+                _apply_day(session, patient_id, type_, day, added, removed)
+
+
+def query_rollups(patient_id, type_, resolution, start=None, end=None, limit=None):
+    """Read a series' rollups in [start, end] (datetimes) as NumPy columns.
+
+    Returns (bucket_starts, counts, mins, maxs, means); raw readings are
+    never touched.
+    """
+    width = RESOLUTIONS[resolution]
+    query = db.session.query(
+        VitalRollup.bucket_start, VitalRollup.count, VitalRollup.min, VitalRollup.max, VitalRollup.sum
+    ).filter(
+        VitalRollup.patient_id == patient_id,
+        VitalRollup.type == series_type(type_),
+        VitalRollup.resolution == resolution
+    )
+    if start is not None:
+        query = query.filter(VitalRollup.bucket_start >= int(to_epoch(start) // width) * width)
+    if end is not None:
+        query = query.filter(VitalRollup.bucket_start <= to_epoch(end))
+    query = query.order_by(VitalRollup.bucket_start)
+    if limit is not None:
+        query = query.limit(limit)
+
+    table = np.array(query.all(), dtype=np.float64).reshape(-1, 5)
+    counts = table[:, 1]
+    return table[:, 0].astype(np.int64), counts.astype(np.int64), table[:, 2], table[:, 3], table[:, 4] / np.maximum(counts, 1)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for patient PII decryption
+- Compares the per-field decrypt path against Encryptor.decrypt_many
+- Reports rows/sec for a range of worker pool sizes
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from encryption import Encryptor
+
+NUM_ROWS = 5000  # Synthetic patient rows per run
+WORKER_COUNTS = [1, 2, 4, 8]
+KEY = "benchmark-encryption-key"
+
+def make_rows(encryptor):
+    rows = []
+    for i in range(NUM_ROWS):
+        rows.append((
+            encryptor.encrypt(f"Patient Number {i}"),
+            encryptor.encrypt("1985-03-15"),
+            encryptor.encrypt(f"555-{i:04d}") if i % 3 else None,
+            encryptor.encrypt(f"{i} Oak Ave, New York, NY 10002") if i % 2 else None,
+        ))
+    return rows
+
+def per_field(encryptor, rows):
+    return [[encryptor.decrypt(c) if c else None for c in row] for row in rows]
+
+def batched(encryptor, rows):
+    flat = encryptor.decrypt_many([c for row in rows for c in row])
+    return [flat[i:i + 4] for i in range(0, len(flat), 4)]
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def run_benchmark():
+    rows = make_rows(Encryptor(KEY))
+    print(f"\n--- Decrypt Benchmark ({NUM_ROWS} rows, {os.cpu_count()} CPUs) ---")
+
+    baseline, elapsed = timed(per_field, Encryptor(KEY), rows)
+    print(f"per-field decrypt:         {NUM_ROWS / elapsed:10.0f} rows/sec")
+
+    for workers in WORKER_COUNTS:
+        encryptor = Encryptor(KEY, workers=workers)
+        batched(encryptor, rows[:100])  # warm the pool
+        result, elapsed = timed(batched, encryptor, rows)
+        assert result == baseline, "decrypt_many returned different plaintext"
+        print(f"decrypt_many workers={workers:<3}: {NUM_ROWS / elapsed:10.0f} rows/sec")
+
+if __name__ == "__main__":
+    run_benchmark()
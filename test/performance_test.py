@@ -1,76 +1,402 @@
 #!/usr/bin/env python3
 """
-Performance test for EHR API
-- Sends multiple concurrent requests
-- Measures response times
+Load generator for the EHR cluster
+- Open-loop: requests are sent on a fixed schedule (constant rate or a linear
+  ramp) whether or not earlier ones have returned, so a slow server cannot
+  slow the load down and hide its own latency
+- Latency is measured from each request's scheduled send time (coordinated-
+  omission corrected); service time from the actual send is reported too
+- Weighted scenario mixes of reads, creates, updates, deletes and writes sent
+  to a follower (forwarded to the leader), spread across every node
+- Writes JSON results; `compare` flags regressions between two result files
+
+Usage:
+    python performance_test.py run --nodes http://localhost:5001,http://localhost:5002,http://localhost:5003 \\
+        --mode constant --rate 100 --duration 30 --scenario mixed --output baseline.json
+    python performance_test.py run --mode ramp --rate 20 --ramp-to 300 --duration 60
+    python performance_test.py run --mix read_patient=8,create_patient=1,forwarded_create=1
+    python performance_test.py compare baseline.json candidate.json --threshold 10
 """
 
-import requests
+import argparse
+import itertools
+import json
+import random
+import sys
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-BASE_URL = "http://localhost:5001"  # API URL
-
-# define endpoints to test
-TEST_ENDPOINTS = [
-    {"method": "GET", "path": "/patients"},
-    {"method": "GET", "path": "/users"},
-    {"method": "POST", "path": "/patients", "json": {
-        "full_name": "Performance Test",
-        "date_of_birth": "2000-01-01",
-        "gender": "Male",
-        "phone": "555-0000",
-        "address": "123 Test St"
-    }},
-]
-
-NUM_REQUESTS = 500  # Number of requests to send
-NUM_THREADS = 10   # Number of concurrent threads
-
-def send_request(endpoint):
-    method = endpoint["method"]
-    url = BASE_URL + endpoint["path"]
-    json_data = endpoint.get("json")
-    
-    start = time.time()
-    try:
-        if method == "GET":
-            r = requests.get(url)
-        elif method == "POST":
-            r = requests.post(url, json=json_data)
-        elif method == "PUT":
-            r = requests.put(url, json=json_data)
-        elif method == "DELETE":
-            r = requests.delete(url)
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+DEFAULT_NODES = "http://localhost:5001,http://localhost:5002,http://localhost:5003"
+PERCENTILES = (50, 95, 99, 99.9)
+
+# Scenario name -> {operation: weight}
+SCENARIOS = {
+    "read-heavy": {"read_patient": 40, "list_patients": 20, "list_hospitals": 15, "search_patient": 10,
+                   "timeline": 5, "create_patient": 5, "update_patient": 3, "forwarded_create": 2},
+    "mixed": {"read_patient": 25, "list_patients": 10, "list_hospitals": 5, "search_patient": 5, "timeline": 5,
+              "create_patient": 20, "update_patient": 10, "delete_patient": 5, "forwarded_create": 10,
+              "forwarded_update": 5},
+    "write-heavy": {"read_patient": 10, "create_patient": 40, "update_patient": 20, "delete_patient": 10,
+                    "forwarded_create": 15, "forwarded_update": 5},
+}
+
+
+class Cluster:
+    """Node discovery plus the ids the operations pick from."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.leader = None
+        self.followers = []
+        self.lock = threading.Lock()
+        # Node-local patient ids per node, for reads
+        self.patient_ids = {}
+        # Leader-local ids of patients created during the run, for updates and deletes
+        self.created = []
+        self.counter = itertools.count()
+
+    def discover(self):
+        leader = None
+        for node in self.nodes:
+            try:
+                if requests.get(f"{node}/cluster/leader", timeout=2).json().get("is_leader"):
+                    leader = node
+            except requests.RequestException:
+                print(f"Node {node} unreachable")
+        if leader is None:
+            sys.exit("No leader found among the target nodes")
+        self.leader = leader
+        self.followers = [n for n in self.nodes if n != leader]
+        for node in self.nodes:
+            try:
+                items = requests.get(f"{node}/patients?limit=1000&fields=patient_id", timeout=5).json()["items"]
+                self.patient_ids[node] = [p["patient_id"] for p in items]
+            except (requests.RequestException, ValueError, KeyError):
+                self.patient_ids[node] = []
+
+    def any_node(self):
+        return random.choice(self.nodes)
+
+    def follower(self):
+        return random.choice(self.followers) if self.followers else self.leader
+
+    def known_patient(self, node):
+        ids = self.patient_ids.get(node)
+        return random.choice(ids) if ids else None
+
+    def remember(self, patient_id):
+        with self.lock:
+            self.created.append(patient_id)
+
+    def created_patient(self, remove=False):
+        with self.lock:
+            if not self.created:
+                return None
+            i = random.randrange(len(self.created))
+            if remove:
+                self.created[i], self.created[-1] = self.created[-1], self.created[i]
+                return self.created.pop()
+            return self.created[i]
+
+
+def new_patient(cluster):
+    n = next(cluster.counter)
+    return {
+        "full_name": f"Load Test {n}",
+        "date_of_birth": "1980-01-01",
+        "gender": random.choice(["Female", "Male"]),
+        "phone": f"555-{n % 10000:04d}",
+        "address": f"{n} Benchmark Ave"
+    }
+
+
+# Each operation returns (method, url, json body or None, on_success callback or None)
+
+def op_read_patient(cluster):
+    node = cluster.any_node()
+    patient_id = cluster.known_patient(node)
+    if patient_id is None:
+        return "GET", f"{node}/patients?limit=1", None, None
+    return "GET", f"{node}/patients/{patient_id}", None, None
+
+def op_list_patients(cluster):
+    return "GET", f"{cluster.any_node()}/patients?limit=50", None, None
+
+def op_list_hospitals(cluster):
+    return "GET", f"{cluster.any_node()}/hospitals", None, None
+
+def op_search_patient(cluster):
+    return "GET", f"{cluster.any_node()}/patients/search?phone=555-{random.randrange(10000):04d}", None, None
+
+def op_timeline(cluster):
+    node = cluster.any_node()
+    patient_id = cluster.known_patient(node) or 1
+    return "GET", f"{node}/patients/{patient_id}/timeline?limit=20", None, None
+
+def _create(cluster, node):
+    def created(resp):
+        # Forwarded creates answer with the leader's response, so the id is leader-local either way
+        patient_id = resp.json().get("patient_id")
+        if patient_id is not None:
+            cluster.remember(patient_id)
+    return "POST", f"{node}/patients", new_patient(cluster), created
+
+def op_create_patient(cluster):
+    return _create(cluster, cluster.leader)
+
+def op_forwarded_create(cluster):
+    return _create(cluster, cluster.follower())
+
+def _update(cluster, node):
+    patient_id = cluster.created_patient()
+    if patient_id is None:
+        return _create(cluster, node)
+    return "PUT", f"{node}/patients/{patient_id}", {"phone": f"555-{random.randrange(10000):04d}"}, None
+
+def op_update_patient(cluster):
+    return _update(cluster, cluster.leader)
+
+def op_forwarded_update(cluster):
+    # Forwarded writes keep the leader-local id: the follower proxies the path unchanged
+    return _update(cluster, cluster.follower())
+
+def op_delete_patient(cluster):
+    patient_id = cluster.created_patient(remove=True)
+    if patient_id is None:
+        return _create(cluster, cluster.leader)
+    return "DELETE", f"{cluster.leader}/patients/{patient_id}", None, None
+
+OPERATIONS = {name[3:]: fn for name, fn in globals().items() if name.startswith("op_")}
+
+
+def schedule(mode, rate, ramp_to, duration, warmup=0):
+    """Yield the send offset (seconds from start) of every request.
+
+    The first `warmup` seconds run at `rate`; a ramp starts after them, so
+    the measured window covers exactly `rate` -> `ramp_to`.
+    """
+    if mode == "constant":
+        count = int(rate * (duration + warmup))
+        for i in range(count):
+            yield i / rate
+        return
+    warmup_count = int(rate * warmup)
+    for i in range(warmup_count):
+        yield i / rate
+    # Linear ramp from `rate` to `ramp_to`: N(t) = r0*t + (r1-r0)*t^2/(2D); solve N(t) = i for t
+    r0, r1 = float(rate), float(ramp_to)
+    slope = (r1 - r0) / duration
+    total = int(r0 * duration + slope * duration ** 2 / 2)
+    for i in range(total):
+        if slope == 0:
+            yield warmup + i / r0
         else:
-            return None
-        elapsed = time.time() - start
-        return {"status": r.status_code, "time": elapsed, "url": url}
-    except Exception as e:
-        elapsed = time.time() - start
-        return {"status": "ERROR", "time": elapsed, "url": url, "error": str(e)}
-
-def run_performance_test():
-    results = []
-    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-        futures = [executor.submit(send_request, TEST_ENDPOINTS[i % len(TEST_ENDPOINTS)])
-                   for i in range(NUM_REQUESTS)]
-        for future in as_completed(futures):
-            results.append(future.result())
-    
-    # Print stats
-    total_time = sum(r["time"] for r in results if r["status"] != "ERROR")
-    avg_time = total_time / len([r for r in results if r["status"] != "ERROR"])
-    success_count = len([r for r in results if r["status"] in (200, 201)])
-    error_count = len([r for r in results if r["status"] == "ERROR"])
-
-    print(f"\n--- Performance Test Summary ---")
-    print(f"Total requests: {NUM_REQUESTS}")
-    print(f"Successful responses: {success_count}")
-    print(f"Errors: {error_count}")
-    print(f"Average response time: {avg_time:.3f} sec")
-    print(f"Max response time: {max(r['time'] for r in results):.3f} sec")
-    print(f"Min response time: {min(r['time'] for r in results):.3f} sec")
+            yield warmup + (-r0 + (r0 * r0 + 2 * slope * i) ** 0.5) / slope
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(s["latency"] for s in samples)
+    service = sorted(s["service"] for s in samples)
+    statuses = {}
+    for s in samples:
+        statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+    ok = sum(1 for s in samples if isinstance(s["status"], int) and 200 <= s["status"] < 300)
+    return {
+        "requests": len(samples),
+        "ok": ok,
+        "errors": len(samples) - ok,
+        "error_rate": round((len(samples) - ok) / len(samples), 4) if samples else 0,
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0,
+        "statuses": statuses,
+        "latency_ms": {f"p{p:g}": _ms(percentile(latencies, p)) for p in PERCENTILES} | {
+            "mean": _ms(sum(latencies) / len(latencies)) if latencies else None,
+            "max": _ms(latencies[-1]) if latencies else None
+        },
+        "service_ms": {f"p{p:g}": _ms(percentile(service, p)) for p in PERCENTILES},
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def run(args):
+    nodes = [n.rstrip("/") for n in args.nodes.split(",") if n]
+    weights = parse_mix(args.mix) if args.mix else SCENARIOS[args.scenario]
+    cluster = Cluster(nodes)
+    cluster.discover()
+    print(f"Leader: {cluster.leader}; followers: {', '.join(cluster.followers) or 'none'}")
+
+    names = list(weights)
+    cumulative = list(itertools.accumulate(weights[n] for n in names))
+    local = threading.local()
+    samples = []
+    samples_lock = threading.Lock()
+
+    def execute(op_name, intended):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, url, body, on_success = OPERATIONS[op_name](cluster)
+        sent = time.monotonic()
+        try:
+            resp = session.request(method, url, json=body, timeout=args.timeout)
+            status = resp.status_code
+            if on_success and 200 <= status < 300:
+                on_success(resp)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        done = time.monotonic()
+        sample = {"op": op_name, "status": status, "latency": done - intended, "service": done - sent}
+        if intended - start >= args.warmup:
+            with samples_lock:
+                samples.append(sample)
+
+    random.seed(args.seed)
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    start = time.monotonic()
+    late = 0
+    for offset in schedule(args.mode, args.rate, args.ramp_to or args.rate, args.duration, args.warmup):
+        intended = start + offset
+        delay = intended - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -0.01:
+            late += 1
+        op_name = random.choices(names, cum_weights=cumulative)[0]
+        pool.submit(execute, op_name, intended)
+    pool.shutdown(wait=True)
+    elapsed = time.monotonic() - start - args.warmup
+
+    by_op = {}
+    for s in samples:
+        by_op.setdefault(s["op"], []).append(s)
+    result = {
+        "config": {
+            "nodes": nodes, "leader": cluster.leader, "mode": args.mode, "rate": args.rate,
+            "ramp_to": args.ramp_to, "duration": args.duration, "warmup": args.warmup,
+            "concurrency": args.concurrency, "mix": weights, "seed": args.seed
+        },
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "elapsed_s": round(elapsed, 2),
+        # Sends the dispatcher itself issued >10ms late (client-side overload)
+        "late_dispatches": late,
+        "overall": summarize(samples, elapsed),
+        "operations": {op: summarize(s, elapsed) for op, s in sorted(by_op.items())}
+    }
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+def parse_mix(text):
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            sys.exit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def print_report(result):
+    cfg = result["config"]
+    rate = f"{cfg['rate']}" + (f"->{cfg['ramp_to']}" if cfg["mode"] == "ramp" else "")
+    print(f"\n--- Load Test ({cfg['mode']}, {rate} req/s, {cfg['duration']}s, {len(cfg['nodes'])} nodes) ---")
+    header = f"{'operation':<18}{'reqs':>7}{'err%':>7}{'rps':>8}" + "".join(f"{'p' + format(p, 'g'):>10}" for p in PERCENTILES)
+    print(header + "   (latency ms, from scheduled send)")
+    rows = list(result["operations"].items()) + [("ALL", result["overall"])]
+    for name, s in rows:
+        pcts = "".join(f"{_fmt(s['latency_ms'][f'p{p:g}']):>10}" for p in PERCENTILES)
+        print(f"{name:<18}{s['requests']:>7}{s['error_rate'] * 100:>7.1f}{s['throughput_rps']:>8.1f}{pcts}")
+    if result["late_dispatches"]:
+        print(f"Warning: {result['late_dispatches']} requests were dispatched late; the client may be the bottleneck")
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        cand = json.load(f)
+    threshold = args.threshold / 100
+    regressions = []
+
+    print(f"\n--- Compare ({args.baseline} -> {args.candidate}, threshold {args.threshold:g}%) ---")
+    differing = [k for k in ("mode", "rate", "ramp_to", "duration", "mix") if base["config"].get(k) != cand["config"].get(k)]
+    if differing:
+        print(f"Warning: runs used different settings ({', '.join(differing)}); results may not be comparable")
+    print(f"{'operation':<18}{'metric':<12}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    names = ["overall"] + sorted(set(base["operations"]) & set(cand["operations"]))
+    for name in names:
+        b = base["overall"] if name == "overall" else base["operations"][name]
+        c = cand["overall"] if name == "overall" else cand["operations"][name]
+        checks = [(f"p{p:g}", b["latency_ms"][f"p{p:g}"], c["latency_ms"][f"p{p:g}"], True) for p in PERCENTILES]
+        if name == "overall":
+            # Per-operation throughput just follows the mix; only the total is comparable
+            checks.append(("rps", b["throughput_rps"], c["throughput_rps"], False))
+        for metric, old, new, lower_is_better in checks:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if lower_is_better else change < -threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"{name:<18}{metric:<12}{old:>12.2f}{new:>12.2f}{change * 100:>9.1f}%{flag}")
+            if worse:
+                regressions.append((name, metric))
+        if c["error_rate"] > b["error_rate"] + threshold / 10:
+            print(f"{name:<18}{'error_rate':<12}{b['error_rate']:>12.4f}{c['error_rate']:>12.4f}{'':>10}  REGRESSION")
+            regressions.append((name, "error_rate"))
+
+    print(f"\n{len(regressions)} regression(s)" if regressions else "\nNo regressions")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EHR cluster load generator")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="Generate load and report latency percentiles")
+    r.add_argument("--nodes", default=DEFAULT_NODES, help="Comma-separated node base URLs")
+    r.add_argument("--mode", choices=("constant", "ramp"), default="constant")
+    r.add_argument("--rate", type=float, default=50, help="Requests/sec (start rate in ramp mode)")
+    r.add_argument("--ramp-to", type=float, help="Final requests/sec in ramp mode")
+    r.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    r.add_argument("--warmup", type=float, default=0, help="Seconds of load at --rate before measuring (and before a ramp starts)")
+    r.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    r.add_argument("--mix", help="Custom weights, e.g. read_patient=8,create_patient=2 (overrides --scenario)")
+    r.add_argument("--concurrency", type=int, default=256, help="Max requests in flight")
+    r.add_argument("--timeout", type=float, default=10)
+    r.add_argument("--seed", type=int, default=1)
+    r.add_argument("--output", help="Write JSON results to this file")
+
+    c = sub.add_parser("compare", help="Flag regressions between two result files")
+    c.add_argument("baseline")
+    c.add_argument("candidate")
+    c.add_argument("--threshold", type=float, default=10, help="Allowed change in percent")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        if args.mode == "ramp" and not args.ramp_to:
+            parser.error("--ramp-to is required in ramp mode")
+        run(args)
+    else:
+        sys.exit(compare(args))
+
 
 if __name__ == "__main__":
-    run_performance_test()
\ No newline at end of file
+    main()
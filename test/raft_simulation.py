@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+In-process Raft cluster simulation
+- Runs N RaftNode instances in one process, wired together by a simulated
+  network (latency, jitter, random loss, partitions, isolated nodes) instead
+  of HTTP or the RPC port, so consensus behaviour can be measured on a laptop
+- Drives a constant write rate through the current leader while injecting
+  faults, then heals the network and checks the logs converged
+- Reports time-to-elect, commit latency percentiles, failed and lost writes,
+  leader churn and Raft safety violations; `--output` writes JSON and
+  `--check` exits non-zero if a safety property was violated
+
+Timing settings (heartbeat, election timeout, group commit, pipeline) come
+from config.py, so environment overrides apply here as they do in a node.
+
+Usage:
+    python raft_simulation.py --scenario failover --nodes 5 --duration 30 --output failover.json
+    python raft_simulation.py --scenario partition --latency 2 --jitter 0.5 --check
+    python raft_simulation.py --scenario lossy --loss 0.1
+    python raft_simulation.py --scenario elect --trials 50
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from cluster import RaftNode
+from config import Config
+from raftlog import MemoryLog
+from transport import Transport
+
+PERCENTILES = (50, 95, 99, 99.9)
+MONITOR_INTERVAL = 0.002  # Leader sampling period
+SETTLE_TIMEOUT = 10.0     # Max wait for convergence after the final heal
+
+# Scenario defaults; explicit command line flags win
+SCENARIOS = {
+    "steady": {},
+    "failover": {"fault": "isolate"},
+    "partition": {"fault": "partition"},
+    "lossy": {"loss": 0.05, "latency": 2.0, "jitter": 0.5},
+    "elect": {},
+}
+
+HANDLERS = {
+    "/raft/request_vote": "handle_request_vote",
+    "/raft/append_entries": "handle_append_entries",
+    "/raft/install_snapshot": "handle_install_snapshot",
+    "/raft/read_index": "handle_read_index",
+}
+
+
+class SimulatedNetwork:
+    """Delivers RPCs between in-process nodes, with injectable faults.
+
+    Each leg of a call is delayed by `latency` seconds (± `jitter` as a
+    fraction of it) and lost with probability `loss`. A lost message, or one
+    crossing a cut link or touching an isolated node, costs the sender its
+    full timeout, as a dropped packet would. Payloads are JSON round-tripped
+    so nodes never share mutable state.
+    """
+
+    def __init__(self, latency=0.001, jitter=0.0, loss=0.0, seed=None):
+        self.nodes = {}
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.cut = set()
+        self.isolated = set()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.dropped = 0
+
+    def endpoint(self, name):
+        return SimulatedTransport(self, name)
+
+    def reachable(self, a, b):
+        return a not in self.isolated and b not in self.isolated and frozenset((a, b)) not in self.cut
+
+    def partition(self, *groups):
+        """Cut every link between nodes of different groups."""
+        for g1, g2 in itertools.combinations(groups, 2):
+            for a in g1:
+                for b in g2:
+                    self.cut.add(frozenset((a, b)))
+
+    def isolate(self, name):
+        self.isolated.add(name)
+
+    def heal(self):
+        self.cut.clear()
+        self.isolated.clear()
+
+    def delay(self):
+        if not self.jitter:
+            return self.latency
+        return max(self.latency * (1 + self.random.uniform(-self.jitter, self.jitter)), 0)
+
+    def count(self, delivered):
+        with self.lock:
+            if delivered:
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+
+class SimulatedTransport(Transport):
+    """One node's view of the SimulatedNetwork; a drop-in for HttpTransport."""
+
+    def __init__(self, network, name):
+        super().__init__(max_workers=16)
+        self.network = network
+        self.name = name
+
+    def post(self, name, url, path, payload, headers=None, timeout=1.0):
+        start = time.monotonic()
+        outcome = self.call(name, path, payload, timeout, start)
+        outcome["latency_ms"] = round((time.monotonic() - start) * 1000, 2)
+        return outcome
+
+    def call(self, dest, path, payload, timeout, start):
+        net = self.network
+        if net.closed:
+            return {"ok": False, "status": None, "error": "Network closed"}
+        if not self.leg(dest, timeout, start):
+            return {"ok": False, "status": None, "error": "Timed out"}
+        try:
+            body = getattr(net.nodes[dest], HANDLERS[path])(json.loads(json.dumps(payload)))
+        except Exception as e:
+            return {"ok": False, "status": 500, "error": str(e)[:200]}
+        if not self.leg(dest, timeout, start):
+            return {"ok": False, "status": None, "error": "Timed out"}
+        return {"ok": True, "status": 200, "body": json.loads(json.dumps(body))}
+
+    def leg(self, dest, timeout, start):
+        """Carry one message to or from `dest`; False (after the timeout) if it never arrives."""
+        net = self.network
+        remaining = timeout - (time.monotonic() - start)
+        delay = net.delay()
+        if not net.reachable(self.name, dest) or net.random.random() < net.loss or delay >= remaining:
+            net.count(False)
+            time.sleep(max(remaining, 0))
+            return False
+        time.sleep(delay)
+        net.count(True)
+        return True
+
+
+class Simulation:
+    """N nodes on one SimulatedNetwork, plus the client load and the observers."""
+
+    def __init__(self, args, seed=None):
+        self.args = args
+        self.network = SimulatedNetwork(args.latency / 1000, args.jitter, args.loss, seed)
+        self.names = [f"node{i + 1}" for i in range(args.nodes)]
+        self.nodes = {}
+        for name in self.names:
+            node = RaftNode()
+            node.init_node(
+                node_id=name,
+                node_url=f"sim://{name}",
+                peer_list=[f"{p}=sim://{p}" for p in self.names if p != name],
+                log=MemoryLog(),
+                apply_commands=lambda commands: None,
+                group_commit_window=Config.GROUP_COMMIT_WINDOW_MS / 1000,
+                group_commit_max=Config.GROUP_COMMIT_MAX_BATCH,
+                replication_acks=Config.REPLICATION_ACKS,
+                replication_timeout=Config.REPLICATION_TIMEOUT,
+                heartbeat_interval=Config.HEARTBEAT_INTERVAL,
+                election_timeout_range=tuple(ms / 1000 for ms in Config.ELECTION_TIMEOUT_RANGE),
+                lease_ratio=Config.LEASE_RATIO,
+                max_inflight=Config.APPEND_MAX_INFLIGHT,
+                max_batch_bytes=Config.APPEND_MAX_BATCH_BYTES,
+                transport=self.network.endpoint(name)
+            )
+            self.nodes[name] = node
+            self.network.nodes[name] = node
+
+        self.started = None
+        self.running = False
+        # Observed leadership: term -> leaders seen in it, and the sequence of changes
+        self.leaders_by_term = {}
+        self.leader = None
+        self.changes = []
+        # Pending fault: (injected at, deposed leader, its term); cleared once a successor is seen
+        self.awaiting = None
+        self.elect_ms = []
+        self.first_leader_ms = None
+        # Client writes: id -> {"status", "term", "index"}
+        self.writes = {}
+        self.commit_ms = []
+        self.ids = itertools.count(1)
+        self.client_leader = None
+
+    # Observers
+
+    def start(self):
+        self.started = time.monotonic()
+        self.running = True
+        threading.Thread(target=self.monitor, name="sim-monitor", daemon=True).start()
+        for node in self.nodes.values():
+            node.start_election_timer()
+
+    def claims(self):
+        """[(term, name)] of nodes currently in the LEADER state, read under each node's lock."""
+        result = []
+        for name, node in self.nodes.items():
+            with node.lock:
+                if node.state == "LEADER":
+                    result.append((node.current_term, name))
+        return result
+
+    def monitor(self):
+        while self.running:
+            claims = self.claims()
+            now = time.monotonic()
+            for term, name in claims:
+                self.leaders_by_term.setdefault(term, set()).add(name)
+            if claims:
+                leader = max(claims)
+                if leader != self.leader:
+                    expected = False
+                    if self.first_leader_ms is None:
+                        self.first_leader_ms = (now - self.started) * 1000
+                        expected = True
+                    elif self.awaiting and leader[1] != self.awaiting[1] and leader[0] > self.awaiting[2]:
+                        self.elect_ms.append((now - self.awaiting[0]) * 1000)
+                        self.awaiting = None
+                        expected = True
+                    self.changes.append({"at_ms": round((now - self.started) * 1000, 1), "term": leader[0],
+                                         "leader": leader[1], "after_fault": expected})
+                    self.leader = leader
+            time.sleep(MONITOR_INTERVAL)
+
+    def wait_for_leader(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.leader is None and time.monotonic() < deadline:
+            time.sleep(MONITOR_INTERVAL)
+        return self.leader
+
+    # Faults
+
+    def inject(self, kind):
+        leader = self.leader
+        if leader is None:
+            return None
+        term, name = leader
+        self.awaiting = (time.monotonic(), name, term)
+        if kind == "isolate":
+            self.network.isolate(name)
+            return f"isolated {name}"
+        minority = [name] + [n for n in self.names if n != name][:(len(self.names) - 1) // 2 - 1]
+        majority = [n for n in self.names if n not in minority]
+        self.network.partition(minority, majority)
+        return f"partitioned {minority} | {majority}"
+
+    # Client load
+
+    def find_leader(self):
+        """The reachable node claiming leadership in the highest term, as a client would discover it."""
+        claims = [(t, n) for t, n in self.claims() if n not in self.network.isolated]
+        return max(claims)[1] if claims else None
+
+    def write(self, write_id):
+        # Like a client (or forwarder), keep using the known leader until a write to it fails
+        name = self.client_leader
+        if name is None or name in self.network.isolated:
+            name = self.client_leader = self.find_leader()
+        if name is None:
+            self.writes[write_id] = {"status": "no_leader"}
+            return
+        start = time.monotonic()
+        result = self.nodes[name].propose({"type": "SIM", "action": "WRITE", "id": write_id})
+        elapsed = (time.monotonic() - start) * 1000
+        if result.get("committed"):
+            self.commit_ms.append(elapsed)
+            self.writes[write_id] = {"status": "committed", "term": result["term"], "index": result["index"]}
+        else:
+            self.writes[write_id] = {"status": "failed", "error": result.get("error") or "Not committed"}
+            self.client_leader = None
+
+    def run_load(self, duration, rate, fault=None, fault_interval=5.0, fault_duration=2.0):
+        """Open-loop writes at `rate`/s for `duration` seconds, injecting `fault` periodically."""
+        pool = ThreadPoolExecutor(max_workers=64)
+        begin = time.monotonic()
+        next_fault = begin + fault_interval
+        heal_at = None
+        faults = []
+        for i in itertools.count():
+            scheduled = begin + i / rate
+            if scheduled - begin >= duration:
+                break
+            now = time.monotonic()
+            if fault and heal_at is None and now >= next_fault:
+                description = self.inject(fault)
+                if description:
+                    faults.append({"at_ms": round((now - self.started) * 1000, 1), "fault": description})
+                    heal_at = now + fault_duration
+                next_fault = now + fault_interval
+            if heal_at is not None and now >= heal_at:
+                self.network.heal()
+                heal_at = None
+            if scheduled > now:
+                time.sleep(scheduled - now)
+            pool.submit(self.write, next(self.ids))
+        pool.shutdown(wait=True)
+        self.network.heal()
+        return faults
+
+    # Verification
+
+    def settle(self, timeout=SETTLE_TIMEOUT):
+        """Wait for one leader whose committed log every node has applied."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            claims = self.claims()
+            if len(claims) == 1:
+                leader = self.nodes[claims[0][1]]
+                if all(n.last_applied >= leader.log.last_index and n.log.last_index == leader.log.last_index
+                       for n in self.nodes.values()):
+                    return claims[0][1]
+            time.sleep(0.05)
+        return None
+
+    def verify(self, leader_name):
+        """Check election safety, durability of acknowledged writes and log matching."""
+        violations = []
+        for term, leaders in sorted(self.leaders_by_term.items()):
+            if len(leaders) > 1:
+                violations.append(f"Term {term} had {len(leaders)} leaders: {sorted(leaders)}")
+        if leader_name is None:
+            violations.append("Cluster did not converge after the network healed")
+            return violations, None
+
+        leader = self.nodes[leader_name]
+        reference = [(e["term"], e["command"].get("id")) for e in leader.log.entries_from(1)]
+        surviving = {write_id for _, write_id in reference}
+        lost = [i for i, w in self.writes.items() if w["status"] == "committed" and i not in surviving]
+        if lost:
+            violations.append(f"{len(lost)} committed writes missing from the final log (e.g. {lost[:5]})")
+        for name, node in self.nodes.items():
+            committed = [(e["term"], e["command"].get("id")) for e in node.log.entries_from(1, node.commit_index)]
+            if committed != reference[:len(committed)]:
+                violations.append(f"{name}'s committed log diverges from the leader's")
+        return violations, surviving
+
+    def stop(self):
+        """Quiesce every node's background threads so later trials run undisturbed."""
+        self.running = False
+        self.network.closed = True
+        for node in self.nodes.values():
+            with node.lock:
+                node.state = "FOLLOWER"
+                node.election_timeout_range = (1e9, 1e9)
+            node.stop_election_timer()
+            for channel in node.channels.values():
+                channel.wake.set()
+
+    def leader_stats(self):
+        return {
+            "leader_changes": max(len(self.changes) - 1, 0),
+            "unexpected_leader_changes": sum(1 for c in self.changes if not c["after_fault"]),
+            "elections_started": sum(n.elections_started for n in self.nodes.values()),
+            "terms": max((n.current_term for n in self.nodes.values()), default=0)
+        }
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def distribution(values):
+    values = sorted(values)
+    stats = {"count": len(values)}
+    stats.update({f"p{p:g}": _round(percentile(values, p)) for p in PERCENTILES})
+    stats["max"] = _round(values[-1]) if values else None
+    return stats
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def run_scenario(args):
+    sim = Simulation(args, args.seed)
+    sim.start()
+    if sim.wait_for_leader(SETTLE_TIMEOUT) is None:
+        sim.stop()
+        sys.exit("No leader elected; check the election timeout settings")
+    faults = sim.run_load(args.duration, args.rate, args.fault, args.fault_interval, args.fault_duration)
+    leader = sim.settle()
+    violations, surviving = sim.verify(leader)
+    sim.stop()
+
+    statuses = {}
+    for w in sim.writes.values():
+        statuses[w["status"]] = statuses.get(w["status"], 0) + 1
+    unacked = [i for i, w in sim.writes.items() if w["status"] != "committed"]
+    return {
+        "first_election_ms": _round(sim.first_leader_ms),
+        "time_to_elect_ms": distribution(sim.elect_ms),
+        "commit_latency_ms": distribution(sim.commit_ms),
+        "writes": {
+            "sent": len(sim.writes),
+            "committed": statuses.get("committed", 0),
+            "failed": statuses.get("failed", 0),
+            "no_leader": statuses.get("no_leader", 0),
+            "lost": sum(1 for i, w in sim.writes.items() if w["status"] == "committed" and i not in (surviving or ())),
+            # Unacknowledged writes that made it into the log anyway (safe: the client must retry idempotently)
+            "unacked_survived": sum(1 for i in unacked if i in (surviving or ()))
+        },
+        **sim.leader_stats(),
+        "faults": faults,
+        "leader_history": sim.changes,
+        "network": {"delivered": sim.network.delivered, "dropped": sim.network.dropped},
+        "violations": violations
+    }
+
+
+def run_elections(args):
+    """Repeated cold-start elections, each followed by one failover of the new leader."""
+    first, failover, violations, rounds = [], [], [], []
+    for trial in range(args.trials):
+        sim = Simulation(args, None if args.seed is None else args.seed + trial)
+        sim.start()
+        leader = sim.wait_for_leader(SETTLE_TIMEOUT)
+        if leader:
+            first.append(sim.first_leader_ms)
+            sim.inject(args.fault or "isolate")
+            deadline = time.monotonic() + SETTLE_TIMEOUT
+            while sim.awaiting and time.monotonic() < deadline:
+                time.sleep(MONITOR_INTERVAL)
+            failover.extend(sim.elect_ms)
+        else:
+            violations.append(f"Trial {trial}: no leader elected")
+        for term, leaders in sim.leaders_by_term.items():
+            if len(leaders) > 1:
+                violations.append(f"Trial {trial}: term {term} had leaders {sorted(leaders)}")
+        rounds.append(sim.leader_stats()["elections_started"])
+        sim.stop()
+    return {
+        "trials": args.trials,
+        "first_election_ms": distribution(first),
+        "time_to_elect_ms": distribution(failover),
+        "elections_started_per_trial": round(sum(rounds) / len(rounds), 2) if rounds else None,
+        "violations": violations
+    }
+
+
+def print_report(result):
+    cfg = result["config"]
+    print(f"\n--- Raft Simulation ({cfg['scenario']}, {cfg['nodes']} nodes, latency {cfg['latency']}ms "
+          f"±{cfg['jitter'] * 100:g}%, loss {cfg['loss'] * 100:g}%) ---")
+
+    def line(label, dist):
+        pcts = "  ".join(f"p{p:g} {_fmt(dist[f'p{p:g}'])}" for p in PERCENTILES)
+        print(f"{label:<24}n={dist['count']:<6} {pcts}  max {_fmt(dist['max'])}")
+
+    if cfg["scenario"] == "elect":
+        line("First election (ms)", result["first_election_ms"])
+        line("Failover election (ms)", result["time_to_elect_ms"])
+        print(f"{'Election rounds/trial':<24}{result['elections_started_per_trial']}")
+    else:
+        writes = result["writes"]
+        print(f"{'First election (ms)':<24}{_fmt(result['first_election_ms'])}")
+        line("Time to elect (ms)", result["time_to_elect_ms"])
+        line("Commit latency (ms)", result["commit_latency_ms"])
+        print(f"{'Writes':<24}{writes['sent']} sent, {writes['committed']} committed, {writes['failed']} failed, "
+              f"{writes['no_leader']} without a leader, {writes['lost']} lost "
+              f"({writes['unacked_survived']} unacknowledged survived)")
+        print(f"{'Leader changes':<24}{result['leader_changes']} "
+              f"({result['unexpected_leader_changes']} not caused by an injected fault), "
+              f"{result['elections_started']} elections started, final term {result['terms']}")
+        print(f"{'Faults injected':<24}{len(result['faults'])}")
+    if result["violations"]:
+        print("SAFETY VIOLATIONS:")
+        for v in result["violations"]:
+            print(f"  - {v}")
+    else:
+        print(f"{'Safety':<24}OK")
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process Raft cluster simulation")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="failover")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of write load")
+    parser.add_argument("--rate", type=float, default=100, help="Client writes per second")
+    parser.add_argument("--latency", type=float, help="One-way network latency in ms (default 1)")
+    parser.add_argument("--jitter", type=float, help="Latency jitter as a fraction, e.g. 0.5 = ±50%% (default 0)")
+    parser.add_argument("--loss", type=float, help="Message loss probability (default 0)")
+    parser.add_argument("--fault", choices=("isolate", "partition"), help="Fault to inject periodically")
+    parser.add_argument("--fault-interval", type=float, default=5, help="Seconds between faults")
+    parser.add_argument("--fault-duration", type=float, default=2, help="Seconds each fault lasts")
+    parser.add_argument("--trials", type=int, default=20, help="Elections to run in the elect scenario")
+    parser.add_argument("--seed", type=int, help="Seed for the network's randomness")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on a safety violation")
+    parser.add_argument("--verbose", action="store_true", help="Show the nodes' own log output")
+    args = parser.parse_args()
+
+    defaults = {"latency": 1.0, "jitter": 0.0, "loss": 0.0, "fault": None}
+    for key, value in dict(defaults, **SCENARIOS[args.scenario]).items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+    if args.nodes < 1 or args.rate <= 0:
+        parser.error("--nodes and --rate must be positive")
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+        result = run_elections(args) if args.scenario == "elect" else run_scenario(args)
+    result = {"config": {k: v for k, v in vars(args).items() if k not in ("output", "check", "verbose")}, **result}
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.check and result["violations"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
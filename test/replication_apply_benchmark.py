@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for follower apply throughput of replicated patient writes
+- Compares the previous plaintext payload (follower re-encrypts every field)
+  against the ciphertext payload (follower stores the leader's columns as-is)
+- Applies log entries through app.apply_commands in group-commit sized batches
+  against a throwaway SQLite database
+"""
+
+import os
+import sys
+import time
+import uuid
+import tempfile
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "apply_benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from app import app, db, apply_commands, set_patient_fields, patient_columns, patient_rows
+from database import Patient
+
+NUM_PATIENTS = 2000  # Patient CREATE entries per run
+BATCH_SIZE = 256     # Entries per apply, as delivered by group commit
+BULK_ROWS = 1000     # Rows per BULK_CREATE entry
+REPEATS = 3          # Best-of runs per mode
+
+def make_patients():
+    return [{
+        "full_name": f"Patient Number {i}",
+        "date_of_birth": "1985-03-15",
+        "gender": "Female" if i % 2 else "Male",
+        "phone": f"555-{i:04d}",
+        "address": f"{i} Oak Ave, New York, NY 10002"
+    } for i in range(NUM_PATIENTS)]
+
+def plaintext_commands(patients):
+    return [{"type": "PATIENT", "action": "CREATE", "uuid": str(uuid.uuid4()), "data": data} for data in patients]
+
+def ciphertext_commands(patients):
+    commands = []
+    with app.app_context():
+        for data in patients:
+            patient = Patient(uuid=str(uuid.uuid4()))
+            set_patient_fields(patient, data)
+            commands.append({"type": "PATIENT", "action": "CREATE", "uuid": patient.uuid,
+                             "data": patient_columns(patient, data)})
+    return commands
+
+def bulk_commands(patients, encrypted):
+    items = [dict(data, uuid=str(uuid.uuid4())) for data in patients]
+    commands = []
+    with app.app_context():
+        for i in range(0, len(items), BULK_ROWS):
+            chunk = items[i:i + BULK_ROWS]
+            payload = {"rows": patient_rows(chunk)} if encrypted else {"items": chunk}
+            commands.append({"type": "PATIENT", "action": "BULK_CREATE", "uuid": None, "data": payload})
+    return commands
+
+def reset_db():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+def timed_apply(commands, batch_size):
+    reset_db()
+    start = time.perf_counter()
+    for i in range(0, len(commands), batch_size):
+        apply_commands(commands[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        assert Patient.query.count() == NUM_PATIENTS, "not every patient was applied"
+    return elapsed
+
+def run_benchmark():
+    patients = make_patients()
+    print(f"\n--- Follower Apply Benchmark ({NUM_PATIENTS} patients, SQLite) ---")
+
+    runs = [
+        ("CREATE, plaintext payload (before)", plaintext_commands(patients), BATCH_SIZE),
+        ("CREATE, ciphertext payload (after)", ciphertext_commands(patients), BATCH_SIZE),
+        ("BULK_CREATE, plaintext items (before)", bulk_commands(patients, False), 1),
+        ("BULK_CREATE, ciphertext rows (after)", bulk_commands(patients, True), 1),
+    ]
+    for label, commands, batch_size in runs:
+        elapsed = min(timed_apply(commands, batch_size) for _ in range(REPEATS))
+        print(f"{label:<40} {NUM_PATIENTS / elapsed:10.0f} patients/sec")
+
+if __name__ == "__main__":
+    run_benchmark()
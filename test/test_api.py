@@ -8,6 +8,13 @@ import json
 
 BASE_URL = "http://localhost:5001"
 
+def body(response):
+    """JSON body, or the status reason for routes this node does not serve (404/405 pages)."""
+    try:
+        return response.json()
+    except ValueError:
+        return response.reason
+
 def test_health():
     print("\n=== Testing Health Check ===")
     response = requests.get(f"{BASE_URL}/health")
@@ -18,7 +25,7 @@ def test_hospitals():
     print("\n=== Testing Hospitals ===")
     response = requests.get(f"{BASE_URL}/hospitals")
     print(f"Status: {response.status_code}")
-    hospitals = response.json()
+    hospitals = response.json()["items"]
     print(f"Found {len(hospitals)} hospital(s)")
     if hospitals:
         print(f"First hospital: {hospitals[0]['name']}")
@@ -27,25 +34,40 @@ def test_users():
     print("\n=== Testing Users ===")
     response = requests.get(f"{BASE_URL}/users")
     print(f"Status: {response.status_code}")
-    users = response.json()
+    users = response.json()["items"]
     print(f"Found {len(users)} user(s)")
     for user in users[:3]:
         print(f"  - {user['full_name']} ({user['email']})")
 
+def test_login():
+    print("\n=== Testing Login ===")
+    response = requests.post(f"{BASE_URL}/auth/login", json={
+        "email": "sarah.johnson@hospital.com",
+        "password": "password123"
+    })
+    print(f"Status: {response.status_code}")
+    token = response.json()["token"]
+    response = requests.get(f"{BASE_URL}/auth/session", headers={"Authorization": f"Bearer {token}"})
+    print(f"Session: {response.json()}")
+
 def test_patients():
     print("\n=== Testing Patients (with decryption) ===")
     response = requests.get(f"{BASE_URL}/patients")
     print(f"Status: {response.status_code}")
-    patients = response.json()
+    page = response.json()
+    patients = page["items"]
     print(f"Found {len(patients)} patient(s)")
     for patient in patients[:3]:
         print(f"  - {patient['full_name']} (DOB: {patient['date_of_birth']})")
+    if page["next_cursor"]:
+        r2 = requests.get(f"{BASE_URL}/patients", params={"cursor": page["next_cursor"]})
+        print(f"Next page status: {r2.status_code}, {len(r2.json()['items'])} patient(s)")
 
 def test_encounters():
     print("\n=== Testing Encounters ===")
     response = requests.get(f"{BASE_URL}/encounters")
     print(f"Status: {response.status_code}")
-    encounters = response.json()
+    encounters = response.json()["items"]
     print(f"Found {len(encounters)} encounter(s)")
     for encounter in encounters[:3]:
         print(f"  - Visit Type: {encounter['visit_type']} (Reason: {encounter['visit_reason']})")
@@ -54,7 +76,7 @@ def test_observations():
     print("\n=== Testing Observations ===")
     response = requests.get(f"{BASE_URL}/observations")
     print(f"Status: {response.status_code}")
-    observations = response.json()
+    observations = response.json()["items"]
     print(f"Found {len(observations)} observation(s)")
     for obs in observations[:3]:
         print(f"  - {obs['type']}: {obs['value']} {obs['unit']}")
@@ -63,13 +85,22 @@ def test_prescriptions():
     print("\n=== Testing Prescriptions (with decrypted notes) ===")
     response = requests.get(f"{BASE_URL}/prescriptions")
     print(f"Status: {response.status_code}")
-    prescriptions = response.json()
+    prescriptions = response.json()["items"]
     print(f"Found {len(prescriptions)} prescription(s)")
     for rx in prescriptions[:3]:
         print(f"  - {rx['medication']} ({rx['dosage']}) - {rx['frequency']}")
         if rx['notes']:
             print(f"    Notes: {rx['notes']}")
 
+def test_patient_timeline(patient_id=1):
+    print(f"\n=== Testing Patient Timeline {patient_id} ===")
+    response = requests.get(f"{BASE_URL}/patients/{patient_id}/timeline", params={"from": "2000-01-01"})
+    print(f"Status: {response.status_code}")
+    if response.status_code == 200:
+        for encounter in response.json()["encounters"][:3]:
+            print(f"  - {encounter['visit_date']} {encounter['visit_type']}: "
+                  f"{len(encounter['observations'])} observation(s), {len(encounter['prescriptions'])} prescription(s)")
+
 def test_create_patient():
     print("\n=== Testing Create Patient ===")
     new_patient = {
@@ -111,18 +142,18 @@ def test_cluster_peers():
     print("\n=== Testing Cluster Peers ===")
     # list
     r = requests.get(f"{BASE_URL}/cluster/peers")
-    print(f"List status: {r.status_code}, {r.json()}")
+    print(f"List status: {r.status_code}, {body(r)}")
     # register sample peer
     r2 = requests.post(f"{BASE_URL}/cluster/peers", json={"url": "http://localhost:5003"})
-    print(f"Register status: {r2.status_code}, {r2.json()}")
+    print(f"Register status: {r2.status_code}, {body(r2)}")
 
 
 def test_cluster_leader():
     print("\n=== Testing Cluster Leader ===")
     r = requests.get(f"{BASE_URL}/cluster/leader")
     print(f"Current leader: {r.status_code}, {r.json()}")
-    r2 = requests.post(f"{BASE_URL}/cluster/leader", json={"url": "{BASE_URL}"})
-    print(f"Set leader result: {r2.status_code}, {r2.json()}")
+    r2 = requests.post(f"{BASE_URL}/cluster/leader", json={"url": BASE_URL})
+    print(f"Set leader result: {r2.status_code}, {body(r2)}")
 
 
 def test_request_patient_via_peer(patient_id):
@@ -131,14 +162,15 @@ def test_request_patient_via_peer(patient_id):
     print(f"\n=== Testing Request Patient via Peer {patient_id} ===")
     headers = {"X-Cluster-Auth": "dev-cluster-token"}
     r = requests.get(f"{BASE_URL}/cluster/request_patient/{patient_id}", headers=headers)
-    print(f"Status: {r.status_code}, {r.json()}")
+    print(f"Status: {r.status_code}, {body(r)}")
 
 
 def test_cluster_log():
     print("\n=== Testing Cluster Log ===")
     headers = {"X-Cluster-Auth": "dev-cluster-token"}
     r = requests.get(f"{BASE_URL}/cluster/log", headers=headers)
-    print(f"Log status: {r.status_code}, entries={len(r.json().get('log',[]))}")
+    log = body(r)
+    print(f"Log status: {r.status_code}, entries={len(log.get('log', [])) if isinstance(log, dict) else 0}")
 
 if __name__ == "__main__":
     print("=" * 60)
@@ -149,17 +181,20 @@ if __name__ == "__main__":
         test_health()
         test_hospitals()
         test_users()
+        test_login()
         test_patients()
         test_encounters()
         test_observations()
         test_prescriptions()
+        test_patient_timeline()
 
         # cluster / inter-node tests
         test_cluster_peers()
         test_cluster_leader()
-    # assuming node is itself peer for demo
-    test_request_patient_via_peer(1)
-    test_cluster_log()
+        # assuming node is itself peer for demo
+        test_request_patient_via_peer(1)
+        test_cluster_log()
+
         # Test CRUD operations
         patient_id = test_create_patient()
         test_update_patient(patient_id)